@@ -0,0 +1,44 @@
+# app/api/v1/analytics.py
+
+"""
+Analytics endpoints
+- Farmer sales rollups by day / week / month
+- Served from precomputed sales_rollups rows, not by scanning orders
+"""
+
+from datetime import date
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.core.database import get_session
+from app.core.security import require_farmer
+from app.core.timing import TimedRoute
+from app.models.user import Farmer
+from app.schemas.analytics import SalesBucket
+from app.services.analytics_service import AnalyticsService
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"], route_class=TimedRoute)
+
+
+@router.get("/farmer/sales", response_model=List[SalesBucket])
+async def farmer_sales(
+    period: Literal["day", "week", "month"] = Query("day", description="Bucket size"),
+    date_from: Optional[date] = Query(None, description="First day (inclusive, UTC)"),
+    date_to: Optional[date] = Query(None, description="Last day (inclusive, UTC)"),
+    group_by: Optional[Literal["species", "status"]] = Query(None, description="Split buckets by species or status"),
+    status: Optional[str] = Query(None, description="Only count orders currently in this status"),
+    user=Depends(require_farmer),
+    db: AsyncSession = Depends(get_session)
+):
+    """Revenue and volume for the current farmer, bucketed by period"""
+    stmt = select(Farmer).where(Farmer.user_id == user.id)
+    result = await db.execute(stmt)
+    farmer = result.scalar_one_or_none()
+    
+    if not farmer:
+        raise HTTPException(status_code=400, detail="Farmer profile not found")
+    
+    service = AnalyticsService(db)
+    return await service.farmer_sales(farmer.id, date_from, date_to, period, group_by, status)
@@ -8,17 +8,21 @@ Animal endpoints
 """
 
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
+from app.core.cache import catalog_generation, storefront_generation
+from app.core.concurrency import PreconditionFailed, VersionConflict, etag, parse_if_match, raise_http
 from app.core.database import get_session
 from app.core.security import require_farmer, get_current_user
+from app.core.timing import TimedRoute
 from app.models.animal import Animal
 from app.models.user import User, Farmer
-from app.schemas.animal import AnimalCreate, AnimalUpdate, AnimalRead
+from app.schemas.animal import AnimalCreate, AnimalUpdate, AnimalRead, FarmerAnimalRead
+from app.services.animal_service import AnimalService
 
-router = APIRouter(prefix="/animals", tags=["Animals"])
+router = APIRouter(prefix="/animals", tags=["Animals"], route_class=TimedRoute)
 
 
 def get_user_id(user) -> int:
@@ -61,11 +65,12 @@ async def list_animals(
 
 
 @router.get("/{animal_id}", response_model=AnimalRead)
-async def get_animal(animal_id: int, db: AsyncSession = Depends(get_session)):
+async def get_animal(animal_id: int, response: Response, db: AsyncSession = Depends(get_session)):
     """Get a single animal by ID (public endpoint)"""
     animal = await db.get(Animal, animal_id)
     if not animal:
         raise HTTPException(status_code=404, detail="Animal not found")
+    response.headers["ETag"] = etag(animal.version)
     return animal
 
 
@@ -93,11 +98,14 @@ async def create_animal(
         age=payload.age,
         gender=payload.gender,
         price=payload.price,
-        available=payload.available if payload.available is not None else True,
+        available=(payload.available if payload.available is not None else True) and payload.stock > 0,
+        stock=payload.stock,
         farmer_id=farmer.id
     )
     db.add(animal)
     await db.commit()
+    catalog_generation.bump()
+    storefront_generation.bump(farmer.id)
     await db.refresh(animal)
     return animal
 
@@ -106,10 +114,12 @@ async def create_animal(
 async def update_animal(
     animal_id: int,
     payload: AnimalUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     user=Depends(require_farmer),
     db: AsyncSession = Depends(get_session)
 ):
-    """Update an animal (farmer only, must own the animal)"""
+    """Update an animal (farmer only, must own the animal; honours If-Match with the animal version)"""
     user_id = get_user_id(user)
     
     # Get farmer profile
@@ -127,14 +137,17 @@ async def update_animal(
     if animal.farmer_id != farmer.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this animal")
     
-    # Update only provided fields
+    # Update only provided fields, compare-and-swap on the version
     update_data = payload.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(animal, key, value)
+    try:
+        animal = await AnimalService(db).update(animal, update_data, parse_if_match(if_match))
+    except (VersionConflict, PreconditionFailed) as e:
+        raise_http(e)
+    if animal is None:
+        # Deleted since it was read
+        raise HTTPException(status_code=404, detail="Animal not found")
     
-    db.add(animal)
-    await db.commit()
-    await db.refresh(animal)
+    response.headers["ETag"] = etag(animal.version)
     return animal
 
 
@@ -164,9 +177,11 @@ async def delete_animal(
     
     await db.delete(animal)
     await db.commit()
+    catalog_generation.bump()
+    storefront_generation.bump(farmer.id)
 
 
-@router.get("/farmer/my-animals", response_model=List[AnimalRead])
+@router.get("/farmer/my-animals", response_model=List[FarmerAnimalRead])
 async def list_my_animals(
     user=Depends(require_farmer),
     db: AsyncSession = Depends(get_session)
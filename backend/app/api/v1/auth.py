@@ -9,7 +9,8 @@ Authentication endpoints.
 
 import logging
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -17,28 +18,34 @@ from sqlalchemy import select
 from app.core.database import get_session
 from app.core.config import settings
 from app.core.security import verify_password, hash_password, create_access_token, create_refresh_token, decode_token
+from app.core.timing import TimedRoute
 from app.models.user import User, Farmer
 from app.schemas.user import UserCreate, UserRead
 from app.schemas.auth import Token, RefreshTokenRequest
+from app.services.cart_service import CartService
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=TimedRoute)
 
 
 @router.post("/register", response_model=UserRead, status_code=status.HTTP_201_CREATED)
 async def register(payload: UserCreate, db: AsyncSession = Depends(get_session)):
     """Register a new user"""
-    logger.info(f"Registration attempt for email: {payload.email}")
+    logger.info("Registration attempt for email: %s", payload.email)
     
     # Check if email already exists
     stmt = select(User).where(User.email == payload.email)
     result = await db.execute(stmt)
     existing = result.scalar_one_or_none()
     if existing:
-        logger.warning(f"Registration failed - email already exists: {payload.email}")
+        logger.warning("Registration failed - email already exists: %s", payload.email)
         raise HTTPException(status_code=400, detail="Email already registered")
     
+    # Admin accounts are provisioned out of band, never self-registered
+    if payload.role == "admin":
+        raise HTTPException(status_code=403, detail="Cannot register as admin")
+    
     # Create user
     user = User(
         name=payload.name,
@@ -50,7 +57,7 @@ async def register(payload: UserCreate, db: AsyncSession = Depends(get_session))
     await db.commit()
     await db.refresh(user)
     
-    logger.info(f"User registered successfully: {user.id} - {user.email}")
+    logger.info("User registered successfully: %s - %s", user.id, user.email)
     
     # If registering as farmer, create farmer profile
     if payload.role == "farmer":
@@ -62,16 +69,20 @@ async def register(payload: UserCreate, db: AsyncSession = Depends(get_session))
 
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_session)):
-    """Login and get access/refresh tokens"""
-    logger.info(f"Login attempt for username: {form_data.username}")
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    cart_session: Optional[str] = Header(None, alias="X-Cart-Session"),
+    db: AsyncSession = Depends(get_session)
+):
+    """Login and get access/refresh tokens (merges any guest cart into the buyer's cart)"""
+    logger.info("Login attempt for username: %s", form_data.username)
     
     stmt = select(User).where(User.email == form_data.username)
     result = await db.execute(stmt)
     user = result.scalar_one_or_none()
     
     if not user:
-        logger.warning(f"Login failed - user not found: {form_data.username}")
+        logger.warning("Login failed - user not found: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -80,10 +91,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     
     # Verify password
     password_valid = verify_password(form_data.password, user.password_hash)
-    logger.info(f"Password verification result for {form_data.username}: {password_valid}")
+    logger.debug("Password verification result for %s: %s", form_data.username, password_valid)
     
     if not password_valid or not user:
-        logger.warning(f"Login failed - invalid password for: {form_data.username}")
+        logger.warning("Login failed - invalid password for: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -91,7 +102,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
         )
     
     if not user.is_active:
-        logger.warning(f"Login failed - inactive user: {form_data.username}")
+        logger.warning("Login failed - inactive user: %s", form_data.username)
         raise HTTPException(status_code=400, detail="User account is disabled")
     
     access_token = create_access_token(
@@ -102,7 +113,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
         {"sub": str(user.id), "roles": [user.role]}
     )
     
-    logger.info(f"Login successful for user: {user.id} - {user.email}")
+    logger.info("Login successful for user: %s - %s", user.id, user.email)
+
+    if cart_session and user.role in ("user", "buyer"):
+        await CartService(db).merge_guest_cart(cart_session, user.id)
 
     return {
         "access_token": access_token,
@@ -3,139 +3,124 @@
 """
 Shopping cart endpoints
 - Add / update / delete / list cart items
+- Works for signed-in buyers and anonymous guests (X-Cart-Session header)
 """
 
-from typing import List, Any
-from fastapi import APIRouter, Depends, HTTPException, status
+import secrets
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from app.core.database import get_session
-from app.core.security import require_buyer
-from app.models.cart import CartItem as CartItemModel
-from app.models.animal import Animal as AnimalModel
-from app.schemas.cart import CartItemCreate, CartItemUpdate, CartItemRead
-
-router = APIRouter(prefix="/cart", tags=["Cart"])
-
-
-def _get_user_id(user: Any) -> int:
-    if user is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    uid = getattr(user, "id", None)
-    if uid:
-        return int(uid)
-    if isinstance(user, dict):
-        sub = user.get("sub")
-        if sub is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-        try:
-            return int(sub)
-        except Exception:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user id in token")
-    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unable to determine user id")
+from app.core.security import get_optional_user
+from app.core.timing import TimedRoute
+from app.schemas.cart import CartItemCreate, CartItemUpdate, CartItemRead, CartBatchRequest, CartSummary
+from app.services.cart_service import CartService
+from app.services.cart_store import user_key, guest_key
+
+router = APIRouter(prefix="/cart", tags=["Cart"], route_class=TimedRoute)
+
+CART_SESSION_HEADER = "X-Cart-Session"
+
+
+def get_cart_owner(
+    response: Response,
+    user=Depends(get_optional_user),
+    cart_session: Optional[str] = Header(None, alias=CART_SESSION_HEADER),
+) -> str:
+    """
+    Resolve the cart owner key.
+    Buyers are keyed by user id; anonymous callers by their cart session,
+    which is issued on first use and echoed back in the X-Cart-Session header.
+    """
+    if user is not None:
+        if getattr(user, "role", None) not in ("user", "buyer"):
+            raise HTTPException(status_code=403, detail="Buyer only operation")
+        return user_key(int(user.id))
+
+    if not cart_session:
+        cart_session = secrets.token_urlsafe(16)
+    elif len(cart_session) > 64:
+        raise HTTPException(status_code=400, detail="Invalid cart session")
+    response.headers[CART_SESSION_HEADER] = cart_session
+    return guest_key(cart_session)
 
 
 @router.get("/", response_model=List[CartItemRead])
-async def list_cart(user=Depends(require_buyer), db: AsyncSession = Depends(get_session)):
-    """List all items in the current user's cart"""
-    buyer_id = _get_user_id(user)
-    stmt = select(CartItemModel).where(CartItemModel.buyer_id == buyer_id)
-    result = await db.execute(stmt)
-    items = result.scalars().all()
+async def list_cart(owner: str = Depends(get_cart_owner), db: AsyncSession = Depends(get_session)):
+    """List all items in the current cart"""
+    items = await CartService(db).list_cart(owner)
     return [CartItemRead.model_validate(i) for i in items]
 
 
+@router.get("/summary", response_model=CartSummary)
+async def cart_summary(owner: str = Depends(get_cart_owner), db: AsyncSession = Depends(get_session)):
+    """Cart totals at current prices, flagging price changes and unavailable animals"""
+    return await CartService(db).get_summary(owner)
+
+
 @router.post("/", response_model=CartItemRead, status_code=status.HTTP_201_CREATED)
-async def add_to_cart(payload: CartItemCreate, user=Depends(require_buyer), db: AsyncSession = Depends(get_session)):
+async def add_to_cart(payload: CartItemCreate, owner: str = Depends(get_cart_owner), db: AsyncSession = Depends(get_session)):
     """Add an item to the cart"""
-    buyer_id = _get_user_id(user)
-    
-    # Check if animal exists and is available
-    stmt = select(AnimalModel).where(AnimalModel.id == payload.animal_id)
-    result = await db.execute(stmt)
-    animal = result.scalar_one_or_none()
-    if not animal:
-        raise HTTPException(status_code=404, detail="Animal not found")
-    if not animal.available:
-        raise HTTPException(status_code=400, detail="Animal not available")
-
-    # Check if item already in cart
-    stmt = select(CartItemModel).where(
-        (CartItemModel.buyer_id == buyer_id) & (CartItemModel.animal_id == payload.animal_id)
-    )
-    result = await db.execute(stmt)
-    existing = result.scalar_one_or_none()
-    
-    if existing:
-        existing.quantity += payload.quantity
-        existing.price = float(animal.price)
-        db.add(existing)
-        await db.commit()
-        await db.refresh(existing)
-        return CartItemRead.model_validate(existing)
-
-    cart_item = CartItemModel(
-        buyer_id=buyer_id,
-        animal_id=payload.animal_id,
-        quantity=payload.quantity,
-        price=float(animal.price),
-    )
-    db.add(cart_item)
-    await db.commit()
-    await db.refresh(cart_item)
+    try:
+        cart_item = await CartService(db).add_item(owner, payload.animal_id, payload.quantity)
+    except ValueError as e:
+        code = 404 if str(e) == "Animal not found" else 400
+        raise HTTPException(status_code=code, detail=str(e))
     return CartItemRead.model_validate(cart_item)
 
 
+@router.post("/batch", response_model=List[CartItemRead])
+async def batch_update_cart(
+    payload: CartBatchRequest,
+    owner: str = Depends(get_cart_owner),
+    db: AsyncSession = Depends(get_session)
+):
+    """Apply several add/set/remove operations to the cart in one step"""
+    try:
+        items = await CartService(db).apply_batch(owner, [op.model_dump() for op in payload.operations])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return [CartItemRead.model_validate(i) for i in items]
+
+
 @router.patch("/{item_id}", response_model=CartItemRead)
 async def update_cart_item(
     item_id: int,
     payload: CartItemUpdate,
-    user=Depends(require_buyer),
+    owner: str = Depends(get_cart_owner),
     db: AsyncSession = Depends(get_session)
 ):
     """Update a cart item quantity"""
-    buyer_id = _get_user_id(user)
-    
-    cart_item = await db.get(CartItemModel, item_id)
-    if not cart_item or cart_item.buyer_id != buyer_id:
+    service = CartService(db)
+    cart_item = await service.get_item(owner, item_id)
+    if not cart_item:
         raise HTTPException(status_code=404, detail="Cart item not found")
-    
+
     if payload.quantity is not None:
-        cart_item.quantity = payload.quantity
-    
-    db.add(cart_item)
-    await db.commit()
-    await db.refresh(cart_item)
+        try:
+            cart_item = await service.update_item(owner, cart_item, payload.quantity)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     return CartItemRead.model_validate(cart_item)
 
 
 @router.delete("/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_from_cart(
     item_id: int,
-    user=Depends(require_buyer),
+    owner: str = Depends(get_cart_owner),
     db: AsyncSession = Depends(get_session)
 ):
     """Remove an item from the cart"""
-    buyer_id = _get_user_id(user)
-    
-    cart_item = await db.get(CartItemModel, item_id)
-    if not cart_item or cart_item.buyer_id != buyer_id:
+    service = CartService(db)
+    cart_item = await service.get_item(owner, item_id)
+    if not cart_item:
         raise HTTPException(status_code=404, detail="Cart item not found")
-    
-    await db.delete(cart_item)
-    await db.commit()
+
+    await service.remove_item(owner, cart_item)
 
 
 @router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
-async def clear_cart(user=Depends(require_buyer), db: AsyncSession = Depends(get_session)):
+async def clear_cart(owner: str = Depends(get_cart_owner), db: AsyncSession = Depends(get_session)):
     """Clear all items from the cart"""
-    buyer_id = _get_user_id(user)
-    
-    stmt = select(CartItemModel).where(CartItemModel.buyer_id == buyer_id)
-    result = await db.execute(stmt)
-    items = result.scalars().all()
-    
-    for item in items:
-        await db.delete(item)
-    await db.commit()
+    await CartService(db).clear_cart(owner)
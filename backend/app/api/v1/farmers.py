@@ -0,0 +1,25 @@
+# app/api/v1/farmers.py
+
+"""
+Farmer endpoints
+- Public farmer storefront: profile, listings per species, sales totals
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_session
+from app.core.timing import TimedRoute
+from app.schemas.storefront import FarmerStorefront
+from app.services.storefront_service import StorefrontService
+
+router = APIRouter(prefix="/farmers", tags=["Farmers"], route_class=TimedRoute)
+
+
+@router.get("/{farmer_id}/storefront", response_model=FarmerStorefront)
+async def get_storefront(farmer_id: int, db: AsyncSession = Depends(get_session)):
+    """Public storefront for a farmer (cached until the farmer's animals or orders change)"""
+    storefront = await StorefrontService(db).get(farmer_id)
+    if storefront is None:
+        raise HTTPException(status_code=404, detail="Farmer not found")
+    return storefront
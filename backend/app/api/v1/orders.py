@@ -5,22 +5,34 @@ Order endpoints
 - Checkout cart to order
 - List buyer orders
 - List farmer orders (for their animals)
+- Stream order events to farmers (SSE)
 """
 
+import asyncio
+
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import OperationalError
 from pydantic import BaseModel
 
-from app.core.database import get_session
-from app.core.security import require_buyer, require_farmer
-from app.models.cart import CartItem
-from app.models.order import Order, OrderItem
-from app.models.animal import Animal
-from app.schemas.order import OrderRead, OrderSummary
+from app.core.concurrency import (
+    PreconditionFailed, VersionConflict, etag, parse_if_match, raise_http
+)
+from app.core.config import settings
+from app.core.database import async_session, get_session
+from app.core.idempotency import IDEMPOTENCY_HEADER, idempotent
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.core.security import get_current_user, require_buyer, require_farmer
+from app.core.timing import TimedRoute
+from app.models.order import Order
+from app.schemas.order import OrderRead, OrderSummary, FarmerOrderSummary
+from app.services.order_events import format_event, order_events
 from app.services.order_service import OrderService
+from app.services.payment_service import PaymentService
 
 # Pydantic models for request bodies
 class OrderStatusUpdate(BaseModel):
@@ -31,7 +43,7 @@ class PaymentRequest(BaseModel):
     method: str = "M-Pesa"
 
 
-router = APIRouter(prefix="/orders", tags=["Orders"])
+router = APIRouter(prefix="/orders", tags=["Orders"], route_class=TimedRoute)
 
 
 def get_user_id(user) -> int:
@@ -42,73 +54,77 @@ def get_user_id(user) -> int:
 
 
 @router.post("/checkout", response_model=OrderRead, status_code=status.HTTP_201_CREATED)
-async def checkout(user=Depends(require_buyer), session: AsyncSession = Depends(get_session)):
-    """Create an order from cart items"""
+async def checkout(
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+    user=Depends(require_buyer),
+    session: AsyncSession = Depends(get_session)
+):
+    """Create an order from cart items; retries with the same Idempotency-Key replay the first response"""
     buyer_id = get_user_id(user)
-    
-    stmt = select(CartItem).where(CartItem.buyer_id == buyer_id)
-    result = await session.execute(stmt)
-    cart_items = result.scalars().all()
-    
-    if not cart_items:
-        raise HTTPException(status_code=400, detail="Cart is empty")
 
-    order = Order(buyer_id=buyer_id, status="pending", is_paid=False, total_price=0.0)
-    session.add(order)
-    await session.flush()
+    async def run():
+        service = OrderService(session)
+        try:
+            return await service.checkout(buyer_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except OperationalError:
+            raise HTTPException(status_code=503, detail="Checkout is busy, please retry")
 
-    total_price = 0.0
-    order_items: List[OrderItem] = []
-    
-    for item in cart_items:
-        animal = await session.get(Animal, item.animal_id)
-        if not animal or not animal.available:
-            raise HTTPException(status_code=400, detail=f"Animal {item.animal_id} not available")
-        
-        price = animal.price * item.quantity
-        total_price += price
-        order_item = OrderItem(
-            order_id=order.id,
-            animal_id=item.animal_id,
-            quantity=item.quantity,
-            price=animal.price
-        )
-        order_items.append(order_item)
-        animal.available = False
-        session.add(animal)
-
-    order.total_price = total_price
-    session.add_all(order_items)
-
-    for item in cart_items:
-        await session.delete(item)
-
-    await session.commit()
-    
-    # Refresh order with items loaded
-    stmt = select(Order).options(selectinload(Order.items)).where(Order.id == order.id)
-    result = await session.execute(stmt)
-    order = result.scalar_one()
-    
-    return order
+    async def recover(order_id: int):
+        return await OrderService(session).get_order_with_items(order_id)
+
+    return await idempotent(
+        request, response, session, buyer_id, idempotency_key, run, OrderRead, status.HTTP_201_CREATED, recover
+    )
 
 
 @router.get("/", response_model=List[OrderRead])
-async def list_my_orders(user=Depends(require_buyer), session: AsyncSession = Depends(get_session)):
-    """List all orders for the current user"""
+async def list_my_orders(
+    response: Response,
+    status_filter: Optional[str] = Query(None, alias="status", description="Filter by order status"),
+    created_from: Optional[datetime] = Query(None, description="Orders placed at or after this time"),
+    created_to: Optional[datetime] = Query(None, description="Orders placed before this time"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    limit: int = Query(20, ge=1, le=100, description="Page size"),
+    summary: bool = Query(False, description="Skip loading order items"),
+    user=Depends(require_buyer),
+    session: AsyncSession = Depends(get_session)
+):
+    """List the current user's orders, newest first (keyset paginated)"""
     buyer_id = get_user_id(user)
-    stmt = select(Order).options(selectinload(Order.items)).where(Order.buyer_id == buyer_id)
-    result = await session.execute(stmt)
-    orders = result.scalars().all()
+    service = OrderService(session)
+    orders = await service.list_orders(
+        buyer_id,
+        status=status_filter,
+        created_from=created_from,
+        created_to=created_to,
+        cursor=decode_cursor(cursor),
+        limit=limit,
+        include_items=not summary,
+    )
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(orders[-1].created_at, orders[-1].id)
+    if summary:
+        return [OrderRead.model_validate(o).model_copy(update={"items": None}) for o in orders]
     return orders
 
 
-@router.get("/farmer/my-orders", response_model=List[OrderSummary])
+@router.get("/farmer/my-orders", response_model=List[FarmerOrderSummary])
 async def list_farmer_orders(
+    response: Response,
+    status_filter: Optional[str] = Query(None, alias="status", description="Filter by order status"),
+    created_from: Optional[datetime] = Query(None, description="Orders placed at or after this time"),
+    created_to: Optional[datetime] = Query(None, description="Orders placed before this time"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    limit: int = Query(20, ge=1, le=100, description="Page size"),
     user=Depends(require_farmer),
     session: AsyncSession = Depends(get_session)
 ):
-    """List all orders containing this farmer's animals"""
+    """List orders containing this farmer's animals, newest first (keyset paginated)"""
     farmer_id = get_user_id(user)
     
     # Get farmer profile
@@ -121,18 +137,94 @@ async def list_farmer_orders(
         raise HTTPException(status_code=400, detail="Farmer profile not found")
     
     service = OrderService(session)
-    orders = await service.list_farmer_orders(farmer.id)
+    orders = await service.list_farmer_orders(
+        farmer.id,
+        status=status_filter,
+        created_from=created_from,
+        created_to=created_to,
+        cursor=decode_cursor(cursor),
+        limit=limit,
+    )
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(orders[-1]["created_at"], orders[-1]["id"])
     return orders
 
 
+@router.get("/farmer/events")
+async def stream_farmer_order_events(
+    request: Request,
+    access_token: Optional[str] = Query(None, description="Bearer token for clients that cannot set headers (EventSource)"),
+    last_event_id: Optional[int] = Header(None),
+):
+    """
+    Server-Sent Events stream of new and updated orders containing this farmer's animals.
+
+    Events: `order.created` / `order.updated` with an OrderSummary payload.
+    Reconnecting with Last-Event-ID replays missed events; if they are no
+    longer buffered a `reset` event tells the client to refetch its feed.
+    """
+    token = access_token
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+    # Resolve the farmer up front; no DB session is held open while streaming
+    from app.models.user import Farmer
+    async with async_session() as session:
+        user = await get_current_user(token, session)
+        if getattr(user, "role", None) != "farmer":
+            raise HTTPException(status_code=403, detail="Farmer only operation")
+        result = await session.execute(select(Farmer.id).where(Farmer.user_id == user.id))
+        farmer_id = result.scalar_one_or_none()
+    if not farmer_id:
+        raise HTTPException(status_code=400, detail="Farmer profile not found")
+
+    subscription, replay = order_events.subscribe(farmer_id, last_event_id)
+
+    async def event_stream():
+        try:
+            yield f"retry: {int(settings.SSE_KEEPALIVE_SECONDS * 1000)}\n\n"
+            if replay is None:
+                yield "event: reset\ndata: {}\n\n"
+            else:
+                for event in replay:
+                    yield format_event(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), settings.SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # Client fell too far behind; drop it rather than buffer without bound
+                    yield "event: reset\ndata: {}\n\n"
+                    break
+                yield format_event(event)
+        finally:
+            order_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.patch("/{order_id}/status", response_model=OrderRead)
 async def update_order_status(
     order_id: int,
     status_data: OrderStatusUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     user=Depends(require_farmer),
     session: AsyncSession = Depends(get_session)
 ):
-    """Update order status (confirm or reject) - farmer only"""
+    """Update order status (confirm or reject) - farmer only; honours If-Match with the order version"""
     farmer_id = get_user_id(user)
     
     # Get farmer profile
@@ -150,66 +242,67 @@ async def update_order_status(
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Check if any order item belongs to this farmer
-    stmt = select(OrderItem).join(Animal).where(
-        OrderItem.order_id == order_id,
-        Animal.farmer_id == farmer.id
-    )
-    result = await session.execute(stmt)
-    farmer_items = result.scalars().all()
-    
-    if not farmer_items:
+    service = OrderService(session)
+    if not await service.farmer_owns_order(farmer.id, order_id):
         raise HTTPException(status_code=403, detail="Not authorized to update this order")
     
-    # Update order status
-    order.status = status_data.status
-    session.add(order)
-    await session.commit()
-    await session.refresh(order)
+    # Update order status (compare-and-swap on the version)
+    try:
+        order = await service.update_order_status(order, status_data.status, parse_if_match(if_match))
+    except (VersionConflict, PreconditionFailed) as e:
+        raise_http(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
     
-    return order
+    response.headers["ETag"] = etag(order.version)
+    return await service.get_order_with_items(order.id)
 
 
-@router.post("/{order_id}/pay", response_model=OrderRead)
+@router.post("/{order_id}/pay", response_model=OrderRead, status_code=status.HTTP_202_ACCEPTED)
 async def pay_order(
     order_id: int,
     payment_data: PaymentRequest,
+    request: Request,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     user=Depends(require_buyer),
     session: AsyncSession = Depends(get_session)
 ):
-    """Mark order as paid (simulates payment completion)"""
+    """
+    Start paying an order through the payment provider; honours If-Match with the order version.
+    Returns 202 with the still-unpaid order and a Location header for the payment; the order
+    becomes paid when the provider's callback arrives. Retries with the same Idempotency-Key
+    replay the first response.
+    """
     buyer_id = get_user_id(user)
     
-    # Get order
-    order = await session.get(Order, order_id)
-    if not order or order.buyer_id != buyer_id:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.is_paid:
-        raise HTTPException(status_code=400, detail="Order already paid")
-    
-    if order.status == 'rejected':
-        raise HTTPException(status_code=400, detail="Cannot pay for rejected order")
-    
-    # Simulate payment processing
-    order.is_paid = True
-    order.status = "paid"
-    session.add(order)
+    async def run():
+        order = await session.get(Order, order_id)
+        if not order or order.buyer_id != buyer_id:
+            raise HTTPException(status_code=404, detail="Order not found")
+        try:
+            payment = await PaymentService(session).initiate_payment(
+                order_id, payment_data.method, parse_if_match(if_match)
+            )
+        except PreconditionFailed as e:
+            raise_http(e)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return await accepted(payment.id)
+
+    async def accepted(payment_id: int):
+        response.headers["Location"] = f"/api/v1/payments/{payment_id}"
+        order = await OrderService(session).get_order_with_items(order_id)
+        response.headers["ETag"] = etag(order.version)
+        return order
     
-    # Create payment record
-    from app.models.payment import Payment
-    payment = Payment(
-        order_id=order_id,
-        amount=order.total_price,
-        method=payment_data.method,
-        status="completed",
-        transaction_id=f"TXN-{order_id}-{int(__import__('time').time())}"
+    return await idempotent(
+        request, response, session, buyer_id, idempotency_key, run, OrderRead, status.HTTP_202_ACCEPTED, accepted
     )
-    session.add(payment)
-    
-    await session.commit()
-    await session.refresh(order)
-    
-    return order
 
 
 class PaymentRequest(BaseModel):
@@ -4,21 +4,35 @@
 Payment endpoints
 - Process payments for orders
 - Track payment status
+- Look up payments by provider transaction id
+- Reconcile payments against orders (admin)
+- Receive provider status callbacks (webhook)
 """
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
-from app.core.database import get_session
-from app.core.security import require_buyer
-from app.models.payment import Payment
+from app.core.concurrency import PreconditionFailed, VersionConflict, etag, parse_if_match, raise_http
+from app.core.database import async_session, get_session
+from app.core.idempotency import IDEMPOTENCY_HEADER, idempotent
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.core.security import get_current_user, require_admin, require_buyer
+from app.core.timing import TimedRoute
 from app.models.order import Order
 from app.services.payment_service import PaymentService
-from app.schemas.payment import PaymentCreate, PaymentRead, PaymentUpdate
+from app.services.payment_webhooks import verify_signature, webhook_batcher
+from app.services.reconciliation_service import SCOPES, ReconciliationService
+from app.schemas.payment import PaymentCallback, PaymentCreate, PaymentRead, PaymentUpdate
 
-router = APIRouter(prefix="/payments", tags=["Payments"])
+router = APIRouter(prefix="/payments", tags=["Payments"], route_class=TimedRoute)
+
+_callbacks = TypeAdapter(PaymentCallback | List[PaymentCallback])
 
 
 def get_user_id(user) -> int:
@@ -31,70 +45,158 @@ def get_user_id(user) -> int:
 @router.post("/", response_model=PaymentRead, status_code=status.HTTP_201_CREATED)
 async def create_payment(
     payload: PaymentCreate,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     db: AsyncSession = Depends(get_session),
     user=Depends(require_buyer)
 ):
-    """Create a new payment for an order"""
+    """Create a new payment for an order; retries with the same Idempotency-Key replay the first response"""
     buyer_id = get_user_id(user)
     
-    # Verify the order belongs to the user
-    order = await db.get(Order, payload.order_id)
-    if not order or order.buyer_id != buyer_id:
-        raise HTTPException(status_code=404, detail="Order not found or not yours")
-    
-    if order.is_paid:
-        raise HTTPException(status_code=400, detail="Order already paid")
+    async def run():
+        # Verify the order belongs to the user
+        order = await db.get(Order, payload.order_id)
+        if not order or order.buyer_id != buyer_id:
+            raise HTTPException(status_code=404, detail="Order not found or not yours")
+        
+        if order.is_paid:
+            raise HTTPException(status_code=400, detail="Order already paid")
+        if order.status == "expired":
+            raise HTTPException(status_code=400, detail="Order expired before payment")
+        
+        service = PaymentService(db)
+        try:
+            return await service.create_payment(
+                order_id=payload.order_id,
+                amount=float(payload.amount),
+                method=payload.method
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    service = PaymentService(db)
-    payment = await service.create_payment(
-        order_id=payload.order_id,
-        amount=float(payload.amount),
-        method=payload.method
+    async def recover(payment_id: int):
+        return await PaymentService(db).get_payment(payment_id)
+
+    return await idempotent(
+        request, response, db, buyer_id, idempotency_key, run, PaymentRead, status.HTTP_201_CREATED, recover
     )
-    return payment
 
 
 @router.get("/", response_model=List[PaymentRead])
 async def list_payments(
+    response: Response,
+    status_filter: Optional[str] = Query(None, alias="status", description="Filter by payment status"),
+    created_from: Optional[datetime] = Query(None, description="Payments created at or after this time"),
+    created_to: Optional[datetime] = Query(None, description="Payments created before this time"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    limit: int = Query(20, ge=1, le=100, description="Page size"),
     db: AsyncSession = Depends(get_session),
     user=Depends(require_buyer)
 ):
-    """List all payments for the current user's orders"""
+    """List payments for the current user's orders, newest first (keyset paginated)"""
     buyer_id = get_user_id(user)
-    
-    # Get user's orders first
-    order_stmt = select(Order.id).where(Order.buyer_id == buyer_id)
-    order_result = await db.execute(order_stmt)
-    order_ids = [row[0] for row in order_result.fetchall()]
-    
-    if not order_ids:
-        return []
-    
-    # Get payments for those orders
-    stmt = select(Payment).where(Payment.order_id.in_(order_ids))
-    result = await db.execute(stmt)
-    payments = result.scalars().all()
+    payments = await PaymentService(db).list_buyer_payments(
+        buyer_id,
+        status=status_filter,
+        created_from=created_from,
+        created_to=created_to,
+        cursor=decode_cursor(cursor),
+        limit=limit,
+    )
+    if len(payments) > limit:
+        payments = payments[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(payments[-1].created_at, payments[-1].id)
     return payments
 
 
+@router.get("/reconciliation")
+async def reconcile_payments(
+    scope: Optional[str] = Query(None, description="hot or archive (default: both)"),
+    user=Depends(require_admin),
+):
+    """
+    Reconcile payments against orders (admin only).
+
+    Streams NDJSON: one line per issue, then a final {"summary": ...} line.
+    Runs as a merge-join over both tables in key order, in constant memory.
+    """
+    if scope is not None and scope not in SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope must be one of {', '.join(SCOPES)}")
+
+    async def report():
+        async with async_session() as session:
+            service = ReconciliationService(session)
+            async for issue in service.run([scope] if scope else None):
+                yield json.dumps(issue) + "\n"
+            yield json.dumps({"summary": service.summary}) + "\n"
+
+    return StreamingResponse(report(), media_type="application/x-ndjson")
+
+
+@router.post("/webhook")
+async def payment_webhook(
+    request: Request,
+    x_signature: Optional[str] = Header(None),
+):
+    """
+    Provider status callbacks: one callback object or a list of them.
+
+    Authenticated by an HMAC-SHA256 X-Signature of the raw body; rejected
+    outright when PAYMENT_WEBHOOK_SECRET is not configured. Callbacks
+    arriving together are applied in one transaction; replays are reported
+    as "duplicate" so the provider can stop retrying.
+    """
+    body = await request.body()
+    if not verify_signature(body, x_signature):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    try:
+        parsed = _callbacks.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    callbacks = parsed if isinstance(parsed, list) else [parsed]
+    if not callbacks:
+        return {"results": []}
+
+    outcomes = await webhook_batcher.submit([c.model_dump() for c in callbacks])
+    return {
+        "results": [
+            {"payment_id": c.payment_id, "transaction_id": c.transaction_id, "result": outcome}
+            for c, outcome in zip(callbacks, outcomes)
+        ]
+    }
+
+
+@router.get("/by-transaction/{transaction_id}", response_model=PaymentRead)
+async def get_payment_by_transaction(
+    transaction_id: str,
+    db: AsyncSession = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    """Look up a payment by provider transaction id (buyers see their own, admins any; includes archived)"""
+    buyer_id = None if getattr(user, "role", None) == "admin" else get_user_id(user)
+    payment = await PaymentService(db).get_payment_by_transaction(transaction_id, buyer_id=buyer_id)
+    if not payment:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    return payment
+
+
 @router.get("/{payment_id}", response_model=PaymentRead)
 async def get_payment(
     payment_id: int,
+    response: Response,
     db: AsyncSession = Depends(get_session),
     user=Depends(require_buyer)
 ):
     """Get a specific payment by ID"""
     buyer_id = get_user_id(user)
     
-    payment = await db.get(Payment, payment_id)
+    # Ownership is checked in the same query (payments joined to the buyer's orders)
+    payment = await PaymentService(db).get_buyer_payment(buyer_id, payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     
-    # Verify the payment belongs to user's order
-    order = await db.get(Order, payment.order_id)
-    if not order or order.buyer_id != buyer_id:
-        raise HTTPException(status_code=404, detail="Payment not found")
-    
+    response.headers["ETag"] = etag(payment.version)
     return payment
 
 
@@ -102,53 +204,66 @@ async def get_payment(
 async def update_payment(
     payment_id: int,
     payload: PaymentUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_session),
-    user=Depends(require_buyer)
+    user=Depends(get_current_user)
 ):
-    """Update a payment status"""
-    buyer_id = get_user_id(user)
-    
-    payment = await db.get(Payment, payment_id)
+    """
+    Update a payment (honours If-Match with the payment version).
+    Buyers may change the method of their own payments; status changes are
+    reserved to admins, since payments settle through provider callbacks.
+    """
+    service = PaymentService(db)
+    if getattr(user, "role", None) == "admin":
+        payment = await service.get_payment(payment_id)
+    else:
+        require_buyer(user)
+        if payload.status:
+            raise HTTPException(status_code=403, detail="Payment status is set by the payment provider")
+        # Ownership is checked in the same query (payments joined to the buyer's orders)
+        payment = await service.get_buyer_payment(get_user_id(user), payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     
-    # Verify the payment belongs to user's order
-    order = await db.get(Order, payment.order_id)
-    if not order or order.buyer_id != buyer_id:
-        raise HTTPException(status_code=404, detail="Payment not found")
-    
-    service = PaymentService(db)
-    if payload.status:
-        payment = await service.update_payment_status(payment, payload.status)
-        
-        # If payment completed, mark order as paid
-        if payload.status == "completed":
-            order.is_paid = True
-            order.status = "paid"
-            db.add(order)
-            await db.commit()
+    if payload.status or payload.method:
+        # Completing a payment also marks the order paid, in the same transaction
+        try:
+            payment = await service.update_payment_status(
+                payment, payload.status, payload.method, parse_if_match(if_match)
+            )
+        except (VersionConflict, PreconditionFailed) as e:
+            raise_http(e)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if payment is None:
+            raise HTTPException(status_code=404, detail="Payment not found")
     
+    response.headers["ETag"] = etag(payment.version)
     return payment
 
 
 @router.post("/{payment_id}/complete", response_model=PaymentRead)
 async def complete_payment(
     payment_id: int,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_session),
-    user=Depends(require_buyer)
+    user=Depends(require_admin)
 ):
-    """Mark a payment as completed"""
-    buyer_id = get_user_id(user)
-    
-    payment = await db.get(Payment, payment_id)
+    """Mark a payment as completed - admin only (manual settlement; honours If-Match with the payment version)"""
+    payment = await PaymentService(db).get_payment(payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     
-    # Verify the payment belongs to user's order
-    order = await db.get(Order, payment.order_id)
-    if not order or order.buyer_id != buyer_id:
-        raise HTTPException(status_code=404, detail="Payment not found")
-    
     service = PaymentService(db)
-    payment = await service.complete_payment(payment)
+    try:
+        payment = await service.complete_payment(payment, parse_if_match(if_match))
+    except (VersionConflict, PreconditionFailed) as e:
+        raise_http(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if payment is None:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    response.headers["ETag"] = etag(payment.version)
     return payment
@@ -4,20 +4,24 @@
 User endpoints.
 - Get current user profile
 - Update user profile
-- Admin: List users
+- Admin: Browse the user directory (paginated) and export it (NDJSON)
 """
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.core.database import get_session
-from app.core.security import get_current_user, hash_password
+from app.core.database import async_session, get_session
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_key_cursor, encode_key_cursor
+from app.core.security import get_current_user, hash_password, require_admin
+from app.core.timing import TimedRoute
 from app.models.user import User, Farmer
 from app.schemas.user import UserRead, UserUpdate, FarmerCreate, FarmerRead, FarmerUpdate
+from app.services.user_service import UserService
 
-router = APIRouter(prefix="/users", tags=["Users"])
+router = APIRouter(prefix="/users", tags=["Users"], route_class=TimedRoute)
 
 
 @router.get("/me", response_model=UserRead)
@@ -96,8 +100,37 @@ async def update_farmer_profile(
 
 
 @router.get("/", response_model=List[UserRead])
-async def list_users(db: AsyncSession = Depends(get_session)):
-    """List all users (admin endpoint)"""
-    stmt = select(User)
-    result = await db.execute(stmt)
-    return result.scalars().all()
+async def list_users(
+    response: Response,
+    role: Optional[str] = Query(None, description="Filter by role"),
+    is_active: Optional[bool] = Query(None, description="Filter by active status"),
+    email: Optional[str] = Query(None, min_length=1, description="Email prefix"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    limit: int = Query(50, ge=1, le=200, description="Page size"),
+    db: AsyncSession = Depends(get_session),
+    admin=Depends(require_admin)
+):
+    """User directory in email order (admin only; keyset paginated)"""
+    users = await UserService(db).list_users(
+        role=role, is_active=is_active, email_prefix=email, after_email=decode_key_cursor(cursor), limit=limit
+    )
+    if len(users) > limit:
+        users = users[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_key_cursor(users[-1].email)
+    return users
+
+
+@router.get("/export")
+async def export_users(
+    role: Optional[str] = Query(None, description="Filter by role"),
+    is_active: Optional[bool] = Query(None, description="Filter by active status"),
+    email: Optional[str] = Query(None, min_length=1, description="Email prefix"),
+    admin=Depends(require_admin)
+):
+    """Stream the filtered user directory as NDJSON, one user per line (admin only)"""
+    async def rows():
+        async with async_session() as session:
+            async for user in UserService(session).iter_users(role=role, is_active=is_active, email_prefix=email):
+                yield UserRead.model_validate(user).model_dump_json() + "\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
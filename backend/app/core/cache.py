@@ -0,0 +1,72 @@
+# app/core/cache.py
+
+"""
+Lightweight in-process caching helpers
+
+Responsibilities:
+- Generation counters that writers bump to invalidate dependent caches,
+  globally or per key
+- A small bounded LRU map for per-key cached results
+"""
+
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class Generation:
+    """Monotonic counter; bump() on every write to the data it guards"""
+
+    def __init__(self):
+        self.value = 0
+
+    def bump(self):
+        self.value += 1
+
+
+class KeyedGeneration:
+    """One Generation-style counter per key (e.g. per farmer)"""
+
+    def __init__(self):
+        self._values: dict = {}
+
+    def value(self, key: Hashable) -> int:
+        return self._values.get(key, 0)
+
+    def bump(self, key: Hashable):
+        self._values[key] = self._values.get(key, 0) + 1
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key"""
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Bumped on every write to the animals table (create/update/delete/checkout)
+catalog_generation = Generation()
+
+# Bumped per farmer on writes to their animals and on their orders' changes
+storefront_generation = KeyedGeneration()
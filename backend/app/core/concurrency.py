@@ -0,0 +1,108 @@
+# app/core/concurrency.py
+
+"""
+Optimistic concurrency helpers
+
+Responsibilities:
+- Compare-and-swap UPDATEs against a row's `version` column
+- Read-modify-write with bounded automatic retry on conflicts
+- If-Match / ETag parsing for client preconditions
+"""
+
+import asyncio
+import random
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+
+class VersionConflict(Exception):
+    """The row changed between read and write"""
+
+
+class PreconditionFailed(Exception):
+    """The client's If-Match version does not match the stored version"""
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Parse an If-Match header ('"3"', 'W/"3"' or '3'); '*' or missing means no precondition"""
+    if value is None:
+        return None
+    value = value.strip()
+    if value in ("", "*"):
+        return None
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+
+def raise_http(exc: Exception):
+    """Map concurrency errors to HTTP responses"""
+    if isinstance(exc, PreconditionFailed):
+        raise HTTPException(status_code=412, detail=str(exc) or "Precondition failed")
+    raise HTTPException(status_code=409, detail=str(exc) or "Resource was modified concurrently")
+
+
+async def cas_update(session: AsyncSession, model: Type, obj_id: int, expected_version: int, values: Dict[str, Any]) -> bool:
+    """UPDATE ... SET values, version=version+1 WHERE id=:id AND version=:expected"""
+    stmt = (
+        update(model)
+        .where(model.id == obj_id, model.version == expected_version)
+        .values(**values, version=model.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(stmt)
+    return result.rowcount == 1
+
+
+async def update_versioned(
+    session: AsyncSession,
+    model: Type,
+    obj_id: int,
+    apply: Callable[[Any], Awaitable[Dict[str, Any]]],
+    expected_version: Optional[int] = None,
+):
+    """
+    Read-modify-write a row with compare-and-swap and commit.
+
+    `apply(obj)` returns the column values to write and may perform further
+    versioned writes in the same transaction (raising VersionConflict).
+    Without `expected_version` conflicts are retried up to
+    VERSION_CONFLICT_MAX_RETRIES times; with it the caller gets the conflict.
+    Returns the refreshed object, or None if the row does not exist.
+    """
+    retries = settings.VERSION_CONFLICT_MAX_RETRIES if expected_version is None else 0
+    for attempt in range(retries + 1):
+        obj = await session.get(model, obj_id, populate_existing=True)
+        if obj is None:
+            return None
+        if expected_version is not None and obj.version != expected_version:
+            raise PreconditionFailed(f"Version mismatch: current version is {obj.version}")
+        try:
+            values = await apply(obj)
+            if not await cas_update(session, model, obj_id, obj.version, values):
+                raise VersionConflict(f"{model.__name__} {obj_id} was modified concurrently")
+            await session.commit()
+        except VersionConflict:
+            await session.rollback()
+            if attempt == retries:
+                raise
+            # Jittered backoff so competing writers do not retry in lockstep
+            await asyncio.sleep(random.uniform(0, 0.01) * (attempt + 1))
+            continue
+        except Exception:
+            await session.rollback()
+            raise
+        await session.refresh(obj)
+        return obj
@@ -4,7 +4,7 @@
 Project configuration
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -35,6 +35,103 @@ class Settings(BaseSettings):
     # Middleware
     ENABLE_GZIP: bool = True
 
+    # Logging (queued to a background writer thread)
+    LOG_LEVEL: str = "WARNING"                    # INFO when DEBUG is on
+    LOG_JSON: bool = True
+    LOG_QUEUE_SIZE: int = 10_000                  # records beyond this are dropped, not waited on
+    LOG_SAMPLE_RATES: Dict[str, float] = {}       # logger prefix -> fraction of INFO/DEBUG records kept
+    LOG_RATE_LIMIT_BURST: int = 10                # warnings per message template per window
+    LOG_RATE_LIMIT_WINDOW_SECONDS: float = 60.0
+
+    # Precompressed cache of anonymous catalog GETs (invalidated by catalog writes)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_PATHS: List[str] = ["/api/v1/animals"]
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_TTL_SECONDS: float = 30.0      # bounds staleness across worker processes
+
+    # Request metrics on /metrics (Prometheus text format)
+    ENABLE_METRICS: bool = True
+    METRICS_DIR: Optional[str] = None             # shared directory to aggregate across worker processes
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 5.0
+
+    # Server-Timing spans (fraction of requests sampled; 0 disables)
+    SERVER_TIMING_SAMPLE_RATE: float = 0.1
+    SERVER_TIMING_TOKEN: str = ""                      # X-Server-Timing-Token value that unlocks the header
+    SERVER_TIMING_TRACE_FILE: Optional[str] = None     # JSON trace record per sampled request
+    SERVER_TIMING_TRACE_MAX_BYTES: int = 10 * 1024 * 1024
+    SERVER_TIMING_TRACE_BACKUPS: int = 5
+
+    # Cart store (in-memory primary, write-behind to cart_items)
+    CART_FLUSH_INTERVAL_SECONDS: float = 2.0
+    CART_IDLE_TTL_MINUTES: int = 30
+    GUEST_CART_TTL_MINUTES: int = 60 * 24
+    GUEST_CART_MAX: int = 10_000                  # guest carts held in memory; least recently used dropped
+
+    # Checkout
+    CHECKOUT_MAX_RETRIES: int = 5
+    CHECKOUT_RETRY_BACKOFF_SECONDS: float = 0.05
+
+    # Optimistic concurrency: automatic retries for writes without If-Match
+    VERSION_CONFLICT_MAX_RETRIES: int = 3
+
+    # Farmer order event stream (SSE)
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    SSE_QUEUE_SIZE: int = 100       # per-connection backlog before the client is reset
+    SSE_REPLAY_BUFFER: int = 1000   # recent events kept for Last-Event-ID resume
+
+    # Idempotency-Key handling for checkout / payment endpoints
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    IDEMPOTENCY_WAIT_SECONDS: float = 30.0           # how long a duplicate waits for the first request
+    IDEMPOTENCY_POLL_SECONDS: float = 0.05
+    IDEMPOTENCY_STALE_SECONDS: int = 300             # in-progress keys older than this are taken over
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS: int = 60
+
+    # Outbox worker pool (post-commit work)
+    OUTBOX_WORKERS: int = 4
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_BACKOFF_SECONDS: float = 1.0     # doubled on every failed attempt
+    OUTBOX_LOCK_TIMEOUT_SECONDS: int = 300        # processing rows older than this are reclaimed
+    OUTBOX_DRAIN_TIMEOUT_SECONDS: float = 10.0
+
+    # Unpaid order expiry (0 disables the sweeper)
+    ORDER_PAYMENT_DEADLINE_MINUTES: int = 60
+    ORDER_EXPIRY_SWEEP_INTERVAL_SECONDS: float = 60.0
+    ORDER_EXPIRY_BATCH_SIZE: int = 200
+
+    # Cart stock reservations
+    CART_RESERVATION_TTL_MINUTES: int = 15
+    RESERVATION_SWEEP_INTERVAL_SECONDS: float = 30.0
+    RESERVATION_EXPIRY_BATCH_SIZE: int = 500
+
+    # Archival of settled (paid / rejected) orders into archived_* tables
+    ARCHIVE_AFTER_DAYS: int = 180
+    ARCHIVE_BATCH_SIZE: int = 500
+
+    # Farmer storefront cache (invalidated on writes; TTL bounds staleness across processes)
+    STOREFRONT_CACHE_SIZE: int = 10_000
+    STOREFRONT_CACHE_TTL_SECONDS: float = 300.0
+
+    # Payment provider gateway ("stub" settles locally; "http" calls PAYMENT_PROVIDER_URL)
+    PAYMENT_PROVIDER: str = "stub"
+    PAYMENT_PROVIDER_URL: str = ""
+    PAYMENT_PROVIDER_API_KEY: str = ""
+    PAYMENT_PROVIDER_TIMEOUT_SECONDS: float = 10.0
+    PAYMENT_PROVIDER_CONCURRENCY: int = 20          # in-flight provider calls per process
+    PAYMENT_PROVIDER_MAX_CONNECTIONS: int = 50
+    PUBLIC_BASE_URL: str = "http://localhost:8000"  # used to build the webhook callback URL
+
+    # Provider callbacks (webhooks)
+    PAYMENT_PENDING_TIMEOUT_MINUTES: int = 15       # unsettled attempts older than this no longer block a retry
+    PAYMENT_WEBHOOK_SECRET: str = ""                # HMAC-SHA256 key; required unless PAYMENT_PROVIDER is "stub"
+    PAYMENT_WEBHOOK_BATCH_SIZE: int = 100
+    PAYMENT_WEBHOOK_BATCH_WINDOW_SECONDS: float = 0.02
+
+    # Stub provider
+    PAYMENT_STUB_DELAY_SECONDS: float = 1.0
+    PAYMENT_STUB_OUTCOME: str = "completed"         # completed or failed
+
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
@@ -4,12 +4,18 @@
 Database connection and session
 """
 
+import logging
 from typing import AsyncGenerator
 from sqlmodel import SQLModel
+from sqlalchemy import text, inspect
+from sqlalchemy.schema import CreateColumn, CreateTable
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 engine = create_async_engine(settings.DATABASE_URL, echo=settings.DEBUG, future=True)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -19,6 +25,27 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def begin_immediate(session: AsyncSession):
+    """
+    Start a write transaction up front.
+    On SQLite this takes the RESERVED lock immediately (BEGIN IMMEDIATE), so
+    concurrent writers queue on busy_timeout instead of failing mid-transaction.
+    Other backends rely on row locks taken by the statements themselves.
+    """
+    # End the implicit transaction left by earlier reads on this session
+    await session.commit()
+    if session.bind.dialect.name == "sqlite":
+        await session.execute(text("BEGIN IMMEDIATE"))
+
+
+def is_lock_error(exc: Exception) -> bool:
+    """True if the error is a transient lock/busy error worth retrying"""
+    if not isinstance(exc, OperationalError):
+        return False
+    message = str(exc.orig).lower()
+    return "locked" in message or "busy" in message
+
+
 async def init_db():
     """Initialize database and create all tables"""
     import app.models.user  # noqa
@@ -26,9 +53,145 @@ async def init_db():
     import app.models.order  # noqa
     import app.models.cart  # noqa
     import app.models.payment  # noqa
+    import app.models.analytics  # noqa
+    import app.models.idempotency  # noqa
+    import app.models.outbox  # noqa
+    import app.models.reservation  # noqa
+    import app.models.archive  # noqa
 
     async with engine.begin() as conn:
+        created = await conn.run_sync(_missing_tables)
         await conn.run_sync(SQLModel.metadata.create_all)
+        added = await conn.run_sync(_sync_schema)
+        for statement in _BACKFILLS:
+            await conn.execute(text(statement))
+        if created & _ROLLUP_TABLES or added & _ROLLUP_COLUMNS:
+            # Rollups are maintained incrementally; a fresh table (or a new bucket
+            # column) must first count existing orders
+            from app.services.analytics_service import rebuild_rollups
+            await rebuild_rollups(conn)
+            logger.info("Seeded sales rollups from existing orders")
+
+
+# Tables derived from orders, seeded by a full rebuild when first created
+_ROLLUP_TABLES = {"sales_rollups", "order_rollups"}
+# Columns the rollups are bucketed by; adding them changes the buckets, so rebuild
+_ROLLUP_COLUMNS = {("order_items", "species"), ("archived_order_items", "species")}
+
+
+def _missing_tables(conn) -> set:
+    inspector = inspect(conn)
+    return {table.name for table in SQLModel.metadata.sorted_tables if not inspector.has_table(table.name)}
+
+
+# Idempotent data fixes for columns added after rows already existed
+_BACKFILLS = [
+    "UPDATE order_items SET farmer_id = "
+    "(SELECT animals.farmer_id FROM animals WHERE animals.id = order_items.animal_id) "
+    "WHERE farmer_id IS NULL",
+]
+
+# Data fixes run right before a missing index is created (old rows would violate it)
+_INDEX_BACKFILLS = {
+    # Keep the first completed payment per order; later ones await a refund
+    "uq_payments_order_id_completed": [
+        "UPDATE payments SET status = 'refund_pending' "
+        "WHERE status = 'completed' AND id NOT IN "
+        "(SELECT MIN(id) FROM payments WHERE status = 'completed' GROUP BY order_id)",
+    ],
+    # The farmer feed groups items by (created_at, order_id): items of one order
+    # must share the order's timestamp (older versions stamped each item separately)
+    "ix_order_items_farmer_id_created_at": [
+        "UPDATE order_items SET created_at = "
+        "(SELECT orders.created_at FROM orders WHERE orders.id = order_items.order_id)",
+        "UPDATE archived_order_items SET created_at = "
+        "(SELECT archived_orders.created_at FROM archived_orders WHERE archived_orders.id = archived_order_items.order_id)",
+    ],
+}
+
+# One-off fixes run right after a column is added (the server default is wrong for old rows)
+_COLUMN_BACKFILLS = {
+    # Before stock tracking every animal was a single unit; sold ones were unlisted
+    ("animals", "stock"): "UPDATE animals SET stock = CASE WHEN available THEN 1 ELSE 0 END",
+    # Best guess for old lines is the animal's current species
+    ("order_items", "species"): "UPDATE order_items SET species = COALESCE("
+    "(SELECT animals.species FROM animals WHERE animals.id = order_items.animal_id), 'unknown')",
+    ("archived_order_items", "species"): "UPDATE archived_order_items SET species = COALESCE("
+    "(SELECT animals.species FROM animals WHERE animals.id = archived_order_items.animal_id), 'unknown')",
+}
+
+
+# Hot tables whose ids move into an archive table; new ids must stay above both
+_ARCHIVE_TABLES = {
+    "orders": "archived_orders",
+    "order_items": "archived_order_items",
+    "payments": "archived_payments",
+}
+
+
+def _rebuild_with_autoincrement(conn, table):
+    """
+    SQLite only: recreate a table created without AUTOINCREMENT (ids of deleted
+    max rows would be reused), copying its rows, and start the id sequence
+    above every id already used here or in its archive.
+    """
+    row = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+    ).first()
+    if row is None or "AUTOINCREMENT" in row.sql.upper():
+        return
+    rebuilt = f"{table.name}_rebuild"
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect))
+    conn.execute(text(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {rebuilt} ", 1)))
+    columns = ", ".join(column.name for column in table.columns)
+    conn.execute(text(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table.name}"))
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {rebuilt} RENAME TO {table.name}"))
+
+    floor = f"SELECT COALESCE(MAX(id), 0) FROM {table.name}"
+    archive = _ARCHIVE_TABLES.get(table.name)
+    if archive:
+        floor = f"SELECT MAX(({floor}), (SELECT COALESCE(MAX(id), 0) FROM {archive}))"
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {"name": table.name})
+    conn.execute(text(f"INSERT INTO sqlite_sequence (name, seq) SELECT :name, ({floor})"), {"name": table.name})
+    logger.warning("Rebuilt table %s with AUTOINCREMENT ids", table.name)
+
+
+def _sync_schema(conn):
+    """
+    Bring tables created by older versions up to date.
+    create_all() skips existing tables, so add any missing columns and indexes,
+    and on SQLite switch tables declared with sqlite_autoincrement to it.
+    New columns must be nullable or carry a server default.
+    Returns the (table, column) pairs that were added.
+    """
+    added = set()
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                added.add((table.name, column.name))
+                backfill = _COLUMN_BACKFILLS.get((table.name, column.name))
+                if backfill:
+                    conn.execute(text(backfill))
+        if conn.dialect.name == "sqlite" and table.dialect_options["sqlite"]["autoincrement"]:
+            _rebuild_with_autoincrement(conn, table)
+            inspector = inspect(conn)  # the rebuild dropped the table's indexes
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            for backfill in _INDEX_BACKFILLS.get(index.name, ()):
+                result = conn.execute(text(backfill))
+                if result.rowcount:
+                    logger.warning("%s: fixed %d rows before creating the index", index.name, result.rowcount)
+            index.create(conn)
+    return added
 
 
 async def close_db():
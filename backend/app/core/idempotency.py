@@ -0,0 +1,228 @@
+# app/core/idempotency.py
+
+"""
+Idempotency-Key support for unsafe endpoints
+
+Responsibilities:
+- Claim (user, Idempotency-Key) before running the handler
+- Store the final response and replay it byte-for-byte on retries
+- Make concurrent duplicates wait for the first execution
+- Reject a key reused for a different request
+
+Only deterministic outcomes are stored (2xx and most 4xx). Server errors
+and transient conflicts (409/412/429) release the key so the client may retry.
+
+The response is stored after the handler has committed, so a crash (or a lock
+error) in between would leave the key without a response. Services therefore
+call record_resource() inside their own transaction; a key with a resource
+but no response is never re-executed: retries rebuild the response from the
+resource through the endpoint's `recover` callback.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+from fastapi import HTTPException, Request, Response
+from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.idempotency import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+_TRANSIENT_STATUSES = {409, 412, 429}
+_REPLAYED_HEADERS = ("etag", "location", "x-cart-session")
+_last_purge = 0.0
+
+# (user_id, key) claimed by the request running in this context
+_current_claim: ContextVar[Optional[Tuple[int, str]]] = ContextVar("idempotency_claim", default=None)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def _fingerprint(request: Request) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.url.path.encode())
+    digest.update(await request.body())
+    return digest.hexdigest()
+
+
+def _replay(record: IdempotencyKey) -> Response:
+    headers = json.loads(record.headers or "{}")
+    headers[REPLAYED_HEADER] = "true"
+    return Response(content=record.body, status_code=record.status_code, headers=headers)
+
+
+async def _purge_expired(session: AsyncSession):
+    """Drop expired keys at most once per IDEMPOTENCY_PURGE_INTERVAL_SECONDS (range scan on expires_at)"""
+    global _last_purge
+    if time.monotonic() - _last_purge < settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = time.monotonic()
+    await session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < _now()))
+    await session.commit()
+
+
+async def record_resource(session: AsyncSession, resource_id: int):
+    """
+    Tie the created resource to the claimed key, in the caller's transaction
+    (call before its commit). No-op outside an idempotent request.
+    """
+    claim = _current_claim.get()
+    if claim is None:
+        return
+    user_id, key = claim
+    await session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(resource_id=resource_id)
+    )
+
+
+async def _claim(session: AsyncSession, user_id: int, key: str, request_hash: str) -> Optional[IdempotencyKey]:
+    """
+    Insert an in-progress row for the key. Returns None if this request owns
+    the key, or the completed record to replay (or recover, when only its
+    resource was committed). Waits while another request with the same key
+    is executing.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        now = _now()
+        session.add(IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            created_at=now,
+            expires_at=now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+        ))
+        try:
+            await session.commit()
+            return None
+        except IntegrityError:
+            await session.rollback()
+
+        result = await session.execute(
+            select(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .execution_options(populate_existing=True)
+        )
+        record = result.scalar_one_or_none()
+        if record is None:
+            continue  # released or purged between our insert and select
+        if record.request_hash != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if record.expires_at.replace(tzinfo=timezone.utc) < now:
+            await session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == record.id))
+            await session.commit()
+            continue
+        if record.status_code is not None or record.resource_id is not None:
+            return record
+        if record.created_at.replace(tzinfo=timezone.utc) < now - timedelta(seconds=settings.IDEMPOTENCY_STALE_SECONDS):
+            # The owner died mid-request (crash or cancelled connection); take the key over
+            await session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == record.id))
+            await session.commit()
+            continue
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        await session.commit()  # end the read transaction so the owner can write
+        await asyncio.sleep(settings.IDEMPOTENCY_POLL_SECONDS)
+
+
+async def _release(session: AsyncSession, user_id: int, key: str):
+    await session.rollback()
+    await session.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status_code.is_(None),
+            IdempotencyKey.resource_id.is_(None),  # the work was committed: keep it for recovery
+        )
+    )
+    await session.commit()
+
+
+async def _store(session: AsyncSession, user_id: int, key: str, response: Response):
+    headers = {k: v for k, v in response.headers.items() if k.lower() in _REPLAYED_HEADERS}
+    headers["content-type"] = response.headers.get("content-type", "application/json")
+    await session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(status_code=response.status_code, body=response.body, headers=json.dumps(headers))
+    )
+    await session.commit()
+
+
+async def idempotent(
+    request: Request,
+    response: Response,
+    session: AsyncSession,
+    user_id: int,
+    key: Optional[str],
+    handler: Callable[[], Awaitable[Any]],
+    schema: Type[BaseModel],
+    status_code: int = 200,
+    recover: Optional[Callable[[int], Awaitable[Any]]] = None,
+):
+    """
+    Run `handler` at most once per (user_id, key) and return its response.
+
+    Without a key the handler result is returned unchanged. With a key the
+    result is serialised through `schema` once, stored, and the same bytes
+    are returned for this request and every retry. Headers the handler set
+    on `response` (e.g. ETag) are kept.
+
+    `recover(resource_id)` rebuilds the handler's result (and headers) from
+    the resource recorded with record_resource(), for keys whose handler
+    committed but whose response was never stored.
+    """
+    if not key:
+        return await handler()
+    if len(key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    await _purge_expired(session)
+    record = await _claim(session, user_id, key, await _fingerprint(request))
+    if record is not None and record.status_code is not None:
+        return _replay(record)
+    if record is not None and recover is None:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+    token = _current_claim.set((user_id, key))
+    try:
+        result = await (handler() if record is None else recover(record.resource_id))
+        body = schema.model_validate(result).model_dump_json().encode()
+        final = Response(content=body, status_code=status_code, media_type="application/json")
+    except HTTPException as e:
+        if e.status_code >= 500 or e.status_code in _TRANSIENT_STATUSES:
+            await _release(session, user_id, key)
+            raise
+        await session.rollback()
+        final = Response(
+            content=json.dumps({"detail": e.detail}, separators=(",", ":")).encode(),
+            status_code=e.status_code,
+            media_type="application/json",
+        )
+    except Exception:
+        await _release(session, user_id, key)
+        raise
+    finally:
+        _current_claim.reset(token)
+
+    for name in _REPLAYED_HEADERS:
+        if name in response.headers:
+            final.headers[name] = response.headers[name]
+    await _store(session, user_id, key, final)
+    return final
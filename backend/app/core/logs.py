@@ -0,0 +1,180 @@
+# app/core/logs.py
+
+"""
+Non-blocking application logging
+
+Responsibilities:
+- Route log records through a bounded in-memory queue (QueueHandler) to a
+  background thread (QueueListener) that formats and writes them, so the
+  event loop never blocks on stream or file I/O; records are dropped and
+  counted when the queue is full
+- Format lazily: records keep their %-style args until the listener thread
+  renders them, and filtered-out records are never formatted at all
+- One JSON object per line (LOG_JSON), with `extra=` fields included
+- Sample INFO/DEBUG records per logger (LOG_SAMPLE_RATES, e.g. one router
+  module) and rate limit repeated warnings per message template
+
+Log with %-style arguments (logger.warning("Login failed: %s", email)),
+not f-strings, so that formatting is deferred and rate limiting can group
+records by their template.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Tuple
+
+from app.core.config import settings
+
+log_stats = {"dropped": 0, "sampled_out": 0, "rate_limited": 0}
+
+# Attributes every LogRecord has; anything else came from extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of INFO/DEBUG records per logger name prefix; warnings and above always pass"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Longest prefix first, so app.api.v1.auth overrides app.api
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                if random.random() < rate:
+                    return True
+                log_stats["sampled_out"] += 1
+                return False
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Pass at most `burst` warnings per (logger, message template) per `window`
+    seconds. The first record let through after a suppressed stretch carries
+    the number of records dropped in `suppressed`.
+    """
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._windows: Dict[Tuple[str, str], List[float]] = {}  # key -> [window start, passed, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        state = self._windows.get(key)
+        if state is None or now - state[0] >= self.window:
+            if len(self._windows) > 10_000:
+                self._windows.clear()
+            suppressed = state[2] if state is not None else 0
+            state = self._windows[key] = [now, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed
+        if state[1] >= self.burst:
+            state[2] += 1
+            log_stats["rate_limited"] += 1
+            return False
+        state[1] += 1
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that defers message formatting to the listener and drops records when full"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The base class formats here, on the logging thread; only render the
+        # traceback (its frames may change once the except block ends)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats["dropped"] += 1
+
+
+class LogPipeline:
+    """Owns the queue listeners; each attached logger gets its own queue and writer thread"""
+
+    def __init__(self):
+        self._listeners: List[QueueListener] = []
+        atexit.register(self.stop)
+
+    def attach(self, logger: logging.Logger, *handlers: logging.Handler, filters=()) -> QueueHandler:
+        log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        for log_filter in filters:
+            queue_handler.addFilter(log_filter)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        self._listeners.append(listener)
+        logger.addHandler(queue_handler)
+        return queue_handler
+
+    def stop(self):
+        """Flush queued records and stop the writer threads"""
+        while self._listeners:
+            self._listeners.pop().stop()
+
+
+log_pipeline = LogPipeline()
+
+
+def configure_logging():
+    """Replace the root logger's handlers with the queue pipeline (idempotent)"""
+    root = logging.getLogger()
+    if any(isinstance(h, NonBlockingQueueHandler) for h in root.handlers):
+        return
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO if settings.DEBUG else settings.LOG_LEVEL)
+
+    stream = logging.StreamHandler(sys.stderr)
+    if settings.LOG_JSON:
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+    log_pipeline.attach(
+        root,
+        stream,
+        filters=(
+            SamplingFilter(settings.LOG_SAMPLE_RATES),
+            RateLimitFilter(settings.LOG_RATE_LIMIT_BURST, settings.LOG_RATE_LIMIT_WINDOW_SECONDS),
+        ),
+    )
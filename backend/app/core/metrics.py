@@ -0,0 +1,233 @@
+# app/core/metrics.py
+
+"""
+Request metrics in Prometheus text format
+
+Responsibilities:
+- ASGI middleware recording request counts by status class and a latency
+  histogram per (method, route template), plus requests in flight per method
+- Plain dict/list counters: every update happens on the event loop thread,
+  so no locks are needed
+- Optional multi-worker aggregation: each process snapshots its counters to
+  METRICS_DIR/metrics-<pid>.json and /metrics merges all snapshots
+
+Routes are labelled by template (/api/v1/orders/{order_id}) so label
+cardinality stays bounded; requests that match no route are "unmatched".
+"""
+
+import asyncio
+import bisect
+import glob
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Key = Tuple[str, str]  # (method, route template)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, str], int] = {}   # (method, route, status class) -> count
+        self.latency: Dict[Key, List[float]] = {}              # per-bucket counts, then sum and count
+        self.in_flight: Dict[str, int] = {}                    # method -> requests being served
+
+    def started(self, method: str):
+        self.in_flight[method] = self.in_flight.get(method, 0) + 1
+
+    def finished(self, method: str, route: str, status_code: int, duration: float):
+        self.in_flight[method] -= 1
+        counter = (method, route, f"{status_code // 100}xx")
+        self.requests[counter] = self.requests.get(counter, 0) + 1
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+        histogram[bisect.bisect_left(BUCKETS, duration)] += 1
+        histogram[-2] += duration
+        histogram[-1] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": [[*k, v] for k, v in self.requests.items()],
+            "latency": [[*k, v] for k, v in self.latency.items()],
+            "in_flight": [[k, v] for k, v in self.in_flight.items()],
+        }
+
+
+request_metrics = RequestMetrics()
+
+
+def route_template(scope) -> str:
+    """
+    Template of the matched route, including router prefixes.
+    Included routes report their own path (/animals/{animal_id}); the prefix is
+    the leading part of the request path with the same number of segments left over.
+    """
+    route = getattr(scope.get("route"), "path", None)
+    if route is None:
+        return "unmatched"
+    segments = scope["path"].split("/")
+    extra = len(segments) - len(route.split("/"))
+    return "/".join(segments[:extra + 1]) + route if extra > 0 else route
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware overhead; streaming responses pass through)"""
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # The route is only known after routing, so in-flight requests are counted per method
+        method = scope["method"]
+        self.metrics.started(method)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.finished(method, route_template(scope), status_code, time.perf_counter() - start)
+
+
+# ----------------------------
+# Multi-process snapshots
+# ----------------------------
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(settings.METRICS_DIR, f"metrics-{pid}.json")
+
+
+def write_snapshot(metrics: RequestMetrics = request_metrics):
+    """Atomically replace this process's snapshot file"""
+    path = _snapshot_path(os.getpid())
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(metrics.snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _merge(snapshots: List[Tuple[dict, bool]]) -> dict:
+    """Sum counters from every snapshot; gauges only from processes that are still writing"""
+    requests: Dict[tuple, int] = {}
+    latency: Dict[tuple, List[float]] = {}
+    in_flight: Dict[str, int] = {}
+    for snapshot, live in snapshots:
+        for *key, value in snapshot["requests"]:
+            requests[tuple(key)] = requests.get(tuple(key), 0) + value
+        for *key, values in snapshot["latency"]:
+            total = latency.setdefault(tuple(key), [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+        if live:
+            for method, value in snapshot["in_flight"]:
+                in_flight[method] = in_flight.get(method, 0) + value
+    return {"requests": requests, "latency": latency, "in_flight": in_flight}
+
+
+def collect(metrics: RequestMetrics = request_metrics) -> dict:
+    """This process's counters, or the sum over all workers when METRICS_DIR is set"""
+    if not settings.METRICS_DIR:
+        return _merge([(metrics.snapshot(), True)])
+    write_snapshot(metrics)
+    live_after = time.time() - 3 * settings.METRICS_FLUSH_INTERVAL_SECONDS
+    snapshots = []
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "metrics-*.json")):
+        try:
+            with open(path) as f:
+                snapshots.append((json.load(f), os.path.getmtime(path) >= live_after))
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping metrics snapshot %s: %s", path, e)
+    return _merge(snapshots)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def render(metrics: RequestMetrics = request_metrics) -> str:
+    data = collect(metrics)
+    lines = [
+        "# HELP http_requests_total HTTP requests by route template and status class.",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, route, status_class), value in sorted(data["requests"].items()):
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status_class)} {value}")
+
+    lines += [
+        "# HELP http_request_duration_seconds HTTP request latency by route template.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), values in sorted(data["latency"].items()):
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), values[:len(BUCKETS) + 1]):
+            cumulative += count
+            lines.append(
+                f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le=bound)} {cumulative}"
+            )
+        lines.append(f"http_request_duration_seconds_sum{_labels(method=method, route=route)} {values[-2]}")
+        lines.append(f"http_request_duration_seconds_count{_labels(method=method, route=route)} {values[-1]}")
+
+    lines += [
+        "# HELP http_requests_in_progress HTTP requests currently being served.",
+        "# TYPE http_requests_in_progress gauge",
+    ]
+    for method, value in sorted(data["in_flight"].items()):
+        lines.append(f"http_requests_in_progress{_labels(method=method)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsFlusher:
+    """Writes this worker's snapshot every METRICS_FLUSH_INTERVAL_SECONDS (only with METRICS_DIR)"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None and settings.METRICS_DIR:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            write_snapshot()
+
+    async def _run(self):
+        while True:
+            try:
+                write_snapshot()
+            except OSError as e:
+                logger.error("Writing metrics snapshot failed: %s", e)
+            await asyncio.sleep(settings.METRICS_FLUSH_INTERVAL_SECONDS)
+
+
+metrics_flusher = MetricsFlusher()
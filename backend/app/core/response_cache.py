@@ -0,0 +1,207 @@
+# app/core/response_cache.py
+
+"""
+Precompressed response cache for anonymous public GETs
+
+Responsibilities:
+- Serve repeated anonymous GETs under RESPONSE_CACHE_PATHS (the catalog)
+  from memory, skipping the query, serialization and compression
+- Store each response once as identity bytes and, when large enough,
+  gzip bytes compressed a single time; the variant is picked per request
+  from Accept-Encoding
+- Key entries by path, normalized (sorted) query string and Origin (the
+  CORS headers are part of the stored response)
+- Invalidate through catalog_generation, which every catalog write bumps;
+  the TTL bounds staleness for writes made by other worker processes
+- Bound the cache by total bytes, evicting least recently used entries
+
+Sits outside GZipMiddleware: on a miss the request is passed on without
+Accept-Encoding so the inner app returns identity bytes to store.
+Requests with credentials (Authorization, Cookie) always bypass the cache.
+The matched route is copied to the outer scope (and kept for hits) so
+metrics label cached requests by route.
+"""
+
+import gzip
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from app.core.cache import catalog_generation
+from app.core.config import settings
+
+response_cache_stats = {"hits": 0, "misses": 0, "bypassed": 0, "stored": 0, "evicted": 0}
+
+# Same threshold as GZipMiddleware; smaller bodies are served uncompressed
+GZIP_MINIMUM_SIZE = 1000
+
+_SKIPPED_HEADERS = {b"content-length", b"content-encoding"}
+
+
+@dataclass
+class CachedResponse:
+    generation: int
+    expires_at: float
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    identity: bytes
+    gzipped: Optional[bytes]
+    route: Any = None  # matched route, put back on the scope of hits
+
+    @property
+    def size(self) -> int:
+        return len(self.identity) + len(self.gzipped or b"") + sum(len(k) + len(v) for k, v in self.headers)
+
+
+class ResponseCache:
+    """LRU map of CachedResponse bounded by total body and header bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.generation != catalog_generation.value or entry.expires_at <= time.monotonic():
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: tuple, entry: CachedResponse):
+        # One entry may use at most a quarter of the budget
+        if entry.size > self.max_bytes // 4:
+            return
+        self.pop(key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+        response_cache_stats["stored"] += 1
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.size
+            response_cache_stats["evicted"] += 1
+
+    def pop(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_BYTES)
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def cache_key(scope) -> tuple:
+    query = scope.get("query_string", b"").decode("latin-1")
+    normalized = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    return scope["path"], normalized, _header(scope, b"origin")
+
+
+def _accepts_gzip(scope) -> bool:
+    accept = _header(scope, b"accept-encoding")
+    return accept is not None and b"gzip" in accept
+
+
+class ResponseCacheMiddleware:
+    """Pure ASGI middleware serving and filling the response cache"""
+
+    def __init__(self, app, cache: ResponseCache = response_cache):
+        self.app = app
+        self.cache = cache
+        self.paths = tuple(settings.RESPONSE_CACHE_PATHS)
+
+    def _cacheable(self, scope) -> bool:
+        return (
+            scope["type"] == "http"
+            and scope["method"] == "GET"
+            and scope["path"].startswith(self.paths)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if not self._cacheable(scope):
+            await self.app(scope, receive, send)
+            return
+        if _header(scope, b"authorization") is not None or _header(scope, b"cookie") is not None:
+            response_cache_stats["bypassed"] += 1
+            await self.app(scope, receive, send)
+            return
+
+        key = cache_key(scope)
+        entry = self.cache.get(key)
+        if entry is not None:
+            response_cache_stats["hits"] += 1
+            if entry.route is not None:
+                scope["route"] = entry.route
+            await self._send(entry, _accepts_gzip(scope), b"HIT", send)
+            return
+        response_cache_stats["misses"] += 1
+
+        # Read before the request runs, so a write during it leaves the entry stale
+        generation = catalog_generation.value
+        inner_scope = {**scope, "headers": [(k, v) for k, v in scope["headers"] if k != b"accept-encoding"]}
+        start: dict = {}
+        chunks: List[bytes] = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(inner_scope, receive, capture)
+        # Routing records the matched route on the scope it was given; pass it
+        # back so outer middleware (metrics) can label the request
+        route = inner_scope.get("route")
+        if route is not None:
+            scope["route"] = route
+
+        identity = b"".join(chunks)
+        headers = [(k, v) for k, v in start.get("headers", []) if k.lower() not in _SKIPPED_HEADERS]
+        gzipped = None
+        if settings.ENABLE_GZIP and len(identity) >= GZIP_MINIMUM_SIZE:
+            gzipped = gzip.compress(identity, compresslevel=9, mtime=0)
+        entry = CachedResponse(
+            generation=generation,
+            expires_at=time.monotonic() + settings.RESPONSE_CACHE_TTL_SECONDS,
+            status=start.get("status", 500),
+            headers=headers,
+            identity=identity,
+            gzipped=gzipped,
+            route=route,
+        )
+        if entry.status == 200:
+            self.cache.set(key, entry)
+        await self._send(entry, _accepts_gzip(scope), b"MISS", send)
+
+    @staticmethod
+    async def _send(entry: CachedResponse, accepts_gzip: bool, cache_status: bytes, send):
+        headers = list(entry.headers)
+        body = entry.identity
+        if entry.gzipped is not None:
+            if not any(k.lower() == b"vary" and b"accept-encoding" in v.lower() for k, v in headers):
+                headers.append((b"vary", b"Accept-Encoding"))
+            if accepts_gzip:
+                body = entry.gzipped
+                headers.append((b"content-encoding", b"gzip"))
+        headers.append((b"content-length", str(len(body)).encode()))
+        headers.append((b"x-cache", cache_status))
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -19,6 +19,7 @@ from sqlalchemy import select
 
 from app.core.config import settings
 from app.core.database import get_session
+from app.core.timing import span
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +28,8 @@ def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
     password_bytes = password.encode('utf-8')
     salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
+    with span("bcrypt"):
+        hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
 
@@ -36,14 +38,16 @@ def verify_password(password: str, hashed: str) -> bool:
     try:
         password_bytes = password.encode('utf-8')
         hashed_bytes = hashed.encode('utf-8')
-        return bcrypt.checkpw(password_bytes, hashed_bytes)
+        with span("bcrypt"):
+            return bcrypt.checkpw(password_bytes, hashed_bytes)
     except Exception as e:
-        logger.error(f"Password verification error: {e}")
+        logger.error("Password verification error: %s", e)
         return False
 
 
 # OAuth2 bearer
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False)
 
 
 class TokenPayload(BaseModel):
@@ -82,23 +86,37 @@ def decode_token(token: str) -> Dict[str, Any]:
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_session)):
-    payload = decode_token(token)
     from app.models.user import User as UserModel  # lazy import
 
-    stmt = select(UserModel).where(UserModel.id == int(payload.get("sub", 0)))
-    res = await db.execute(stmt)
-    user = res.scalar_one_or_none()
+    with span("auth"):
+        payload = decode_token(token)
+        stmt = select(UserModel).where(UserModel.id == int(payload.get("sub", 0)))
+        res = await db.execute(stmt)
+        user = res.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
 
+async def get_optional_user(token: Optional[str] = Depends(oauth2_scheme_optional), db: AsyncSession = Depends(get_session)):
+    """Resolve the current user if a bearer token is sent, otherwise None (anonymous)"""
+    if not token:
+        return None
+    return await get_current_user(token, db)
+
+
 def require_farmer(user=Depends(get_current_user)):
     if getattr(user, "role", None) != "farmer":
         raise HTTPException(status_code=403, detail="Farmer only operation")
     return user
 
 
+def require_admin(user=Depends(get_current_user)):
+    if getattr(user, "role", None) != "admin":
+        raise HTTPException(status_code=403, detail="Admin only operation")
+    return user
+
+
 def require_buyer(user=Depends(get_current_user)):
     if getattr(user, "role", None) not in ("user", "buyer"):
         raise HTTPException(status_code=403, detail="Buyer only operation")
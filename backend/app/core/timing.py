@@ -0,0 +1,257 @@
+# app/core/timing.py
+
+"""
+Request-scoped timing spans (Server-Timing)
+
+Responsibilities:
+- Sample a fraction of requests (SERVER_TIMING_SAMPLE_RATE) and collect named
+  spans for them in a context variable; unsampled requests pay one
+  ContextVar lookup per instrumentation point
+- Spans: deps (dependency resolution), handler (endpoint body), serialize
+  (response validation and rendering) via TimedRoute; db (SQL execution,
+  with query count) via engine events; auth and bcrypt from app.core.security
+- Emit them as one JSON trace record per request in a size-rotated local
+  file (SERVER_TIMING_TRACE_FILE) and, for trusted callers only, as a
+  Server-Timing header: auth/bcrypt timings would let anyone probe
+  /auth/login for registered emails
+
+Trusted means DEBUG is on or the request sends X-Server-Timing-Token equal
+to SERVER_TIMING_TOKEN; such requests are always timed, not sampled.
+
+Spans may overlap (auth includes its db query); "total" is the time until
+the response headers were sent.
+"""
+
+import functools
+import hmac
+import inspect
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.logs import log_pipeline
+from app.core.metrics import route_template
+
+_current: ContextVar[Optional["RequestTiming"]] = ContextVar("request_timing", default=None)
+
+trace_logger = logging.getLogger("app.timing")
+trace_logger.propagate = False
+
+
+class RequestTiming:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: Dict[str, List[float]] = {}  # name -> [seconds, count]
+        self.entered: Optional[float] = None     # endpoint start / end, set by TimedRoute
+        self.returned: Optional[float] = None
+
+    def add(self, name: str, seconds: float):
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            span[0] += seconds
+            span[1] += 1
+
+    def header(self, total: float) -> str:
+        parts = []
+        for name, (seconds, count) in self.spans.items():
+            part = f"{name};dur={seconds * 1000:.2f}"
+            if count > 1:
+                part += f';desc="{count}x"'
+            parts.append(part)
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def record(name: str, seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into the current request's spans (no-op for unsampled requests)"""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+# ----------------------------
+# SQL execution
+# ----------------------------
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("timing_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("timing_query_start")
+    if starts:
+        record("db", time.perf_counter() - starts.pop())
+
+
+# ----------------------------
+# Route phases
+# ----------------------------
+class TimedRoute(APIRoute):
+    """
+    APIRoute that splits a request into deps / handler / serialize spans.
+    The endpoint is wrapped (keeping its signature for dependency injection),
+    so the time before it starts is dependency resolution and the time after
+    it returns is response serialization.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, self._wrap(endpoint), **kwargs)
+
+    @staticmethod
+    def _wrap(endpoint):
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed(*args, **kwargs):
+                timing = _current.get()
+                if timing is None:
+                    return await endpoint(*args, **kwargs)
+                timing.entered = time.perf_counter()
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    timing.returned = time.perf_counter()
+                    timing.add("handler", timing.returned - timing.entered)
+        else:
+            @functools.wraps(endpoint)
+            def timed(*args, **kwargs):
+                timing = _current.get()
+                if timing is None:
+                    return endpoint(*args, **kwargs)
+                timing.entered = time.perf_counter()
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    timing.returned = time.perf_counter()
+                    timing.add("handler", timing.returned - timing.entered)
+        return timed
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timing = _current.get()
+            if timing is None:
+                return await handler(request)
+            start = time.perf_counter()
+            response = await handler(request)
+            end = time.perf_counter()
+            if timing.entered is not None:
+                timing.add("deps", timing.entered - start)
+                timing.add("serialize", end - timing.returned)
+            return response
+
+        return timed_handler
+
+
+# ----------------------------
+# Middleware
+# ----------------------------
+class _TraceFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg)
+
+
+def configure_trace_file():
+    """Attach the rotating JSON trace file to the app.timing logger (once); writes happen off the event loop"""
+    if not settings.SERVER_TIMING_TRACE_FILE or trace_logger.handlers:
+        return
+    handler = RotatingFileHandler(
+        settings.SERVER_TIMING_TRACE_FILE,
+        maxBytes=settings.SERVER_TIMING_TRACE_MAX_BYTES,
+        backupCount=settings.SERVER_TIMING_TRACE_BACKUPS,
+    )
+    handler.setFormatter(_TraceFormatter())
+    log_pipeline.attach(trace_logger, handler)
+    trace_logger.setLevel(logging.INFO)
+
+
+def _trusted(scope) -> bool:
+    """May this caller see its timings (DEBUG, or the X-Server-Timing-Token header matches)?"""
+    if settings.DEBUG:
+        return True
+    if not settings.SERVER_TIMING_TOKEN:
+        return False
+    for key, value in scope["headers"]:
+        if key == b"x-server-timing-token":
+            return hmac.compare_digest(value, settings.SERVER_TIMING_TOKEN.encode())
+    return False
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware: samples requests, writes trace records, adds Server-Timing for trusted callers"""
+
+    def __init__(self, app):
+        self.app = app
+        configure_trace_file()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trusted = _trusted(scope)
+        if not trusted and random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        status_code = 500
+        total = None
+
+        async def send_wrapper(message):
+            nonlocal status_code, total
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                total = time.perf_counter() - timing.start
+                if trusted:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timing.header(total).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if trace_logger.handlers:
+                # Serialized by _TraceFormatter on the log writer thread
+                trace_logger.info({
+                    "ts": datetime.now(timezone.utc).isoformat(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route_template(scope),
+                    "status": status_code,
+                    "total_ms": round((total if total is not None else time.perf_counter() - timing.start) * 1000, 3),
+                    "spans": {
+                        name: {"ms": round(seconds * 1000, 3), "count": count}
+                        for name, (seconds, count) in timing.spans.items()
+                    },
+                })
@@ -11,7 +11,7 @@ Responsibilities:
 """
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
@@ -19,13 +19,21 @@ import logging
 
 from app.core.config import settings
 from app.core.database import init_db, close_db
-from app.api.v1 import auth, animals, cart, orders, payments, users
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO if settings.DEBUG else logging.WARNING,
-    format="%(asctime)s - %(levelname)s - %(message)s",
+from app.core.logs import configure_logging
+from app.core.response_cache import ResponseCacheMiddleware
+from app.core.timing import ServerTimingMiddleware
+from app.core.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, metrics_flusher, render as render_metrics
 )
+from app.api.v1 import auth, animals, cart, orders, payments, users, analytics, farmers
+from app.services.cart_store import cart_store
+from app.services.order_expiry import order_expiry_sweeper
+from app.services.outbox import outbox_worker
+from app.services.payment_gateway import payment_gateway
+from app.services.reservation_service import reservation_sweeper
+
+# Configure logging (queued; written by a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -55,17 +63,29 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Cart-Session", "X-Next-Cursor", "ETag", "Idempotent-Replayed", "Server-Timing", "X-Cache"],
     )
 
     if settings.ENABLE_GZIP:
         app.add_middleware(GZipMiddleware, minimum_size=1000)
 
+    # Outside GZip: stores identity bytes and compresses them once per entry
+    if settings.RESPONSE_CACHE_ENABLED:
+        app.add_middleware(ResponseCacheMiddleware)
+
     if settings.ENVIRONMENT == "production" and settings.ALLOWED_HOSTS:
         app.add_middleware(
             TrustedHostMiddleware,
             allowed_hosts=settings.ALLOWED_HOSTS,
         )
 
+    if settings.SERVER_TIMING_SAMPLE_RATE > 0 or settings.SERVER_TIMING_TOKEN:
+        app.add_middleware(ServerTimingMiddleware)
+
+    # Outermost, so timings include compression and host checks
+    if settings.ENABLE_METRICS:
+        app.add_middleware(MetricsMiddleware)
+
     # Mount routers under /api/v1 prefix
     # Note: Each router already has its own prefix (e.g., /auth, /animals)
     app.include_router(auth.router, prefix="/api/v1")
@@ -74,6 +94,8 @@ def create_app() -> FastAPI:
     app.include_router(cart.router, prefix="/api/v1")
     app.include_router(orders.router, prefix="/api/v1")
     app.include_router(payments.router, prefix="/api/v1")
+    app.include_router(analytics.router, prefix="/api/v1")
+    app.include_router(farmers.router, prefix="/api/v1")
 
     # Root endpoint - API information
     @app.get("/", tags=["root"])
@@ -93,10 +115,17 @@ def create_app() -> FastAPI:
         """Simple health check endpoint"""
         return {"status": "healthy", "service": settings.PROJECT_NAME, "version": settings.VERSION}
 
+    # Prometheus scrape endpoint
+    if settings.ENABLE_METRICS:
+        @app.get("/metrics", tags=["health"], include_in_schema=False)
+        async def metrics():
+            """Request counters, latency histograms and in-flight gauges (summed over workers with METRICS_DIR)"""
+            return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
     # Global exception handler example
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
-        logger.error(f"Unhandled exception: {exc}")
+        logger.error("Unhandled exception on %s %s", request.method, request.url.path, exc_info=exc)
         return JSONResponse(
             status_code=500,
             content={"detail": "Internal server error occurred. Please try again later."},
@@ -105,13 +134,25 @@ def create_app() -> FastAPI:
     # Startup event
     @app.on_event("startup")
     async def on_startup():
-        logger.info(f"🚀 Starting {settings.PROJECT_NAME} v{settings.VERSION}")
+        logger.info("🚀 Starting %s v%s", settings.PROJECT_NAME, settings.VERSION)
         await init_db()
+        await metrics_flusher.start()
+        await cart_store.start()
+        await payment_gateway.start()
+        await outbox_worker.start()
+        await order_expiry_sweeper.start()
+        await reservation_sweeper.start()
 
     # Shutdown event
     @app.on_event("shutdown")
     async def on_shutdown():
-        logger.info(f"👋 Shutting down {settings.PROJECT_NAME}")
+        logger.info("👋 Shutting down %s", settings.PROJECT_NAME)
+        await reservation_sweeper.stop()
+        await order_expiry_sweeper.stop()
+        await outbox_worker.stop()
+        await payment_gateway.stop()
+        await cart_store.stop()
+        await metrics_flusher.stop()
         await close_db()
 
     return app
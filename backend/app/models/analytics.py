@@ -0,0 +1,40 @@
+# app/models/analytics.py
+
+"""
+SQLModel model for precomputed sales rollups
+
+Responsibilities:
+- One row per (farmer, day, species, order status) bucket; species is the
+  one recorded on the order line at checkout
+- One order count per (farmer, day, order status): a multi-species order
+  counts once in every species bucket, so species rows cannot be summed
+- Maintained incrementally by checkout / status / payment transactions
+- Keep table lean; aggregation logic lives in AnalyticsService
+"""
+
+from sqlmodel import SQLModel, Field
+
+
+class SalesRollup(SQLModel, table=True):
+    __tablename__ = "sales_rollups"
+
+    farmer_id: int = Field(foreign_key="farmers.id", primary_key=True)
+    day: str = Field(primary_key=True)  # YYYY-MM-DD (UTC) of the order
+    species: str = Field(primary_key=True)
+    status: str = Field(primary_key=True)  # order status the counts are currently in
+
+    order_count: int = Field(default=0)  # orders with at least one line in this bucket
+    item_count: int = Field(default=0)   # order lines
+    quantity: int = Field(default=0)
+    revenue: float = Field(default=0.0)
+
+
+class OrderRollup(SQLModel, table=True):
+    """Orders per (farmer, day, status) regardless of species; sums across species stay exact"""
+    __tablename__ = "order_rollups"
+
+    farmer_id: int = Field(foreign_key="farmers.id", primary_key=True)
+    day: str = Field(primary_key=True)
+    status: str = Field(primary_key=True)
+
+    order_count: int = Field(default=0)  # orders with at least one of the farmer's lines
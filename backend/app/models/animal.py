@@ -31,7 +31,10 @@ class Animal(SQLModel, table=True):
     age: Optional[int] = None
     gender: Optional[str] = None
     price: float = Field(default=0.0)
-    available: bool = Field(default=True)
+    available: bool = Field(default=True)  # listed and in stock
+    stock: int = Field(default=1, sa_column_kwargs={"server_default": "1"})      # units left to sell
+    reserved: int = Field(default=0, sa_column_kwargs={"server_default": "0"})   # units held by carts (sum of cart_reservations)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})  # optimistic concurrency counter
 
     farmer_id: int = Field(foreign_key="farmers.id", nullable=False, index=True)
 
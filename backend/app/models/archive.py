@@ -0,0 +1,75 @@
+# app/models/archive.py
+
+"""
+SQLModel models for archived (cold) orders, order items and payments
+
+Responsibilities:
+- Mirror the hot tables column-for-column so rows can be moved with INSERT ... SELECT
+- Index only what historical reads need (buyer history, farmer feed, order and transaction lookup)
+- Keep models lean; the archival job lives in ArchiveService
+"""
+
+from typing import Optional, List
+from datetime import datetime
+from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Column, DateTime, Index
+
+
+class ArchivedOrder(SQLModel, table=True):
+    __tablename__ = "archived_orders"
+    __table_args__ = (
+        Index("ix_archived_orders_buyer_id_created_at", "buyer_id", "created_at"),
+        # MAX(created_at) tells readers whether a date range reaches the archive
+        Index("ix_archived_orders_created_at", "created_at"),
+    )
+
+    id: int = Field(primary_key=True)  # same id as the hot row it came from
+    buyer_id: int = Field(nullable=False)
+    status: str
+    total_price: float = Field(default=0.0)
+    is_paid: bool = Field(default=False)
+    version: int = Field(default=1)
+
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+    updated_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True), nullable=True))
+
+    items: Optional[List["ArchivedOrderItem"]] = Relationship(back_populates="order")
+
+
+class ArchivedOrderItem(SQLModel, table=True):
+    __tablename__ = "archived_order_items"
+    __table_args__ = (
+        Index("ix_archived_order_items_farmer_id_created_at", "farmer_id", "created_at"),
+    )
+
+    id: int = Field(primary_key=True)
+    order_id: int = Field(foreign_key="archived_orders.id", nullable=False, index=True)
+    animal_id: int = Field(nullable=False)
+    farmer_id: Optional[int] = Field(default=None)
+    species: str = Field(default="unknown", sa_column_kwargs={"server_default": "unknown"})
+    quantity: int = Field(default=1)
+    price: float = Field(default=0.0)
+
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+    updated_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True), nullable=True))
+
+    order: Optional[ArchivedOrder] = Relationship(back_populates="items")
+
+
+class ArchivedPayment(SQLModel, table=True):
+    __tablename__ = "archived_payments"
+    __table_args__ = (
+        # Payments can be created after their order; payment history needs its own watermark
+        Index("ix_archived_payments_created_at", "created_at"),
+    )
+
+    id: int = Field(primary_key=True)
+    order_id: int = Field(foreign_key="archived_orders.id", nullable=False, index=True)
+    amount: float = Field(default=0.0)
+    status: str
+    method: str
+    transaction_id: Optional[str] = Field(default=None, unique=True, index=True)
+    version: int = Field(default=1)
+
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+    updated_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True), nullable=True))
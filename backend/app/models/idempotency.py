@@ -0,0 +1,37 @@
+# app/models/idempotency.py
+
+"""
+SQLModel model for stored idempotent responses
+
+Responsibilities:
+- One row per (user, Idempotency-Key)
+- Hold the exact response bytes so retries replay byte-for-byte
+- Record the resource the request created, in the handler's own transaction
+- Expire via an indexed expires_at column
+"""
+
+from typing import Optional
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, LargeBinary, UniqueConstraint
+
+
+class IdempotencyKey(SQLModel, table=True):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="users.id", nullable=False)
+    key: str = Field(max_length=255, nullable=False)
+    request_hash: str = Field(nullable=False)  # method + path + body, to reject key reuse
+
+    # NULL status_code means the first request is still executing
+    status_code: Optional[int] = Field(default=None)
+    body: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary, nullable=True))
+    headers: Optional[str] = Field(default=None)  # JSON object of replayed headers
+    # Order/payment id committed together with the handler's writes; set while
+    # status_code is NULL it means "done, response not stored yet"
+    resource_id: Optional[int] = Field(default=None)
+
+    created_at: datetime = Field(nullable=False)
+    expires_at: datetime = Field(nullable=False, index=True)
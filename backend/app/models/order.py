@@ -13,7 +13,7 @@ Responsibilities:
 from typing import Optional, List, TYPE_CHECKING
 from datetime import datetime, timezone
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column, DateTime, func
+from sqlalchemy import Column, DateTime, Index, func
 
 if TYPE_CHECKING:
     from app.models.user import User  # type: ignore
@@ -23,12 +23,22 @@ if TYPE_CHECKING:
 
 class Order(SQLModel, table=True):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Buyer order history: WHERE buyer_id = ? [AND status = ?] ORDER BY created_at DESC
+        Index("ix_orders_buyer_id_created_at", "buyer_id", "created_at"),
+        Index("ix_orders_buyer_id_status_created_at", "buyer_id", "status", "created_at"),
+        # Expiry sweeper: WHERE status = 'pending' AND created_at < ?
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        # Never hand out the id of an archived order again
+        {"sqlite_autoincrement": True},
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     buyer_id: int = Field(foreign_key="users.id", nullable=False, index=True)
-    status: str = Field(default="pending", index=True)  # pending, confirmed, rejected, paid
+    status: str = Field(default="pending", index=True)  # pending, confirmed, rejected, paid, expired
     total_price: float = Field(default=0.0)
     is_paid: bool = Field(default=False)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})  # optimistic concurrency counter
 
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
@@ -47,12 +57,23 @@ class Order(SQLModel, table=True):
 
 class OrderItem(SQLModel, table=True):
     __tablename__ = "order_items"
+    __table_args__ = (
+        # Farmer order feed: WHERE farmer_id = ? ORDER BY created_at DESC
+        Index("ix_order_items_farmer_id_created_at", "farmer_id", "created_at"),
+        {"sqlite_autoincrement": True},
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     order_id: int = Field(foreign_key="orders.id", nullable=False, index=True)
     animal_id: int = Field(foreign_key="animals.id", nullable=False, index=True)
+    # Denormalized from animals.farmer_id at checkout (avoids joining animals)
+    farmer_id: Optional[int] = Field(default=None, foreign_key="farmers.id")
+    # Species at checkout: the rollup bucket, kept even if the animal is edited or deleted
+    species: str = Field(default="unknown", sa_column_kwargs={"server_default": "unknown"})
     quantity: int = Field(default=1)
     price: float = Field(default=0.0)  # capture price at time of order
+    # Units checkout took from animals.stock (0 for orders placed before stock tracking)
+    stock_taken: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
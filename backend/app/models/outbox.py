@@ -0,0 +1,34 @@
+# app/models/outbox.py
+
+"""
+SQLModel model for the transactional outbox
+
+Responsibilities:
+- Record post-commit work in the same transaction as the change that caused it
+- Track delivery state, attempts and the next retry time
+- Keep table lean; dispatch logic lives in app.services.outbox
+"""
+
+from typing import Optional
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
+
+
+class OutboxEvent(SQLModel, table=True):
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Claim query: WHERE status = 'pending' AND available_at <= now ORDER BY id
+        Index("ix_outbox_events_status_available_at", "status", "available_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    topic: str = Field(nullable=False)
+    payload: str = Field(default="{}")  # JSON
+    status: str = Field(default="pending")  # pending, processing, failed
+    attempts: int = Field(default=0)
+    last_error: Optional[str] = Field(default=None)
+
+    created_at: datetime = Field(nullable=False)
+    available_at: datetime = Field(nullable=False)  # not claimed before this time (retry backoff)
+    locked_at: Optional[datetime] = Field(default=None)
@@ -7,12 +7,13 @@ Responsibilities:
 - Define the Payment table
 - Track payment status and method
 - Link to orders via foreign key
+- Enforce unique provider transaction ids and one completed payment per order
 """
 
 from typing import Optional, TYPE_CHECKING
 from datetime import datetime, timezone
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column, DateTime, func
+from sqlalchemy import Column, DateTime, Index, func, text
 
 if TYPE_CHECKING:
     from app.models.order import Order  # type: ignore
@@ -20,12 +21,23 @@ if TYPE_CHECKING:
 
 class Payment(SQLModel, table=True):
     __tablename__ = "payments"
+    __table_args__ = (
+        # At most one completed payment per order (partial unique index)
+        Index(
+            "uq_payments_order_id_completed", "order_id", unique=True,
+            sqlite_where=text("status = 'completed'"), postgresql_where=text("status = 'completed'"),
+        ),
+        # Never hand out the id of an archived payment again
+        {"sqlite_autoincrement": True},
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     order_id: int = Field(foreign_key="orders.id", nullable=False, index=True)
     amount: float = Field(default=0.0)
-    status: str = Field(default="pending")  # pending, completed, failed
+    status: str = Field(default="pending")  # pending, processing, completed, failed, refund_pending
     method: str = Field(default="mpesa")    # mpesa, card, bank, etc.
+    transaction_id: Optional[str] = Field(default=None, unique=True, index=True)  # provider reference
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})  # optimistic concurrency counter
 
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
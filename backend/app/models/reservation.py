@@ -0,0 +1,28 @@
+# app/models/reservation.py
+
+"""
+SQLModel model for cart stock reservations
+
+Responsibilities:
+- Hold units of an animal's stock for a cart owner for a short time
+- One row per (cart owner, animal); the total is mirrored in Animal.reserved
+- Expire via an indexed expires_at column (see ReservationService.expire)
+"""
+
+from typing import Optional
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+from sqlalchemy import UniqueConstraint
+
+
+class CartReservation(SQLModel, table=True):
+    __tablename__ = "cart_reservations"
+    __table_args__ = (UniqueConstraint("owner", "animal_id", name="uq_cart_reservations_owner_animal_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    owner: str = Field(nullable=False)  # cart owner key: "user:<id>" or "guest:<session>"
+    animal_id: int = Field(foreign_key="animals.id", nullable=False, index=True)
+    quantity: int = Field(default=1)
+
+    created_at: datetime = Field(nullable=False)
+    expires_at: datetime = Field(nullable=False, index=True)
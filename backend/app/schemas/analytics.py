@@ -0,0 +1,25 @@
+# app/schemas/analytics.py
+
+"""
+Pydantic schemas for Analytics
+
+Responsibilities:
+- Define response payloads for sales rollup queries
+- Keep schemas lean; no DB logic
+"""
+
+from typing import Optional
+from pydantic import BaseModel
+
+
+class SalesBucket(BaseModel):
+    """
+    Sales totals for one period (and optional species/status split).
+    """
+    period: str  # YYYY-MM-DD, YYYY-Www or YYYY-MM
+    species: Optional[str] = None
+    status: Optional[str] = None
+    order_count: int
+    item_count: int
+    quantity: int
+    revenue: float
@@ -28,6 +28,7 @@ class AnimalCreate(BaseModel):
     gender: Optional[str] = Field(default=None, max_length=20)
     price: confloat(ge=0.0) = 0.0
     available: Optional[bool] = True
+    stock: int = Field(default=1, ge=0)
 
 
 class AnimalUpdate(BaseModel):
@@ -42,6 +43,7 @@ class AnimalUpdate(BaseModel):
     gender: Optional[str] = Field(default=None, max_length=20)
     price: Optional[confloat(ge=0.0)] = None
     available: Optional[bool] = None
+    stock: Optional[int] = Field(default=None, ge=0)
 
 
 class AnimalRead(BaseModel):
@@ -56,8 +58,18 @@ class AnimalRead(BaseModel):
     gender: Optional[str] = None
     price: float
     available: bool
+    stock: int = 1
+    version: int = 1
     farmer_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     model_config = {"from_attributes": True}
+
+
+class FarmerAnimalRead(AnimalRead):
+    """
+    An animal as its farmer sees it, with units held by carts.
+    Kept out of the public catalog: reservations change on every cart click.
+    """
+    reserved: int = 0
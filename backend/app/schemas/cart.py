@@ -9,7 +9,7 @@ Responsibilities:
 - Separate Create, Update, and Read payloads
 """
 
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
 from pydantic import BaseModel, Field
 from annotated_types import Gt, Ge
@@ -34,12 +34,32 @@ class CartItemUpdate(BaseModel):
     quantity: Optional[int] = Field(default=None, gt=0)
 
 
+class CartOperation(BaseModel):
+    """
+    A single operation within a batch cart update.
+    - add: increase quantity (creates the item if missing)
+    - set: set an absolute quantity (creates the item if missing)
+    - remove: drop the item from the cart
+    """
+    op: Literal["add", "set", "remove"]
+    animal_id: int
+    quantity: int = Field(default=1, gt=0)
+
+
+class CartBatchRequest(BaseModel):
+    """
+    Payload for applying several cart operations in one transaction.
+    Operations are applied in order.
+    """
+    operations: List[CartOperation] = Field(..., min_length=1, max_length=100)
+
+
 class CartItemRead(BaseModel):
     """
     Representation returned by the API for a cart item.
     """
     id: int
-    buyer_id: int
+    buyer_id: Optional[int] = None  # None for guest carts
     animal_id: int
     quantity: int
     price: float
@@ -49,6 +69,21 @@ class CartItemRead(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class CartSummaryLine(BaseModel):
+    """
+    A cart line priced against the live animal row.
+    """
+    item_id: int
+    animal_id: int
+    name: Optional[str] = None
+    quantity: int
+    cart_price: float
+    current_price: Optional[float] = None
+    line_total: float
+    price_changed: bool = False
+    available: bool = True
+
+
 # ----------------------------
 # Cart Schemas
 # ----------------------------
@@ -60,3 +95,15 @@ class CartRead(BaseModel):
     items: List[CartItemRead] = []
 
     model_config = {"from_attributes": True}
+
+
+class CartSummary(BaseModel):
+    """
+    Cart totals at current prices with price-drift and availability flags.
+    Unavailable lines are excluded from the total.
+    """
+    items: List[CartSummaryLine] = []
+    item_count: int = 0
+    total: float = 0.0
+    stale_items: List[int] = []        # animal ids whose price changed since add
+    unavailable_items: List[int] = []  # animal ids sold or removed
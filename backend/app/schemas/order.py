@@ -24,6 +24,7 @@ class OrderItemRead(BaseModel):
     id: int
     order_id: int
     animal_id: int
+    farmer_id: Optional[int] = None
     quantity: int
     price: float
     created_at: datetime
@@ -60,6 +61,7 @@ class OrderRead(BaseModel):
     status: str
     total_price: float
     is_paid: bool
+    version: int = 1
     created_at: datetime
     updated_at: Optional[datetime] = None
     items: Optional[List[OrderItemRead]] = None
@@ -79,3 +81,11 @@ class OrderSummary(BaseModel):
     created_at: datetime
 
     model_config = {"from_attributes": True}
+
+
+class FarmerOrderSummary(OrderSummary):
+    """
+    Order as seen by a farmer: only the farmer's own lines are counted.
+    """
+    item_count: int
+    farmer_total: float
@@ -11,7 +11,7 @@ Responsibilities:
 
 from typing import Optional
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from decimal import Decimal
 
 
@@ -45,6 +45,8 @@ class PaymentRead(BaseModel):
     amount: float
     status: str
     method: str
+    transaction_id: Optional[str] = None
+    version: int = 1
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -61,3 +63,19 @@ class PaymentSummary(BaseModel):
     status: str
 
     model_config = {"from_attributes": True}
+
+
+class PaymentCallback(BaseModel):
+    """
+    Status callback sent by the payment provider.
+    Identifies the payment by our id, the provider transaction id, or both.
+    """
+    payment_id: Optional[int] = None
+    transaction_id: Optional[str] = Field(default=None, max_length=100)
+    status: str = Field(..., pattern="^(completed|failed)$")
+
+    @model_validator(mode="after")
+    def _identified(self):
+        if self.payment_id is None and not self.transaction_id:
+            raise ValueError("payment_id or transaction_id is required")
+        return self
@@ -0,0 +1,50 @@
+# app/schemas/storefront.py
+
+"""
+Pydantic schemas for the public farmer storefront
+
+Responsibilities:
+- Define the storefront payload: profile, listings per species, sales totals
+- Keep schemas lean; no DB logic
+"""
+
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class StorefrontProfile(BaseModel):
+    """
+    Public part of a farmer profile.
+    """
+    id: int
+    name: Optional[str] = None
+    farm_name: Optional[str] = None
+    location: Optional[str] = None
+    bio: Optional[str] = None
+
+
+class SpeciesListing(BaseModel):
+    """
+    Available listings of one species.
+    """
+    species: str
+    listing_count: int
+    stock: int
+    min_price: float
+    max_price: float
+
+
+class StorefrontSales(BaseModel):
+    """
+    Lifetime sales (orders not pending, rejected or expired).
+    """
+    order_count: int = 0
+    quantity: int = 0
+    revenue: float = 0.0
+
+
+class FarmerStorefront(BaseModel):
+    farmer: StorefrontProfile
+    listing_count: int = 0
+    listings: List[SpeciesListing] = []
+    sales: StorefrontSales = StorefrontSales()
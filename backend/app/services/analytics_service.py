@@ -0,0 +1,192 @@
+# app/services/analytics_service.py
+
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import List, Optional
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.analytics import OrderRollup, SalesRollup
+from app.models.order import Order, OrderItem
+
+_METRICS = ("order_count", "item_count", "quantity", "revenue")
+
+# Hot and archived order lines with their order's day and status
+_LINES = """
+    SELECT oi.id, oi.order_id, oi.farmer_id, oi.species, oi.quantity, oi.price,
+           date(o.created_at) AS day, o.status
+    FROM order_items oi JOIN orders o ON o.id = oi.order_id
+    UNION ALL
+    SELECT oi.id, oi.order_id, oi.farmer_id, oi.species, oi.quantity, oi.price,
+           date(o.created_at) AS day, o.status
+    FROM archived_order_items oi JOIN archived_orders o ON o.id = oi.order_id
+"""
+
+
+async def rebuild_rollups(conn):
+    """
+    Recompute every rollup row with set-based statements, in the caller's
+    transaction (a session or a connection). init_db runs it when a rollup
+    table is first created so existing orders are counted.
+    """
+    await conn.execute(delete(SalesRollup))
+    await conn.execute(delete(OrderRollup))
+    await conn.execute(text(f"""
+        INSERT INTO sales_rollups (farmer_id, day, species, status, order_count, item_count, quantity, revenue)
+        SELECT lines.farmer_id, lines.day, lines.species, lines.status,
+               COUNT(DISTINCT lines.order_id), COUNT(lines.id),
+               SUM(lines.quantity), SUM(lines.price * lines.quantity)
+        FROM ({_LINES}) AS lines
+        WHERE lines.farmer_id IS NOT NULL
+        GROUP BY lines.farmer_id, lines.day, lines.species, lines.status
+    """))
+    await conn.execute(text(f"""
+        INSERT INTO order_rollups (farmer_id, day, status, order_count)
+        SELECT lines.farmer_id, lines.day, lines.status, COUNT(DISTINCT lines.order_id)
+        FROM ({_LINES}) AS lines
+        WHERE lines.farmer_id IS NOT NULL
+        GROUP BY lines.farmer_id, lines.day, lines.status
+    """))
+
+
+def _period_key(day: str, period: str) -> str:
+    if period == "month":
+        return day[:7]
+    if period == "week":
+        year, week, _ = date.fromisoformat(day).isocalendar()
+        return f"{year}-W{week:02d}"
+    return day
+
+
+class AnalyticsService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    def _insert(self, model=SalesRollup):
+        dialect = self.session.bind.dialect.name
+        return (postgresql.insert if dialect == "postgresql" else sqlite.insert)(model)
+
+    async def move_order(self, order_id: int, old_status: Optional[str], new_status: Optional[str]):
+        """
+        Move an order's lines between status buckets, in the caller's transaction.
+        old_status=None records a new order; new_status=None removes it.
+        """
+        await self.move_orders([order_id], old_status, new_status)
+
+    async def move_orders(self, order_ids: List[int], old_status: Optional[str], new_status: Optional[str]):
+        """Move a batch of orders that share the same old status (one read, one upsert per status)"""
+        if old_status == new_status or not order_ids:
+            return
+        stmt = (
+            select(
+                OrderItem.farmer_id,
+                OrderItem.species,
+                OrderItem.order_id,
+                Order.created_at,
+                func.count(OrderItem.id).label("item_count"),
+                func.sum(OrderItem.quantity).label("quantity"),
+                func.sum(OrderItem.price * OrderItem.quantity).label("revenue"),
+            )
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(OrderItem.order_id.in_(order_ids), OrderItem.farmer_id.is_not(None))
+            .group_by(OrderItem.farmer_id, OrderItem.species, OrderItem.order_id, Order.created_at)
+        )
+        # Several orders can fall on the same day; fold them into one row per bucket.
+        # Each result row is one order's lines of one species.
+        totals: "OrderedDict[tuple, dict]" = OrderedDict()
+        farmer_orders: "OrderedDict[tuple, set]" = OrderedDict()
+        for g in (await self.session.execute(stmt)).all():
+            day = g.created_at.date().isoformat()
+            bucket = totals.setdefault((g.farmer_id, day, g.species), {m: 0 for m in _METRICS})
+            bucket["order_count"] += 1
+            bucket["item_count"] += g.item_count
+            bucket["quantity"] += g.quantity or 0
+            bucket["revenue"] += float(g.revenue or 0.0)
+            farmer_orders.setdefault((g.farmer_id, day), set()).add(g.order_id)
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            if status is None or not totals:
+                continue
+            rows = [
+                {
+                    "farmer_id": farmer_id,
+                    "day": day,
+                    "species": species,
+                    "status": status,
+                    **{m: sign * value for m, value in bucket.items()},
+                }
+                for (farmer_id, day, species), bucket in totals.items()
+            ]
+            insert_stmt = self._insert()
+            upsert = insert_stmt.on_conflict_do_update(
+                index_elements=["farmer_id", "day", "species", "status"],
+                set_={m: getattr(SalesRollup, m) + getattr(insert_stmt.excluded, m) for m in _METRICS},
+            )
+            await self.session.execute(upsert, rows)
+
+            rows = [
+                {"farmer_id": farmer_id, "day": day, "status": status, "order_count": sign * len(orders)}
+                for (farmer_id, day), orders in farmer_orders.items()
+            ]
+            insert_stmt = self._insert(OrderRollup)
+            upsert = insert_stmt.on_conflict_do_update(
+                index_elements=["farmer_id", "day", "status"],
+                set_={"order_count": OrderRollup.order_count + insert_stmt.excluded.order_count},
+            )
+            await self.session.execute(upsert, rows)
+
+    async def rebuild(self):
+        """Recompute every rollup row from hot and archived orders"""
+        await rebuild_rollups(self.session)
+        await self.session.commit()
+
+    async def farmer_sales(
+        self,
+        farmer_id: int,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        period: str = "day",
+        group_by: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Sum rollup rows into day/week/month buckets for a date range (inclusive).
+        group_by may be "species" or "status" to split each bucket further.
+        Unless split by species, order_count comes from order_rollups so an
+        order with several species is counted once.
+        """
+        stmt = select(SalesRollup).where(SalesRollup.farmer_id == farmer_id)
+        if date_from:
+            stmt = stmt.where(SalesRollup.day >= date_from.isoformat())
+        if date_to:
+            stmt = stmt.where(SalesRollup.day <= date_to.isoformat())
+        if status:
+            stmt = stmt.where(SalesRollup.status == status)
+        stmt = stmt.order_by(SalesRollup.day)
+        rows = (await self.session.execute(stmt)).scalars().all()
+
+        buckets: "OrderedDict[tuple, dict]" = OrderedDict()
+        for row in rows:
+            key = (_period_key(row.day, period), getattr(row, group_by) if group_by else None)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {"period": key[0], **{m: 0 for m in _METRICS}}
+                if group_by:
+                    bucket[group_by] = key[1]
+            for m in _METRICS:
+                bucket[m] += getattr(row, m)
+
+        if group_by != "species":
+            for bucket in buckets.values():
+                bucket["order_count"] = 0
+            stmt = select(OrderRollup).where(OrderRollup.farmer_id == farmer_id)
+            if date_from:
+                stmt = stmt.where(OrderRollup.day >= date_from.isoformat())
+            if date_to:
+                stmt = stmt.where(OrderRollup.day <= date_to.isoformat())
+            if status:
+                stmt = stmt.where(OrderRollup.status == status)
+            for row in (await self.session.execute(stmt)).scalars():
+                key = (_period_key(row.day, period), getattr(row, group_by) if group_by else None)
+                if key in buckets:
+                    buckets[key]["order_count"] += row.order_count
+        return [b for b in buckets.values() if b["item_count"]]
@@ -3,6 +3,8 @@
 from typing import List, Optional
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import catalog_generation, storefront_generation
+from app.core.concurrency import update_versioned
 from app.models.animal import Animal
 
 
@@ -21,20 +23,33 @@ class AnimalService:
         return result.scalars().all()
 
     async def create(self, data: dict) -> Animal:
+        if data.get("stock") == 0:
+            data["available"] = False
         animal = Animal(**data)
         self.session.add(animal)
         await self.session.commit()
+        catalog_generation.bump()
+        storefront_generation.bump(animal.farmer_id)
         await self.session.refresh(animal)
         return animal
 
-    async def update(self, animal: Animal, updates: dict) -> Animal:
-        for key, value in updates.items():
-            setattr(animal, key, value)
-        self.session.add(animal)
-        await self.session.commit()
-        await self.session.refresh(animal)
+    async def update(self, animal: Animal, updates: dict, expected_version: Optional[int] = None) -> Optional[Animal]:
+        """Apply updates with compare-and-swap on the version column; None if the animal was deleted meanwhile"""
+        async def apply(current: Animal) -> dict:
+            if updates.get("stock") is not None and "available" not in updates:
+                # Restocking relists the animal; selling out delists it
+                return {**updates, "available": updates["stock"] > 0}
+            return updates
+
+        farmer_id = animal.farmer_id
+        animal = await update_versioned(self.session, Animal, animal.id, apply, expected_version)
+        catalog_generation.bump()
+        storefront_generation.bump(farmer_id)
         return animal
 
     async def delete(self, animal: Animal):
+        farmer_id = animal.farmer_id
         await self.session.delete(animal)
         await self.session.commit()
+        catalog_generation.bump()
+        storefront_generation.bump(farmer_id)
@@ -0,0 +1,93 @@
+# app/services/archive_service.py
+
+"""
+Hot/cold archival of settled orders.
+
+Responsibilities:
+- Move paid or rejected orders older than a cutoff, with their items and
+  payments, into the archived_* tables in batched transactions
+- Tell read paths whether a date range reaches into the archive, so
+  recent-history queries never touch it
+
+Archived rows keep their ids. Everything in the archive was created before
+MAX(archived_orders.created_at); queries starting after that are hot-only.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import begin_immediate
+from app.models.archive import ArchivedOrder, ArchivedOrderItem, ArchivedPayment
+from app.models.order import Order, OrderItem
+from app.models.payment import Payment
+
+ARCHIVABLE_STATUSES = ("paid", "rejected")
+
+
+def _copy(source, target, where):
+    """INSERT INTO target (cols) SELECT cols FROM source WHERE ... over the columns both tables share"""
+    names = [c.name for c in target.__table__.columns if c.name in source.__table__.columns]
+    columns = [source.__table__.c[name] for name in names]
+    return insert(target).from_select(names, select(*columns).where(where))
+
+
+class ArchiveService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def watermark(self, column=ArchivedOrder.created_at) -> Optional[datetime]:
+        """Newest value of an indexed archive timestamp (index-only MAX), or None if the archive is empty"""
+        result = await self.session.execute(select(func.max(column)))
+        return result.scalar()
+
+    async def reaches_archive(self, created_from: Optional[datetime], column=ArchivedOrder.created_at) -> bool:
+        """True if a query for rows created at/after `created_from` may find archived rows"""
+        newest = await self.watermark(column)
+        if newest is None:
+            return False
+        if created_from is None:
+            return True
+        return created_from.replace(tzinfo=None) <= newest.replace(tzinfo=None)
+
+    async def archive_batch(self, cutoff: datetime, limit: int) -> int:
+        """Move up to `limit` settled orders created before `cutoff` in one transaction; returns the count"""
+        await begin_immediate(self.session)
+        try:
+            result = await self.session.execute(
+                select(Order.id)
+                .where(Order.status.in_(ARCHIVABLE_STATUSES), Order.created_at < cutoff)
+                .order_by(Order.created_at)
+                .limit(limit)
+            )
+            order_ids = result.scalars().all()
+            if not order_ids:
+                await self.session.rollback()
+                return 0
+
+            await self.session.execute(_copy(Order, ArchivedOrder, Order.id.in_(order_ids)))
+            await self.session.execute(_copy(OrderItem, ArchivedOrderItem, OrderItem.order_id.in_(order_ids)))
+            await self.session.execute(_copy(Payment, ArchivedPayment, Payment.order_id.in_(order_ids)))
+            await self.session.execute(delete(Payment).where(Payment.order_id.in_(order_ids)))
+            await self.session.execute(delete(OrderItem).where(OrderItem.order_id.in_(order_ids)))
+            await self.session.execute(delete(Order).where(Order.id.in_(order_ids)))
+            await self.session.commit()
+        except Exception:
+            await self.session.rollback()
+            raise
+        return len(order_ids)
+
+    async def archive(self, older_than_days: Optional[int] = None, batch_size: Optional[int] = None) -> int:
+        """Archive every eligible order, one batch per transaction; returns the number moved"""
+        days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+        batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        total = 0
+        while True:
+            moved = await self.archive_batch(cutoff, batch_size)
+            total += moved
+            if moved < batch_size:
+                return total
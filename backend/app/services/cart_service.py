@@ -1,69 +1,204 @@
 # app/services/cart_service.py
 
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.cart import CartItem
+from app.core.cache import LRUCache, catalog_generation
 from app.models.animal import Animal
+from app.schemas.cart import CartSummary, CartSummaryLine
+from app.services.cart_store import CartStore, CartLine, cart_store, guest_key, is_user_key, user_key
+from app.services.reservation_service import ReservationService
+
+# owner -> (cart revision, catalog generation, summary)
+_summary_cache = LRUCache(maxsize=10_000)
 
 
 class CartService:
-    def __init__(self, session: AsyncSession):
-        self.session = session
+    """
+    Cart operations for a cart owner key (see cart_store.user_key / guest_key).
+    Writes land in the in-memory store and are persisted write-behind.
+    Quantity changes are checked against free stock first. Signed-in buyers
+    also reserve the units (a short write transaction per change); guest
+    carts only check and stay purely in memory, so anonymous traffic cannot
+    hold stock. Guest lines are reserved when the cart is merged at login.
+    """
 
-    async def list_cart(self, buyer_id: int) -> List[CartItem]:
-        stmt = select(CartItem).where(CartItem.buyer_id == buyer_id)
-        result = await self.session.execute(stmt)
-        return result.scalars().all()
+    def __init__(self, session: AsyncSession, store: CartStore = cart_store):
+        self.session = session
+        self.store = store
 
-    async def add_item(self, buyer_id: int, animal_id: int, quantity: int) -> CartItem:
-        stmt = select(CartItem).where(
-            (CartItem.buyer_id == buyer_id) & (CartItem.animal_id == animal_id)
-        )
-        result = await self.session.execute(stmt)
-        existing = result.scalar_one_or_none()
-        
+    async def _get_animal(self, animal_id: int) -> Animal:
         animal = await self.session.get(Animal, animal_id)
         if not animal:
             raise ValueError("Animal not found")
-        
-        if existing:
-            existing.quantity += quantity
-            existing.price = float(animal.price)
-            self.session.add(existing)
-            await self.session.commit()
-            await self.session.refresh(existing)
-            return existing
-        
-        cart_item = CartItem(
-            buyer_id=buyer_id,
-            animal_id=animal_id,
-            quantity=quantity,
-            price=float(animal.price)
+        if not animal.available:
+            raise ValueError("Animal not available")
+        return animal
+
+    async def list_cart(self, owner: str) -> List[CartLine]:
+        return await self.store.get_lines(owner)
+
+    async def get_summary(self, owner: str) -> CartSummary:
+        """
+        Price the cart against live animal rows with a single query.
+        Cached per owner until the cart or any animal changes.
+        """
+        revision = await self.store.get_revision(owner)
+        generation = catalog_generation.value
+        cached = _summary_cache.get(owner)
+        if cached and cached[0] == revision and cached[1] == generation:
+            return cached[2]
+
+        lines = await self.store.get_lines(owner)
+        animals = {}
+        if lines:
+            result = await self.session.execute(
+                select(Animal.id, Animal.name, Animal.price, Animal.available).where(
+                    Animal.id.in_([line.animal_id for line in lines])
+                )
+            )
+            animals = {row.id: row for row in result}
+
+        summary = CartSummary()
+        for line in lines:
+            animal = animals.get(line.animal_id)
+            available = bool(animal and animal.available)
+            current_price = float(animal.price) if animal else None
+            price_changed = current_price is not None and current_price != line.price
+            line_total = current_price * line.quantity if available else 0.0
+            summary.items.append(CartSummaryLine(
+                item_id=line.id,
+                animal_id=line.animal_id,
+                name=animal.name if animal else None,
+                quantity=line.quantity,
+                cart_price=line.price,
+                current_price=current_price,
+                line_total=line_total,
+                price_changed=price_changed,
+                available=available,
+            ))
+            if price_changed:
+                summary.stale_items.append(line.animal_id)
+            if not available:
+                summary.unavailable_items.append(line.animal_id)
+            else:
+                summary.item_count += line.quantity
+                summary.total += line_total
+
+        _summary_cache.set(owner, (revision, generation, summary))
+        return summary
+
+    async def get_item(self, owner: str, item_id: int) -> Optional[CartLine]:
+        return await self.store.get_line(owner, item_id)
+
+    async def _quantities(self, owner: str) -> Dict[int, int]:
+        return {line.animal_id: line.quantity for line in await self.store.get_lines(owner)}
+
+    async def _hold(self, owner: str, targets: Dict[int, int]):
+        """Reserve the target quantities for a buyer; for a guest only check them against free stock"""
+        if is_user_key(owner):
+            await ReservationService(self.session).reserve(owner, targets)
+            return
+        wanted = {animal_id: quantity for animal_id, quantity in targets.items() if quantity > 0}
+        if not wanted:
+            return
+        result = await self.session.execute(
+            select(Animal.id, Animal.stock - Animal.reserved).where(Animal.id.in_(list(wanted)))
         )
-        self.session.add(cart_item)
-        await self.session.commit()
-        await self.session.refresh(cart_item)
-        return cart_item
-
-    async def update_item(self, cart_item: CartItem, quantity: int) -> CartItem:
-        cart_item.quantity = quantity
-        self.session.add(cart_item)
-        await self.session.commit()
-        await self.session.refresh(cart_item)
-        return cart_item
-
-    async def remove_item(self, cart_item: CartItem):
-        await self.session.delete(cart_item)
-        await self.session.commit()
-
-    async def clear_cart(self, buyer_id: int):
-        stmt = select(CartItem).where(CartItem.buyer_id == buyer_id)
-        result = await self.session.execute(stmt)
-        items = result.scalars().all()
-        for item in items:
-            await self.session.delete(item)
-        await self.session.commit()
-
-    async def get_item(self, item_id: int) -> Optional[CartItem]:
-        return await self.session.get(CartItem, item_id)
+        free = dict(result.all())
+        for animal_id, quantity in wanted.items():
+            if quantity > free.get(animal_id, 0):
+                raise ValueError(f"Only {max(free.get(animal_id, 0), 0)} of animal {animal_id} available")
+
+    async def merge_guest_cart(self, session_id: str, user_id: int):
+        """Move a guest cart into the buyer's cart and reserve what is still free (best effort)"""
+        guest = await self.store.get_lines(guest_key(session_id))
+        if not guest:
+            return
+        await self.store.merge_guest(session_id, user_id)
+        owner = user_key(user_id)
+        quantities = await self._quantities(owner)
+        reservations = ReservationService(self.session)
+        for line in guest:
+            try:
+                await reservations.reserve(owner, {line.animal_id: quantities[line.animal_id]})
+            except ValueError:
+                pass  # kept in the cart unreserved; checkout re-checks stock
+
+    async def add_item(self, owner: str, animal_id: int, quantity: int) -> CartLine:
+        animal = await self._get_animal(animal_id)
+        price = float(animal.price)
+        current = (await self._quantities(owner)).get(animal_id, 0)
+        await self._hold(owner, {animal_id: current + quantity})
+        return await self.store.add(owner, animal_id, quantity, price)
+
+    async def update_item(self, owner: str, cart_item: CartLine, quantity: int) -> CartLine:
+        await self._hold(owner, {cart_item.animal_id: quantity})
+        return await self.store.set_quantity(owner, cart_item.animal_id, quantity)
+
+    async def remove_item(self, owner: str, cart_item: CartLine):
+        await self._hold(owner, {cart_item.animal_id: 0})
+        await self.store.remove(owner, cart_item.animal_id)
+
+    async def clear_cart(self, owner: str):
+        if is_user_key(owner):
+            await ReservationService(self.session).release(owner)
+        await self.store.clear(owner)
+
+    async def apply_batch(self, owner: str, operations: List[dict]) -> List[CartLine]:
+        """
+        Apply a list of add/set/remove operations atomically.
+
+        Operations are folded per animal and validated with a single query
+        before anything is changed, so a failing operation leaves the cart intact.
+        """
+        # Fold operations into one final intent per animal:
+        # ("add", delta) relative to the stored quantity, ("set", qty) or ("remove", 0)
+        intents: Dict[int, Tuple[str, int]] = {}
+        for op in operations:
+            animal_id, quantity = op["animal_id"], op.get("quantity", 1)
+            mode, value = intents.get(animal_id, ("add", 0))
+            if op["op"] == "remove":
+                intents[animal_id] = ("remove", 0)
+            elif op["op"] == "set":
+                intents[animal_id] = ("set", quantity)
+            elif mode == "add":
+                intents[animal_id] = ("add", value + quantity)
+            else:
+                intents[animal_id] = ("set", value + quantity)
+
+        wanted = [aid for aid, (mode, _) in intents.items() if mode != "remove"]
+
+        animals = {}
+        if wanted:
+            result = await self.session.execute(
+                select(Animal.id, Animal.price, Animal.available).where(Animal.id.in_(wanted))
+            )
+            animals = {row.id: row for row in result}
+        for animal_id in wanted:
+            animal = animals.get(animal_id)
+            if not animal:
+                raise ValueError(f"Animal {animal_id} not found")
+            if not animal.available:
+                raise ValueError(f"Animal {animal_id} not available")
+
+        # Reserve (or check) the final quantities in one transaction before touching the cart
+        current = await self._quantities(owner)
+        targets = {}
+        for animal_id, (mode, value) in intents.items():
+            if mode == "remove":
+                targets[animal_id] = 0
+            elif mode == "add":
+                targets[animal_id] = current.get(animal_id, 0) + value
+            else:
+                targets[animal_id] = value
+        await self._hold(owner, targets)
+
+        for animal_id, (mode, value) in intents.items():
+            if mode == "remove":
+                await self.store.remove(owner, animal_id)
+            elif mode == "add":
+                await self.store.add(owner, animal_id, value, float(animals[animal_id].price))
+            else:
+                await self.store.set_quantity(owner, animal_id, value, float(animals[animal_id].price))
+        return await self.list_cart(owner)
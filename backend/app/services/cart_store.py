@@ -0,0 +1,334 @@
+# app/services/cart_store.py
+
+"""
+In-memory cart store with write-behind persistence.
+
+Responsibilities:
+- Hold active carts in memory, keyed by owner ("user:<id>" or "guest:<session>")
+- Persist user carts to cart_items in periodic batched transactions
+- Merge a guest cart into a user cart on login
+- Flush everything still pending on shutdown
+
+Guest carts are memory-only: cart_items.buyer_id references users, so a
+guest cart reaches the database only after it is merged into a user cart.
+A guest cart is created by its first write (reads of an unknown session see
+an empty cart), and at most GUEST_CART_MAX are held; past that the least
+recently used guest cart is dropped.
+The store is per-process; run a single worker or pin carts to a worker.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select, insert, delete, func
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.cart import CartItem
+
+logger = logging.getLogger(__name__)
+
+
+def user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def guest_key(session_id: str) -> str:
+    return f"guest:{session_id}"
+
+
+def is_user_key(owner: str) -> bool:
+    return owner.startswith("user:")
+
+
+@dataclass
+class CartLine:
+    """A single cart line held in memory (mirrors CartItem)"""
+    id: int
+    buyer_id: Optional[int]
+    animal_id: int
+    quantity: int
+    price: float
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: Optional[datetime] = None
+
+
+@dataclass
+class _Cart:
+    buyer_id: Optional[int]
+    lines: Dict[int, CartLine] = field(default_factory=dict)  # animal_id -> line
+    touched: float = field(default_factory=time.monotonic)
+    revision: int = 0  # bumped on every change, used to validate cached views
+
+
+class CartStore:
+    def __init__(self, session_factory=async_session):
+        self._session_factory = session_factory
+        self._carts: "OrderedDict[str, _Cart]" = OrderedDict()  # least recently used first
+        self._guest_count = 0
+        self._dirty: Set[int] = set()  # buyer ids with unflushed changes
+        self._revision = 0  # store-wide counter so revisions never repeat across reloads
+        self._next_id: Optional[int] = None
+        self._init_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ----------------------------
+    # Lifecycle
+    # ----------------------------
+    async def start(self):
+        """Seed the id allocator and start the write-behind loop"""
+        await self._ensure_ready()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the write-behind loop and flush every pending cart"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for attempt in range(3):
+            try:
+                await self.flush()
+                return
+            except Exception as e:
+                logger.error("Cart flush on shutdown failed (attempt %d): %s", attempt + 1, e)
+                await asyncio.sleep(0.1 * (attempt + 1))
+        if self._dirty:
+            logger.error("Lost unflushed carts for buyers: %s", sorted(self._dirty))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.CART_FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush()
+                self._evict_idle()
+            except Exception as e:
+                logger.error("Cart write-behind flush failed: %s", e)
+
+    async def _ensure_ready(self):
+        if self._next_id is not None:
+            return
+        async with self._init_lock:
+            if self._next_id is None:
+                async with self._session_factory() as session:
+                    result = await session.execute(select(func.max(CartItem.id)))
+                    self._next_id = (result.scalar() or 0) + 1
+
+    # ----------------------------
+    # Reads
+    # ----------------------------
+    async def _cart(self, key: str, create: bool = True) -> _Cart:
+        """
+        The owner's cart, loading a user cart from cart_items on first use.
+        An unknown guest cart is only created when `create` is set (writes);
+        otherwise an empty cart is returned without being stored.
+        """
+        await self._ensure_ready()
+        cart = self._carts.get(key)
+        if cart is None and not create and not is_user_key(key):
+            return _Cart(buyer_id=None)
+        if cart is None:
+            buyer_id = int(key.split(":", 1)[1]) if is_user_key(key) else None
+            cart = _Cart(buyer_id=buyer_id, revision=self._next_revision())
+            if buyer_id is not None:
+                async with self._session_factory() as session:
+                    result = await session.execute(select(CartItem).where(CartItem.buyer_id == buyer_id))
+                    for row in result.scalars():
+                        cart.lines[row.animal_id] = CartLine(
+                            id=row.id,
+                            buyer_id=buyer_id,
+                            animal_id=row.animal_id,
+                            quantity=row.quantity,
+                            price=row.price,
+                            created_at=row.created_at,
+                            updated_at=row.updated_at,
+                        )
+            # Another coroutine may have loaded the cart while we awaited
+            if key not in self._carts:
+                self._carts[key] = cart
+                if buyer_id is None:
+                    self._guest_count += 1
+                    self._evict_guests()
+            cart = self._carts[key]
+        cart.touched = time.monotonic()
+        self._carts.move_to_end(key)
+        return cart
+
+    async def get_lines(self, key: str) -> List[CartLine]:
+        cart = await self._cart(key, create=False)
+        return list(cart.lines.values())
+
+    async def get_revision(self, key: str) -> int:
+        cart = await self._cart(key, create=False)
+        return cart.revision
+
+    async def get_line(self, key: str, item_id: int) -> Optional[CartLine]:
+        cart = await self._cart(key, create=False)
+        return next((line for line in cart.lines.values() if line.id == item_id), None)
+
+    # ----------------------------
+    # Writes (memory only; persisted by flush)
+    # ----------------------------
+    def _next_revision(self) -> int:
+        self._revision += 1
+        return self._revision
+
+    def _touch(self, cart: _Cart):
+        cart.revision = self._next_revision()
+        if cart.buyer_id is not None:
+            self._dirty.add(cart.buyer_id)
+
+    def _allocate_id(self) -> int:
+        item_id = self._next_id
+        self._next_id += 1
+        return item_id
+
+    async def add(self, key: str, animal_id: int, quantity: int, price: float) -> CartLine:
+        cart = await self._cart(key)
+        line = cart.lines.get(animal_id)
+        if line:
+            line.quantity += quantity
+            line.price = price
+            line.updated_at = datetime.now(timezone.utc)
+        else:
+            line = CartLine(
+                id=self._allocate_id(),
+                buyer_id=cart.buyer_id,
+                animal_id=animal_id,
+                quantity=quantity,
+                price=price,
+            )
+            cart.lines[animal_id] = line
+        self._touch(cart)
+        return line
+
+    async def set_quantity(self, key: str, animal_id: int, quantity: int, price: Optional[float] = None) -> CartLine:
+        cart = await self._cart(key)
+        line = cart.lines.get(animal_id)
+        if line is None:
+            line = CartLine(
+                id=self._allocate_id(),
+                buyer_id=cart.buyer_id,
+                animal_id=animal_id,
+                quantity=quantity,
+                price=price or 0.0,
+            )
+            cart.lines[animal_id] = line
+        else:
+            line.quantity = quantity
+            if price is not None:
+                line.price = price
+            line.updated_at = datetime.now(timezone.utc)
+        self._touch(cart)
+        return line
+
+    async def remove(self, key: str, animal_id: int):
+        cart = await self._cart(key, create=False)
+        if cart.lines.pop(animal_id, None) is not None:
+            self._touch(cart)
+
+    async def clear(self, key: str):
+        cart = await self._cart(key, create=False)
+        if cart.lines:
+            cart.lines.clear()
+            self._touch(cart)
+
+    def discard(self, buyer_id: int, animal_ids: Iterable[int]):
+        """
+        Drop lines that were already removed from cart_items by the caller
+        (e.g. checkout). The buyer is not marked dirty for these lines.
+        """
+        cart = self._carts.get(user_key(buyer_id))
+        if cart is not None:
+            for animal_id in animal_ids:
+                cart.lines.pop(animal_id, None)
+            cart.revision = self._next_revision()
+
+    async def merge_guest(self, session_id: str, user_id: int):
+        """Move a guest cart into a user cart, summing quantities per animal"""
+        guest = self._carts.pop(guest_key(session_id), None)
+        if guest is None:
+            return
+        self._guest_count -= 1
+        if not guest.lines:
+            return
+        for line in guest.lines.values():
+            await self.add(user_key(user_id), line.animal_id, line.quantity, line.price)
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    async def flush(self, buyer_ids: Optional[Iterable[int]] = None):
+        """
+        Write pending carts to cart_items in one transaction.
+        Each dirty cart is rewritten as a whole: one DELETE and one bulk INSERT.
+        """
+        async with self._flush_lock:
+            pending = self._dirty if buyer_ids is None else self._dirty & set(buyer_ids)
+            if not pending:
+                return
+            pending = set(pending)
+            self._dirty -= pending
+
+            # Snapshot synchronously so later edits are picked up by the next flush
+            rows = []
+            for buyer_id in pending:
+                cart = self._carts.get(user_key(buyer_id))
+                for line in (cart.lines.values() if cart else ()):
+                    rows.append({
+                        "id": line.id,
+                        "buyer_id": buyer_id,
+                        "animal_id": line.animal_id,
+                        "quantity": line.quantity,
+                        "price": line.price,
+                        "created_at": line.created_at,
+                        "updated_at": line.updated_at,
+                    })
+
+            try:
+                async with self._session_factory() as session:
+                    await session.execute(delete(CartItem).where(CartItem.buyer_id.in_(pending)))
+                    if rows:
+                        await session.execute(insert(CartItem), rows)
+                    await session.commit()
+            except Exception:
+                self._dirty |= pending
+                raise
+
+    def _evict_idle(self):
+        """Drop idle guest carts and idle user carts that are fully persisted"""
+        now = time.monotonic()
+        user_ttl = settings.CART_IDLE_TTL_MINUTES * 60
+        guest_ttl = settings.GUEST_CART_TTL_MINUTES * 60
+        for key, cart in list(self._carts.items()):
+            idle = now - cart.touched
+            if cart.buyer_id is None:
+                if idle > guest_ttl:
+                    del self._carts[key]
+                    self._guest_count -= 1
+            elif idle > user_ttl and cart.buyer_id not in self._dirty:
+                del self._carts[key]
+
+    def _evict_guests(self):
+        """Drop least recently used guest carts beyond GUEST_CART_MAX"""
+        if self._guest_count <= settings.GUEST_CART_MAX:
+            return
+        for key, cart in list(self._carts.items()):
+            if self._guest_count <= settings.GUEST_CART_MAX:
+                break
+            if cart.buyer_id is None:
+                del self._carts[key]
+                self._guest_count -= 1
+
+
+cart_store = CartStore()
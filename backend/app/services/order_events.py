@@ -0,0 +1,123 @@
+# app/services/order_events.py
+
+"""
+In-process pub/sub hub for order events (feeds the farmer SSE stream).
+
+Responsibilities:
+- Fan out order events only to the affected farmers' connections
+- Keep a bounded replay buffer for Last-Event-ID resume
+- Cap per-connection memory: a subscriber that falls too far behind is
+  told to reset and disconnected instead of buffering without limit
+
+Event ids are per-process; after a restart clients get a reset event.
+"""
+
+import asyncio
+import itertools
+import json
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.order import Order, OrderItem
+from app.schemas.order import OrderSummary
+from app.services.outbox import register
+
+# (event id, farmer id, event name, JSON payload)
+Event = Tuple[int, int, str, str]
+
+
+class Subscription:
+    def __init__(self, farmer_id: int):
+        self.farmer_id = farmer_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.SSE_QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, event: Event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # Wake the reader so it can send a reset and close
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class OrderEventHub:
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._replay: Deque[Event] = deque(maxlen=settings.SSE_REPLAY_BUFFER)
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+
+    def publish(self, farmer_ids: Iterable[int], name: str, payload: dict):
+        data = json.dumps(payload, default=str)
+        for farmer_id in set(farmer_ids):
+            if farmer_id is None:
+                continue
+            event = (next(self._ids), farmer_id, name, data)
+            self._last_id = event[0]
+            self._replay.append(event)
+            for subscription in self._subscribers.get(farmer_id, ()):
+                subscription.push(event)
+
+    def subscribe(self, farmer_id: int, last_event_id: Optional[int] = None) -> Tuple[Subscription, Optional[List[Event]]]:
+        """
+        Register a connection. Returns the subscription and the events to
+        replay, or None if last_event_id can no longer be resumed (client must
+        refetch): too old for the buffer, or more missed events than SSE_QUEUE_SIZE.
+        """
+        subscription = Subscription(farmer_id)
+        self._subscribers.setdefault(farmer_id, set()).add(subscription)
+        if last_event_id is None:
+            return subscription, []
+        oldest = self._replay[0][0] if self._replay else self._last_id + 1
+        if last_event_id > self._last_id or last_event_id < oldest - 1:
+            return subscription, None
+        replay = [e for e in self._replay if e[0] > last_event_id and e[1] == farmer_id]
+        if len(replay) > settings.SSE_QUEUE_SIZE:
+            # Replaying only the newest would leave a silent gap
+            return subscription, None
+        return subscription, replay
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.farmer_id)
+        if subscribers:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.farmer_id]
+
+
+def format_event(event: Event) -> str:
+    event_id, _, name, data = event
+    return f"id: {event_id}\nevent: {name}\ndata: {data}\n\n"
+
+
+async def notify_order_farmers(session: AsyncSession, order_id: int, name: str):
+    """Publish an order event to every farmer with a line in the order (outbox handler)"""
+    order = await session.get(Order, order_id, populate_existing=True)
+    if order is None:
+        return
+    result = await session.execute(
+        select(OrderItem.farmer_id).where(OrderItem.order_id == order_id).distinct()
+    )
+    payload = OrderSummary.model_validate(order).model_dump(mode="json")
+    order_events.publish(result.scalars().all(), name, payload)
+
+
+@register("order.created")
+async def _on_order_created(session: AsyncSession, payload: dict):
+    await notify_order_farmers(session, payload["order_id"], "order.created")
+
+
+@register("order.updated")
+async def _on_order_updated(session: AsyncSession, payload: dict):
+    await notify_order_farmers(session, payload["order_id"], "order.updated")
+
+
+order_events = OrderEventHub()
@@ -0,0 +1,82 @@
+# app/services/order_expiry.py
+
+"""
+Background sweeper that expires unpaid pending orders.
+
+Responsibilities:
+- Every ORDER_EXPIRY_SWEEP_INTERVAL_SECONDS, expire orders still pending and
+  unpaid ORDER_PAYMENT_DEADLINE_MINUTES after checkout
+- Work in batches of ORDER_EXPIRY_BATCH_SIZE so no transaction holds the
+  write lock for long
+- Keep counters of expired orders and units returned to stock
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import async_session, is_lock_error
+from app.services.order_service import OrderService
+
+logger = logging.getLogger(__name__)
+
+# Process-wide sweeper counters (read by diagnostics)
+expiry_stats = {"sweeps": 0, "orders_expired": 0, "units_released": 0, "lock_skips": 0}
+
+
+class OrderExpirySweeper:
+    def __init__(self, session_factory=async_session):
+        self._session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None and settings.ORDER_PAYMENT_DEADLINE_MINUTES > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("Order expiry sweep failed: %s", e)
+            await asyncio.sleep(settings.ORDER_EXPIRY_SWEEP_INTERVAL_SECONDS)
+
+    async def sweep(self, now: Optional[datetime] = None) -> int:
+        """Expire every overdue order, one batch per transaction; returns the number expired"""
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(minutes=settings.ORDER_PAYMENT_DEADLINE_MINUTES)
+        expired_total = 0
+        expiry_stats["sweeps"] += 1
+        while True:
+            async with self._session_factory() as session:
+                try:
+                    order_ids, released = await OrderService(session).expire_unpaid_orders(
+                        cutoff, settings.ORDER_EXPIRY_BATCH_SIZE
+                    )
+                except Exception as e:
+                    if not is_lock_error(e):
+                        raise
+                    # Checkout traffic holds the lock; pick the rest up next sweep
+                    expiry_stats["lock_skips"] += 1
+                    break
+            expiry_stats["orders_expired"] += len(order_ids)
+            expiry_stats["units_released"] += released
+            expired_total += len(order_ids)
+            if order_ids:
+                logger.info("Expired %d unpaid orders, released %d units", len(order_ids), released)
+            if len(order_ids) < settings.ORDER_EXPIRY_BATCH_SIZE:
+                break
+        return expired_total
+
+
+order_expiry_sweeper = OrderExpirySweeper()
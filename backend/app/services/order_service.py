@@ -1,11 +1,31 @@
 # app/services/order_service.py
 
-from typing import List, Optional
-from sqlalchemy import select
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import case, exists, literal, select, insert, update, delete, func
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload, selectinload
+from app.core.config import settings
+from app.core.database import begin_immediate, is_lock_error
+from app.core.idempotency import record_resource
+from app.core.concurrency import update_versioned
+from app.core.pagination import after_cursor
 from app.models.order import Order, OrderItem
+from app.models.archive import ArchivedOrder, ArchivedOrderItem
 from app.models.cart import CartItem
 from app.models.animal import Animal
+from app.models.payment import Payment
+from app.services.analytics_service import AnalyticsService
+from app.services.archive_service import ArchiveService
+from app.services.cart_store import cart_store, user_key
+from app.services.outbox import enqueue
+from app.services.reservation_service import ReservationService
+from app.core.cache import catalog_generation
+
+# Process-wide checkout counters (read by benchmarks and diagnostics)
+checkout_stats = {"orders": 0, "lock_retries": 0, "conflicts": 0}
 
 
 class OrderService:
@@ -13,77 +33,314 @@ class OrderService:
         self.session = session
 
     async def checkout(self, buyer_id: int) -> Order:
-        """Create an order from cart items"""
-        stmt = select(CartItem).where(CartItem.buyer_id == buyer_id)
-        result = await self.session.execute(stmt)
-        cart_items = result.scalars().all()
-        
-        if not cart_items:
+        """
+        Create an order from cart items.
+
+        Stock is taken with a single conditional UPDATE that only succeeds if
+        every line fits in the unreserved stock plus the buyer's own
+        reservation, so concurrent buyers can never oversell. Transient lock errors
+        are retried with backoff up to CHECKOUT_MAX_RETRIES times.
+        """
+        # Persist any pending in-memory cart edits before reading cart_items
+        await cart_store.flush([buyer_id])
+
+        for attempt in range(settings.CHECKOUT_MAX_RETRIES + 1):
+            try:
+                order_id, animal_ids = await self._checkout_once(buyer_id)
+                break
+            except OperationalError as e:
+                await self.session.rollback()
+                if not is_lock_error(e) or attempt == settings.CHECKOUT_MAX_RETRIES:
+                    raise
+                checkout_stats["lock_retries"] += 1
+                await asyncio.sleep(settings.CHECKOUT_RETRY_BACKOFF_SECONDS * (2 ** attempt))
+            except Exception:
+                await self.session.rollback()
+                raise
+
+        checkout_stats["orders"] += 1
+        catalog_generation.bump()
+        cart_store.discard(buyer_id, animal_ids)
+        return await self.get_order_with_items(order_id)
+
+    async def _checkout_once(self, buyer_id: int):
+        """One checkout attempt in a single write transaction; returns (order_id, animal_ids)"""
+        await begin_immediate(self.session)
+
+        result = await self.session.execute(
+            select(CartItem.animal_id, CartItem.quantity).where(CartItem.buyer_id == buyer_id)
+        )
+        quantities = {}
+        for row in result:
+            quantities[row.animal_id] = quantities.get(row.animal_id, 0) + row.quantity
+        if not quantities:
             raise ValueError("Cart is empty")
-        
-        order = Order(buyer_id=buyer_id, status="pending", is_paid=False, total_price=0.0)
-        self.session.add(order)
-        await self.session.flush()
-        
-        total_price = 0.0
-        for item in cart_items:
-            animal = await self.session.get(Animal, item.animal_id)
-            if not animal or not animal.available:
-                raise ValueError(f"Animal {item.animal_id} not available")
-            
-            order_item = OrderItem(
-                order_id=order.id,
-                animal_id=item.animal_id,
-                quantity=item.quantity,
-                price=animal.price
+
+        # The buyer's own cart reservations are consumed by this checkout
+        reservations = ReservationService(self.session)
+        held = await reservations.held(user_key(buyer_id), list(quantities))
+        wanted = case(quantities, value=Animal.id)
+        own = case(held, value=Animal.id, else_=0) if held else literal(0)
+
+        # Take stock for every line at once; only animals with enough free units come back
+        result = await self.session.execute(
+            update(Animal)
+            .where(
+                Animal.id.in_(list(quantities)),
+                Animal.available == True,
+                Animal.stock - Animal.reserved + own >= wanted,
             )
-            total_price += animal.price * item.quantity
-            animal.available = False
-            self.session.add(animal)
-            self.session.add(order_item)
-            await self.session.delete(item)
-        
-        order.total_price = total_price
-        self.session.add(order)
+            .values(
+                stock=Animal.stock - wanted,
+                reserved=Animal.reserved - own,
+                available=Animal.stock - wanted > 0,
+                version=Animal.version + 1,
+            )
+            .returning(Animal.id, Animal.price, Animal.farmer_id, Animal.species)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = {row.id: row for row in result}
+        prices = {aid: float(row.price) for aid, row in claimed.items()}
+        missing = sorted(set(quantities) - set(prices))
+        if missing:
+            checkout_stats["conflicts"] += 1
+            raise ValueError(f"Animal {', '.join(map(str, missing))} not available")
+
+        total_price = sum(prices[aid] * qty for aid, qty in quantities.items())
+        # One timestamp for the order and its items keeps feeds keyed on created_at consistent
+        now = datetime.now(timezone.utc)
+        result = await self.session.execute(
+            insert(Order)
+            .values(buyer_id=buyer_id, status="pending", is_paid=False, total_price=total_price, created_at=now)
+            .returning(Order.id)
+        )
+        order_id = result.scalar_one()
+
+        await self.session.execute(insert(OrderItem), [
+            {
+                "order_id": order_id,
+                "animal_id": aid,
+                "farmer_id": claimed[aid].farmer_id,
+                "species": claimed[aid].species,
+                "quantity": qty,
+                "price": prices[aid],
+                "stock_taken": qty,
+                "created_at": now,
+            }
+            for aid, qty in quantities.items()
+        ])
+        await self.session.execute(delete(CartItem).where(CartItem.buyer_id == buyer_id))
+        await reservations.drop(user_key(buyer_id), list(held))
+        await AnalyticsService(self.session).move_order(order_id, None, "pending")
+        await enqueue(self.session, "order.created", {"order_id": order_id})
+        await record_resource(self.session, order_id)
         await self.session.commit()
-        await self.session.refresh(order)
-        return order
+        return order_id, list(quantities)
+
+    async def expire_unpaid_orders(self, cutoff: datetime, limit: int) -> Tuple[List[int], int]:
+        """
+        Expire up to `limit` unpaid pending orders placed before `cutoff` and
+        return their units to stock, in one write transaction.
+
+        Candidates come from the (status, created_at) index; the order and
+        animal updates are single set-based statements for the whole batch.
+        Orders with a payment still in flight are skipped until that payment
+        is PAYMENT_PENDING_TIMEOUT_MINUTES old: its callback may yet settle them.
+        Returns (expired order ids, number of units released).
+        """
+        stale_before = datetime.now(timezone.utc) - timedelta(minutes=settings.PAYMENT_PENDING_TIMEOUT_MINUTES)
+        paying = exists().where(
+            Payment.order_id == Order.id,
+            Payment.status.in_(("pending", "processing")),
+            Payment.created_at >= stale_before,
+        )
+        await begin_immediate(self.session)
+        try:
+            result = await self.session.execute(
+                select(Order.id)
+                .where(Order.status == "pending", Order.created_at < cutoff, Order.is_paid == False, ~paying)
+                .order_by(Order.created_at)
+                .limit(limit)
+            )
+            order_ids = result.scalars().all()
+            if not order_ids:
+                await self.session.rollback()
+                return [], 0
+
+            await AnalyticsService(self.session).move_orders(order_ids, "pending", "expired")
+            await self.session.execute(
+                update(Order)
+                .where(Order.id.in_(order_ids))
+                .values(status="expired", version=Order.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            # Only units checkout actually took go back (none for pre-stock-tracking orders)
+            released = (await self.session.execute(
+                select(func.coalesce(func.sum(OrderItem.stock_taken), 0)).where(OrderItem.order_id.in_(order_ids))
+            )).scalar()
+            returned = (
+                select(func.sum(OrderItem.stock_taken))
+                .where(OrderItem.order_id.in_(order_ids), OrderItem.animal_id == Animal.id)
+                .scalar_subquery()
+            )
+            await self.session.execute(
+                update(Animal)
+                .where(Animal.id.in_(
+                    select(OrderItem.animal_id).where(OrderItem.order_id.in_(order_ids), OrderItem.stock_taken > 0)
+                ))
+                .values(
+                    stock=Animal.stock + returned,
+                    # Relist only animals that checkout sold out; a farmer's delisting stays
+                    available=case((Animal.stock == 0, True), else_=Animal.available),
+                    version=Animal.version + 1,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            for order_id in order_ids:
+                await enqueue(self.session, "order.updated", {"order_id": order_id})
+            await self.session.commit()
+        except Exception:
+            await self.session.rollback()
+            raise
+
+        if released:
+            catalog_generation.bump()
+        return list(order_ids), released
 
     async def get_order(self, order_id: int) -> Optional[Order]:
         return await self.session.get(Order, order_id)
 
-    async def list_orders(self, buyer_id: int) -> List[Order]:
-        stmt = select(Order).where(Order.buyer_id == buyer_id)
+    async def get_order_with_items(self, order_id: int) -> Optional[Order]:
+        stmt = select(Order).options(selectinload(Order.items)).where(Order.id == order_id)
         result = await self.session.execute(stmt)
-        return result.scalars().all()
+        return result.scalar_one_or_none()
 
-    async def update_order_status(self, order: Order, status: str) -> Order:
-        order.status = status
-        self.session.add(order)
-        await self.session.commit()
-        await self.session.refresh(order)
-        return order
+    async def list_orders(
+        self,
+        buyer_id: int,
+        status: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        limit: int = 20,
+        include_items: bool = True,
+    ) -> List[Order]:
+        """
+        One page of a buyer's orders, newest first.
 
-    async def mark_as_paid(self, order: Order) -> Order:
-        order.is_paid = True
-        order.status = "paid"
-        self.session.add(order)
-        await self.session.commit()
-        await self.session.refresh(order)
-        return order
+        Served by the (buyer_id[, status], created_at) indexes, so the cost
+        depends on the page size rather than the buyer's history. Archived
+        orders are merged in only when the date range reaches the archive.
+        Fetches limit + 1 rows so the caller can tell if there is a next page.
+        """
+        models = [Order]
+        if await ArchiveService(self.session).reaches_archive(created_from):
+            models.append(ArchivedOrder)
 
-    async def list_farmer_orders(self, farmer_id: int) -> List[Order]:
-        """Get all orders containing animals owned by this farmer"""
-        # Join OrderItem -> Animal to get farmer_id, then get unique orders
-        stmt = select(OrderItem).join(Animal).where(Animal.farmer_id == farmer_id)
-        result = await self.session.execute(stmt)
-        order_items = result.scalars().all()
-        
-        # Get unique order IDs
-        order_ids = list(set([item.order_id for item in order_items]))
-        if not order_ids:
-            return []
-        
-        stmt = select(Order).where(Order.id.in_(order_ids))
+        orders = []
+        for model in models:
+            stmt = (
+                select(model)
+                .options(selectinload(model.items) if include_items else noload(model.items))
+                .where(model.buyer_id == buyer_id)
+                .order_by(model.created_at.desc(), model.id.desc())
+                .limit(limit + 1)
+            )
+            if status:
+                stmt = stmt.where(model.status == status)
+            if created_from:
+                stmt = stmt.where(model.created_at >= created_from)
+            if created_to:
+                stmt = stmt.where(model.created_at < created_to)
+            if cursor:
+                stmt = stmt.where(after_cursor(model.created_at, model.id, cursor))
+            result = await self.session.execute(stmt)
+            orders.extend(result.scalars().all())
+        if len(models) > 1:
+            orders.sort(key=lambda o: (o.created_at, o.id), reverse=True)
+        return orders[:limit + 1]
+
+    async def update_order_status(self, order: Order, status: str, expected_version: Optional[int] = None) -> Order:
+        async def apply(current: Order) -> dict:
+            if current.status == "expired":
+                # Its animals may already be in someone else's order
+                raise ValueError("Order has expired")
+            await AnalyticsService(self.session).move_order(current.id, current.status, status)
+            await enqueue(self.session, "order.updated", {"order_id": current.id})
+            return {"status": status}
+
+        return await update_versioned(self.session, Order, order.id, apply, expected_version)
+
+    async def mark_as_paid(self, order: Order, expected_version: Optional[int] = None) -> Order:
+        async def apply(current: Order) -> dict:
+            if current.is_paid:
+                raise ValueError("Order already paid")
+            if current.status == "expired":
+                raise ValueError("Order expired before payment")
+            await AnalyticsService(self.session).move_order(current.id, current.status, "paid")
+            await enqueue(self.session, "order.updated", {"order_id": current.id})
+            return {"is_paid": True, "status": "paid"}
+
+        return await update_versioned(self.session, Order, order.id, apply, expected_version)
+
+    async def farmer_owns_order(self, farmer_id: int, order_id: int) -> bool:
+        """True if any line of the order belongs to this farmer"""
+        stmt = select(OrderItem.id).where(
+            OrderItem.order_id == order_id, OrderItem.farmer_id == farmer_id
+        ).limit(1)
         result = await self.session.execute(stmt)
-        return result.scalars().all()
+        return result.first() is not None
+
+    async def list_farmer_orders(
+        self,
+        farmer_id: int,
+        status: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        limit: int = 20,
+    ) -> List[dict]:
+        """
+        One page of orders containing this farmer's animals, newest first.
+
+        A single query over the (farmer_id, created_at) index on order_items,
+        grouped per order with the farmer's item count and subtotal. Archived
+        orders are merged in only when the date range reaches the archive.
+        Fetches limit + 1 rows so the caller can tell if there is a next page.
+        """
+        tables = [(Order, OrderItem)]
+        if await ArchiveService(self.session).reaches_archive(created_from):
+            tables.append((ArchivedOrder, ArchivedOrderItem))
+
+        rows = []
+        for order_model, item_model in tables:
+            stmt = (
+                select(
+                    order_model.id,
+                    order_model.buyer_id,
+                    order_model.status,
+                    order_model.total_price,
+                    order_model.is_paid,
+                    item_model.created_at,
+                    func.count(item_model.id).label("item_count"),
+                    func.sum(item_model.price * item_model.quantity).label("farmer_total"),
+                )
+                .join(order_model, order_model.id == item_model.order_id)
+                .where(item_model.farmer_id == farmer_id)
+                .group_by(item_model.created_at, item_model.order_id)
+                .order_by(item_model.created_at.desc(), item_model.order_id.desc())
+                .limit(limit + 1)
+            )
+            if status:
+                stmt = stmt.where(order_model.status == status)
+            if created_from:
+                stmt = stmt.where(item_model.created_at >= created_from)
+            if created_to:
+                stmt = stmt.where(item_model.created_at < created_to)
+            if cursor:
+                stmt = stmt.where(after_cursor(item_model.created_at, item_model.order_id, cursor))
+            result = await self.session.execute(stmt)
+            rows.extend(dict(row._mapping) for row in result)
+        if len(tables) > 1:
+            rows.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+        return rows[:limit + 1]
@@ -0,0 +1,239 @@
+# app/services/outbox.py
+
+"""
+Transactional outbox with an in-process asyncio worker pool.
+
+Responsibilities:
+- `enqueue()` adds an outbox row inside the caller's transaction, so the
+  work is recorded if and only if the business change commits
+- A dispatcher claims due rows in batches and feeds a pool of workers
+- Handlers registered per topic run with retries and exponential backoff;
+  rows that keep failing are parked as 'failed' with the last error, and
+  the topic's failure handlers (`on_failure`) run to compensate
+- `stop()` drains due work before shutdown and releases unfinished claims
+
+Delivery is at-least-once: handlers must tolerate running twice.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, event, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.outbox import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[AsyncSession, dict], Awaitable[None]]
+
+_handlers: Dict[str, List[Handler]] = {}
+_failure_handlers: Dict[str, List[Handler]] = {}
+
+
+def register(topic: str):
+    """Decorator: run the function for every outbox event with this topic"""
+    def decorator(func: Handler) -> Handler:
+        _handlers.setdefault(topic, []).append(func)
+        return func
+    return decorator
+
+
+def on_failure(topic: str):
+    """Decorator: run the function when an event of this topic is parked as failed"""
+    def decorator(func: Handler) -> Handler:
+        _failure_handlers.setdefault(topic, []).append(func)
+        return func
+    return decorator
+
+
+async def enqueue(session: AsyncSession, topic: str, payload: dict):
+    """Record post-commit work in the caller's transaction (does not commit)"""
+    now = datetime.now(timezone.utc)
+    session.add(OutboxEvent(topic=topic, payload=json.dumps(payload, default=str), created_at=now, available_at=now))
+    session.info["outbox_pending"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    # Dispatch right after the commit instead of waiting for the next poll
+    if session.info.pop("outbox_pending", False):
+        outbox_worker.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_after_rollback(session):
+    session.info.pop("outbox_pending", None)
+
+
+class OutboxWorker:
+    def __init__(self, session_factory=async_session):
+        self._session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._workers: List[asyncio.Task] = []
+        self._in_flight: set = set()
+        self._stopping = False
+        self.stats = {"processed": 0, "retried": 0, "failed": 0}
+
+    # ----------------------------
+    # Lifecycle
+    # ----------------------------
+    async def start(self, workers: Optional[int] = None):
+        if self._dispatcher is not None:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=settings.OUTBOX_BATCH_SIZE * 2)
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(workers or settings.OUTBOX_WORKERS)
+        ]
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        """Drain events that are due, then stop the pool"""
+        if self._dispatcher is None:
+            return
+        self._stopping = True
+        self.wake()
+        try:
+            await asyncio.wait_for(self._dispatcher, settings.OUTBOX_DRAIN_TIMEOUT_SECONDS)
+            await asyncio.wait_for(self._queue.join(), settings.OUTBOX_DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Outbox drain timed out; unfinished events will run after restart")
+            self._dispatcher.cancel()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._workers, return_exceptions=True)
+        await self._release(list(self._in_flight))
+        self._dispatcher = None
+        self._workers = []
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ----------------------------
+    # Dispatch
+    # ----------------------------
+    async def _dispatch(self):
+        while True:
+            try:
+                batch = await self._claim()
+            except Exception as e:
+                logger.error("Outbox claim failed: %s", e)
+                batch = []
+            for row in batch:
+                self._in_flight.add(row.id)
+                await self._queue.put(row)
+            if self._stopping and not batch:
+                return
+            if len(batch) < settings.OUTBOX_BATCH_SIZE and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.OUTBOX_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim(self) -> List[OutboxEvent]:
+        """Mark a batch of due rows as processing and return them (one UPDATE ... RETURNING)"""
+        now = datetime.now(timezone.utc)
+        stale = now - timedelta(seconds=settings.OUTBOX_LOCK_TIMEOUT_SECONDS)
+        due = (
+            select(OutboxEvent.id)
+            .where(or_(
+                and_(OutboxEvent.status == "pending", OutboxEvent.available_at <= now),
+                and_(OutboxEvent.status == "processing", OutboxEvent.locked_at < stale),
+            ))
+            .order_by(OutboxEvent.id)
+            .limit(settings.OUTBOX_BATCH_SIZE)
+        )
+        async with self._session_factory() as session:
+            result = await session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(due.scalar_subquery()))
+                .values(status="processing", locked_at=now, attempts=OutboxEvent.attempts + 1)
+                .returning(OutboxEvent)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.scalars().all()
+            await session.commit()
+        return sorted(rows, key=lambda r: r.id)
+
+    async def _work(self):
+        while True:
+            row = await self._queue.get()
+            try:
+                await self._process(row)
+            except Exception as e:
+                logger.error("Outbox event %s bookkeeping failed: %s", row.id, e)
+            finally:
+                self._in_flight.discard(row.id)
+                self._queue.task_done()
+
+    async def _process(self, row: OutboxEvent):
+        error = None
+        async with self._session_factory() as session:
+            try:
+                payload = json.loads(row.payload)
+                for handler in _handlers.get(row.topic, []):
+                    await handler(session, payload)
+                    await session.commit()
+            except Exception as e:
+                await session.rollback()
+                error = f"{type(e).__name__}: {e}"
+
+            if error is None:
+                await session.execute(delete(OutboxEvent).where(OutboxEvent.id == row.id))
+                self.stats["processed"] += 1
+            elif row.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                logger.error("Outbox event %s (%s) failed permanently: %s", row.id, row.topic, error)
+                await session.execute(
+                    update(OutboxEvent).where(OutboxEvent.id == row.id).values(status="failed", last_error=error)
+                )
+                self.stats["failed"] += 1
+                await self._compensate(session, row)
+            else:
+                delay = settings.OUTBOX_RETRY_BACKOFF_SECONDS * (2 ** (row.attempts - 1))
+                await session.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id == row.id)
+                    .values(
+                        status="pending",
+                        last_error=error,
+                        available_at=datetime.now(timezone.utc) + timedelta(seconds=delay),
+                    )
+                )
+                self.stats["retried"] += 1
+            await session.commit()
+
+    async def _compensate(self, session: AsyncSession, row: OutboxEvent):
+        """Run the topic's failure handlers; a failing one is logged, the row stays parked"""
+        payload = json.loads(row.payload)
+        for handler in _failure_handlers.get(row.topic, []):
+            try:
+                await handler(session, payload)
+            except Exception as e:
+                logger.error("Outbox failure handler for event %s (%s) failed: %s", row.id, row.topic, e)
+
+    async def _release(self, ids: List[int]):
+        """Return claimed-but-unfinished rows to the queue"""
+        if not ids:
+            return
+        async with self._session_factory() as session:
+            await session.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(ids), OutboxEvent.status == "processing")
+                .values(status="pending", attempts=OutboxEvent.attempts - 1)
+            )
+            await session.commit()
+
+
+outbox_worker = OutboxWorker()
@@ -0,0 +1,210 @@
+# app/services/payment_gateway.py
+
+"""
+Payment provider gateway.
+
+Responsibilities:
+- Hand pending payments to the configured provider from the outbox
+  ("payment.initiate"), outside any database transaction; a payment whose
+  hand-off is given up on is marked failed so the buyer can retry
+- Share one pooled async HTTP client with connect/read timeouts and cap
+  concurrent provider calls with a semaphore
+- Ship a local stub provider that settles charges through the webhook
+  batcher after a delay, for development and load tests
+
+The provider only acknowledges a charge here ('processing'); the final
+status arrives later as a callback (see payment_webhooks).
+"""
+
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.payment import Payment
+from app.services.outbox import on_failure, register
+from app.services.payment_webhooks import webhook_batcher
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """Transient provider failure (timeout, 5xx); the outbox retries the charge"""
+
+
+@dataclass
+class ChargeRequest:
+    payment_id: int
+    order_id: int
+    amount: float
+    method: str
+    callback_url: str
+
+
+@dataclass
+class ChargeResult:
+    transaction_id: Optional[str]
+    status: str  # processing (accepted, settles via callback) or failed (declined)
+    error: Optional[str] = None
+
+
+class PaymentProvider:
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def charge(self, charge: ChargeRequest) -> ChargeResult:
+        raise NotImplementedError
+
+
+class HttpPaymentProvider(PaymentProvider):
+    """POST {PAYMENT_PROVIDER_URL}/charges over a pooled keep-alive client"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=settings.PAYMENT_PROVIDER_URL,
+                headers={"Authorization": f"Bearer {settings.PAYMENT_PROVIDER_API_KEY}"},
+                timeout=httpx.Timeout(settings.PAYMENT_PROVIDER_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=settings.PAYMENT_PROVIDER_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.PAYMENT_PROVIDER_MAX_CONNECTIONS,
+                ),
+            )
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def charge(self, charge: ChargeRequest) -> ChargeResult:
+        await self.start()
+        try:
+            response = await self._client.post(
+                "/charges",
+                json={
+                    "reference": str(charge.payment_id),
+                    "amount": charge.amount,
+                    "method": charge.method,
+                    "callback_url": charge.callback_url,
+                },
+                # Retried outbox deliveries must not charge twice
+                headers={"Idempotency-Key": f"payment-{charge.payment_id}"},
+            )
+        except httpx.HTTPError as e:
+            raise ProviderError(f"{type(e).__name__}: {e}")
+        if response.status_code >= 500:
+            raise ProviderError(f"Provider returned {response.status_code}")
+        body = response.json() if response.content else {}
+        if response.status_code >= 400:
+            return ChargeResult(body.get("transaction_id"), "failed", body.get("error") or response.text)
+        return ChargeResult(body.get("transaction_id"), "processing")
+
+
+class StubPaymentProvider(PaymentProvider):
+    """Accepts every charge and reports PAYMENT_STUB_OUTCOME after PAYMENT_STUB_DELAY_SECONDS"""
+
+    def __init__(self):
+        self._tasks: set = set()
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def charge(self, charge: ChargeRequest) -> ChargeResult:
+        transaction_id = f"STUB-{uuid.uuid4().hex}"
+        task = asyncio.create_task(self._settle(charge.payment_id, transaction_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return ChargeResult(transaction_id, "processing")
+
+    async def _settle(self, payment_id: int, transaction_id: str):
+        await asyncio.sleep(settings.PAYMENT_STUB_DELAY_SECONDS)
+        try:
+            await webhook_batcher.submit([{
+                "payment_id": payment_id,
+                "transaction_id": transaction_id,
+                "status": settings.PAYMENT_STUB_OUTCOME,
+            }])
+        except Exception as e:
+            logger.error("Stub settlement of payment %s failed: %s", payment_id, e)
+
+
+PROVIDERS = {"stub": StubPaymentProvider, "http": HttpPaymentProvider}
+
+
+class PaymentGateway:
+    def __init__(self):
+        self.provider: PaymentProvider = PROVIDERS[settings.PAYMENT_PROVIDER]()
+        self._semaphore = asyncio.Semaphore(settings.PAYMENT_PROVIDER_CONCURRENCY)
+
+    async def start(self):
+        # A real provider settles through the signed webhook, which rejects everything without a secret
+        if settings.PAYMENT_PROVIDER != "stub" and not settings.PAYMENT_WEBHOOK_SECRET:
+            raise RuntimeError("PAYMENT_WEBHOOK_SECRET must be set when PAYMENT_PROVIDER is not 'stub'")
+        await self.provider.start()
+
+    async def stop(self):
+        await self.provider.stop()
+
+    async def charge(self, charge: ChargeRequest) -> ChargeResult:
+        async with self._semaphore:
+            return await self.provider.charge(charge)
+
+    async def initiate(self, session: AsyncSession, payment_id: int):
+        """Send a pending payment to the provider and record its answer"""
+        payment = await session.get(Payment, payment_id, populate_existing=True)
+        if payment is None or payment.status != "pending":
+            return  # already sent (redelivered outbox event) or settled
+        charge = ChargeRequest(
+            payment_id=payment.id,
+            order_id=payment.order_id,
+            amount=payment.amount,
+            method=payment.method,
+            callback_url=f"{settings.PUBLIC_BASE_URL}/api/v1/payments/webhook",
+        )
+        # Do not hold a transaction open across the network call
+        await session.commit()
+
+        result = await self.charge(charge)
+        if result.status == "failed":
+            logger.warning("Provider declined payment %s: %s", payment_id, result.error)
+        # A fast callback may already have settled the payment; only move it out of pending
+        await session.execute(
+            update(Payment)
+            .where(Payment.id == payment_id, Payment.status == "pending")
+            .values(status=result.status, transaction_id=result.transaction_id, version=Payment.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
+payment_gateway = PaymentGateway()
+
+
+@register("payment.initiate")
+async def _on_payment_initiate(session: AsyncSession, payload: dict):
+    await payment_gateway.initiate(session, payload["payment_id"])
+
+
+@on_failure("payment.initiate")
+async def _on_payment_initiate_failed(session: AsyncSession, payload: dict):
+    # The provider never accepted the charge; free the order for another attempt
+    await session.execute(
+        update(Payment)
+        .where(Payment.id == payload["payment_id"], Payment.status == "pending")
+        .values(status="failed", version=Payment.version + 1)
+        .execution_options(synchronize_session=False)
+    )
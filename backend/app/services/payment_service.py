@@ -1,10 +1,20 @@
 # app/services/payment_service.py
 
-from typing import List, Optional
-from sqlalchemy import select
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple, Union
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.concurrency import PreconditionFailed, VersionConflict, cas_update, update_versioned
+from app.core.config import settings
+from app.core.database import begin_immediate
+from app.core.idempotency import record_resource
+from app.core.pagination import after_cursor
+from app.models.archive import ArchivedOrder, ArchivedPayment
 from app.models.payment import Payment
 from app.models.order import Order
+from app.services.analytics_service import AnalyticsService
+from app.services.archive_service import ArchiveService
+from app.services.outbox import enqueue
 
 
 class PaymentService:
@@ -17,19 +27,71 @@ class PaymentService:
         amount: float,
         method: str = "mpesa"
     ) -> Payment:
-        """Create a new payment for an order"""
+        """
+        Start paying an order (legacy entry point): the same provider hand-off as
+        initiate_payment, so the payment cannot sit pending without being sent.
+        The amount must match the order total.
+        """
         order = await self.session.get(Order, order_id)
         if not order:
             raise ValueError("Order not found")
-        
-        payment = Payment(
-            order_id=order_id,
-            amount=amount,
-            status="pending",
-            method=method
-        )
-        self.session.add(payment)
-        await self.session.commit()
+        if round(amount, 2) != round(order.total_price, 2):
+            raise ValueError(f"Amount must equal the order total ({order.total_price:.2f})")
+        return await self.initiate_payment(order_id, method)
+
+    async def initiate_payment(
+        self,
+        order_id: int,
+        method: str = "mpesa",
+        expected_order_version: Optional[int] = None
+    ) -> Payment:
+        """
+        Record a pending payment for the order total and queue it for the provider.
+        Returns immediately; the payment settles when the provider calls back.
+        An earlier attempt still pending/processing after PAYMENT_PENDING_TIMEOUT_MINUTES
+        (callback lost) is marked failed instead of blocking the new one.
+        """
+        await begin_immediate(self.session)
+        try:
+            order = await self.session.get(Order, order_id, populate_existing=True)
+            if not order:
+                raise ValueError("Order not found")
+            if expected_order_version is not None and order.version != expected_order_version:
+                raise PreconditionFailed(f"Version mismatch: current version is {order.version}")
+            if order.is_paid:
+                raise ValueError("Order already paid")
+            if order.status == "rejected":
+                raise ValueError("Cannot pay for rejected order")
+            if order.status == "expired":
+                raise ValueError("Order expired before payment")
+            stale_before = datetime.now(timezone.utc) - timedelta(minutes=settings.PAYMENT_PENDING_TIMEOUT_MINUTES)
+            await self.session.execute(
+                update(Payment)
+                .where(
+                    Payment.order_id == order_id,
+                    Payment.status.in_(("pending", "processing")),
+                    Payment.created_at < stale_before,
+                )
+                .values(status="failed", version=Payment.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            in_flight = await self.session.execute(
+                select(Payment.id)
+                .where(Payment.order_id == order_id, Payment.status.in_(("pending", "processing")))
+                .limit(1)
+            )
+            if in_flight.first() is not None:
+                raise ValueError("Payment already in progress")
+
+            payment = Payment(order_id=order_id, amount=order.total_price, status="pending", method=method)
+            self.session.add(payment)
+            await self.session.flush()
+            await enqueue(self.session, "payment.initiate", {"payment_id": payment.id})
+            await record_resource(self.session, payment.id)
+            await self.session.commit()
+        except Exception:
+            await self.session.rollback()
+            raise
         await self.session.refresh(payment)
         return payment
 
@@ -37,59 +99,128 @@ class PaymentService:
         """Get a payment by ID"""
         return await self.session.get(Payment, payment_id)
 
+    async def get_buyer_payment(self, buyer_id: int, payment_id: int) -> Optional[Payment]:
+        """Get a payment only if it belongs to one of the buyer's orders (one joined PK lookup)"""
+        stmt = (
+            select(Payment)
+            .join(Order, Order.id == Payment.order_id)
+            .where(Payment.id == payment_id, Order.buyer_id == buyer_id)
+        )
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def list_buyer_payments(
+        self,
+        buyer_id: int,
+        status: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        limit: int = 20,
+    ) -> List[Payment]:
+        """
+        One page of the payments on a buyer's orders, newest first.
+
+        Joins through the buyer's orders (buyer_id index, then payments.order_id)
+        instead of collecting order ids first. Archived payments are merged in
+        only when the date range reaches the archive.
+        Fetches limit + 1 rows so the caller can tell if there is a next page.
+        """
+        tables = [(Payment, Order)]
+        if await ArchiveService(self.session).reaches_archive(created_from, ArchivedPayment.created_at):
+            tables.append((ArchivedPayment, ArchivedOrder))
+
+        payments = []
+        for payment_model, order_model in tables:
+            stmt = (
+                select(payment_model)
+                .join(order_model, order_model.id == payment_model.order_id)
+                .where(order_model.buyer_id == buyer_id)
+                .order_by(payment_model.created_at.desc(), payment_model.id.desc())
+                .limit(limit + 1)
+            )
+            if status:
+                stmt = stmt.where(payment_model.status == status)
+            if created_from:
+                stmt = stmt.where(payment_model.created_at >= created_from)
+            if created_to:
+                stmt = stmt.where(payment_model.created_at < created_to)
+            if cursor:
+                stmt = stmt.where(after_cursor(payment_model.created_at, payment_model.id, cursor))
+            result = await self.session.execute(stmt)
+            payments.extend(result.scalars().all())
+        if len(tables) > 1:
+            payments.sort(key=lambda p: (p.created_at, p.id), reverse=True)
+        return payments[:limit + 1]
+
     async def get_payment_by_order(self, order_id: int) -> Optional[Payment]:
-        """Get payment for a specific order"""
-        stmt = select(Payment).where(Payment.order_id == order_id)
+        """Get the latest payment for a specific order"""
+        stmt = select(Payment).where(Payment.order_id == order_id).order_by(Payment.id.desc()).limit(1)
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
 
+    async def get_payment_by_transaction(
+        self, transaction_id: str, buyer_id: Optional[int] = None, include_archive: bool = True
+    ) -> Optional[Union[Payment, ArchivedPayment]]:
+        """
+        Find a payment by provider transaction id (unique index probe; hot table first).
+        With `buyer_id`, only a payment on one of that buyer's orders is returned.
+        """
+        tables = [(Payment, Order)]
+        if include_archive:
+            tables.append((ArchivedPayment, ArchivedOrder))
+        for model, order_model in tables:
+            stmt = select(model).where(model.transaction_id == transaction_id)
+            if buyer_id is not None:
+                stmt = stmt.join(order_model, order_model.id == model.order_id).where(order_model.buyer_id == buyer_id)
+            result = await self.session.execute(stmt)
+            payment = result.scalar_one_or_none()
+            if payment is not None:
+                return payment
+        return None
+
     async def list_payments(self) -> List[Payment]:
         """List all payments"""
         stmt = select(Payment)
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
-    async def update_payment_status(self, payment: Payment, status: str) -> Payment:
-        """Update payment status"""
-        payment.status = status
-        self.session.add(payment)
-        await self.session.commit()
-        await self.session.refresh(payment)
-        return payment
+    async def _mark_order_paid(self, order_id: int):
+        """Versioned update of the payment's order, in the caller's transaction"""
+        order = await self.session.get(Order, order_id, populate_existing=True)
+        if order and order.status == "expired":
+            raise ValueError("Order expired before payment")
+        if order and order.is_paid:
+            # Completed payments are unique per order (uq_payments_order_id_completed)
+            raise ValueError("Order already has a completed payment")
+        if order:
+            await AnalyticsService(self.session).move_order(order.id, order.status, "paid")
+            await enqueue(self.session, "order.updated", {"order_id": order.id})
+            if not await cas_update(self.session, Order, order.id, order.version, {"is_paid": True, "status": "paid"}):
+                raise VersionConflict(f"Order {order.id} was modified concurrently")
+
+    async def update_payment_status(
+        self,
+        payment: Payment,
+        status: Optional[str],
+        method: Optional[str] = None,
+        expected_version: Optional[int] = None
+    ) -> Payment:
+        """Update payment status (and method); completing a payment also marks the order paid"""
+        async def apply(current: Payment) -> dict:
+            values = {"status": status or current.status}
+            if method:
+                values["method"] = method
+            if status == "completed" and current.status != "completed":
+                await self._mark_order_paid(current.order_id)
+            return values
+
+        return await update_versioned(self.session, Payment, payment.id, apply, expected_version)
 
-    async def complete_payment(self, payment: Payment) -> Payment:
+    async def complete_payment(self, payment: Payment, expected_version: Optional[int] = None) -> Payment:
         """Mark payment as completed and update order"""
-        payment.status = "completed"
-        self.session.add(payment)
-        
-        # Also mark the order as paid
-        order = await self.session.get(Order, payment.order_id)
-        if order:
-            order.is_paid = True
-            order.status = "paid"
-            self.session.add(order)
-        
-        await self.session.commit()
-        await self.session.refresh(payment)
-        return payment
+        return await self.update_payment_status(payment, "completed", expected_version=expected_version)
 
     async def pay_order(self, order_id: int, amount: float) -> Payment:
-        """Create and complete a payment for an order (legacy method)"""
-        order = await self.session.get(Order, order_id)
-        if not order:
-            raise ValueError("Order not found")
-        
-        payment = Payment(
-            order_id=order_id,
-            amount=amount,
-            status="completed",
-            method="mpesa"
-        )
-        order.is_paid = True
-        order.status = "paid"
-        
-        self.session.add(order)
-        self.session.add(payment)
-        await self.session.commit()
-        await self.session.refresh(payment)
-        return payment
+        """Start paying an order through the provider (legacy method; settles asynchronously)"""
+        return await self.initiate_payment(order_id)
@@ -0,0 +1,200 @@
+# app/services/payment_webhooks.py
+
+"""
+Payment provider callback ingestion.
+
+Responsibilities:
+- Verify webhook signatures (HMAC-SHA256 of the raw body)
+- Group callbacks arriving close together and apply each group in one
+  write transaction; every caller waits until its callbacks are committed.
+  If a group fails, its callbacks are retried one per transaction so one
+  bad callback cannot fail the others
+- Settle payments idempotently: replayed callbacks are acknowledged and ignored
+
+A completed payment for an order that can no longer take it (already paid,
+rejected or expired) is kept as 'refund_pending' instead of 'completed'.
+A completed callback for a payment we had given up on ('failed' after a
+timeout) is still recorded: the provider did take the money.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session, begin_immediate
+from app.models.order import Order
+from app.models.payment import Payment
+from app.services.analytics_service import AnalyticsService
+from app.services.outbox import enqueue
+
+logger = logging.getLogger(__name__)
+
+FINAL_PAYMENT_STATUSES = ("completed", "failed", "refund_pending")
+SETTLED_PAYMENT_STATUSES = ("completed", "refund_pending")  # a completed callback changes nothing
+
+# Process-wide ingestion counters (read by diagnostics)
+webhook_stats = {"batches": 0, "callbacks": 0, "split_batches": 0}
+
+
+def verify_signature(body: bytes, signature: Optional[str]) -> bool:
+    """Check X-Signature against PAYMENT_WEBHOOK_SECRET; without a configured secret nothing verifies"""
+    if not settings.PAYMENT_WEBHOOK_SECRET or not signature:
+        return False
+    expected = hmac.new(settings.PAYMENT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.removeprefix("sha256="))
+
+
+async def apply_callbacks(session: AsyncSession, callbacks: List[dict]) -> List[str]:
+    """
+    Apply provider callbacks in one transaction.
+    Each callback is {"payment_id", "transaction_id", "status": "completed" | "failed"};
+    payment_id may be omitted when the provider only knows its transaction id.
+    Returns one outcome per callback: applied, duplicate, refund_pending, unknown_payment
+    or rejected (its transaction_id already belongs to another payment).
+    """
+    await begin_immediate(session)
+    try:
+        payment_ids = {c["payment_id"] for c in callbacks if c.get("payment_id") is not None}
+        transaction_ids = {c["transaction_id"] for c in callbacks if c.get("transaction_id")}
+        # Both lookups are index probes (primary key, unique transaction_id)
+        result = await session.execute(
+            select(Payment)
+            .where(or_(Payment.id.in_(payment_ids), Payment.transaction_id.in_(transaction_ids)))
+            .with_for_update()
+        )
+        payments = {p.id: p for p in result.scalars()}
+        by_transaction = {p.transaction_id: p for p in payments.values() if p.transaction_id}
+        result = await session.execute(
+            select(Order).where(Order.id.in_({p.order_id for p in payments.values()})).with_for_update()
+        )
+        orders = {o.id: o for o in result.scalars()}
+
+        outcomes = []
+        paid_from: Dict[str, List[int]] = defaultdict(list)  # old status -> orders moved to "paid"
+        for callback in callbacks:
+            if callback.get("payment_id") is not None:
+                payment = payments.get(callback["payment_id"])
+            else:
+                payment = by_transaction.get(callback["transaction_id"])
+            if payment is None:
+                outcomes.append("unknown_payment")
+                continue
+            final = FINAL_PAYMENT_STATUSES if callback["status"] == "failed" else SETTLED_PAYMENT_STATUSES
+            if payment.status in final:
+                outcomes.append("duplicate")
+                continue
+            transaction_id = callback.get("transaction_id")
+            if not payment.transaction_id and transaction_id:
+                # The unique index would fail the whole batch; refuse just this callback
+                owner = by_transaction.get(transaction_id)
+                if owner is not None and owner.id != payment.id:
+                    outcomes.append("rejected")
+                    continue
+                payment.transaction_id = transaction_id
+                by_transaction[transaction_id] = payment
+            payment.version += 1
+            if callback["status"] == "failed":
+                payment.status = "failed"
+                outcomes.append("applied")
+                continue
+
+            order = orders.get(payment.order_id)
+            if order is None or order.is_paid or order.status in ("rejected", "expired"):
+                payment.status = "refund_pending"
+                outcomes.append("refund_pending")
+                continue
+            paid_from[order.status].append(order.id)
+            order.status, order.is_paid = "paid", True
+            order.version += 1
+            payment.status = "completed"
+            await enqueue(session, "order.updated", {"order_id": order.id})
+            outcomes.append("applied")
+
+        # One rollup move per old status instead of one per order
+        for old_status, order_ids in paid_from.items():
+            await AnalyticsService(session).move_orders(order_ids, old_status, "paid")
+        await session.commit()
+        return outcomes
+    except Exception:
+        await session.rollback()
+        raise
+
+
+class WebhookBatcher:
+    """Coalesce concurrent callback deliveries into one transaction per window"""
+
+    def __init__(self, session_factory=async_session):
+        self._session_factory = session_factory
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+
+    async def submit(self, callbacks: List[dict]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for callback in callbacks:
+            future = loop.create_future()
+            self._pending.append((callback, future))
+            futures.append(future)
+        if len(self._pending) >= settings.PAYMENT_WEBHOOK_BATCH_SIZE:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(settings.PAYMENT_WEBHOOK_BATCH_WINDOW_SECONDS)
+        return list(await asyncio.gather(*futures))
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, lambda: asyncio.ensure_future(self._flush()))
+
+    async def _flush(self):
+        async with self._lock:
+            self._timer = None
+            while self._pending:
+                batch = self._pending[:settings.PAYMENT_WEBHOOK_BATCH_SIZE]
+                del self._pending[:len(batch)]
+                error = await self._apply(batch)
+                if error is None or len(batch) == 1:
+                    continue
+                # Isolate the bad callback: retry each on its own
+                webhook_stats["split_batches"] += 1
+                for item in batch:
+                    await self._apply([item])
+
+    async def _apply(self, batch: List[Tuple[dict, asyncio.Future]]) -> Optional[Exception]:
+        """Apply a batch in one transaction and resolve its futures; on failure return the error"""
+        try:
+            async with self._session_factory() as session:
+                outcomes = await apply_callbacks(session, [callback for callback, _ in batch])
+        except Exception as e:
+            logger.error("Applying %d payment callbacks failed: %s", len(batch), e)
+            if len(batch) == 1:
+                self._fail(batch, e)
+            return e
+        self._resolve(batch, outcomes)
+        return None
+
+    @staticmethod
+    def _resolve(batch: List[Tuple[dict, asyncio.Future]], outcomes: List[str]):
+        webhook_stats["batches"] += 1
+        webhook_stats["callbacks"] += len(batch)
+        for (_, future), outcome in zip(batch, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+
+    @staticmethod
+    def _fail(batch: List[Tuple[dict, asyncio.Future]], error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+
+webhook_batcher = WebhookBatcher()
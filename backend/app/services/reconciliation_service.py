@@ -0,0 +1,143 @@
+# app/services/reconciliation_service.py
+
+"""
+Payment reconciliation as a streaming merge-join.
+
+Responsibilities:
+- Scan orders (by id) and payments (by order_id, id) in key order with
+  keyset-paginated reads, so memory stays constant however many rows exist
+- Merge the two streams and check each order against its payments
+- Yield one issue dict per problem and keep running totals in `summary`
+
+Issue types:
+- missing_payment: order is paid but has no completed payment
+- duplicate_payment: order has more than one completed payment
+- amount_mismatch: completed payment amount differs from Order.total_price
+- unpaid_with_completed_payment: completed payment on an order not marked paid
+- orphan_payment: payment whose order does not exist
+
+Hot and archived tables are reconciled separately; an order and its
+payments are always archived together.
+"""
+
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.archive import ArchivedOrder, ArchivedPayment
+from app.models.order import Order
+from app.models.payment import Payment
+
+ISSUE_TYPES = (
+    "missing_payment",
+    "duplicate_payment",
+    "amount_mismatch",
+    "unpaid_with_completed_payment",
+    "orphan_payment",
+)
+
+# Amounts are floats; ignore sub-cent rounding noise
+AMOUNT_TOLERANCE = 0.005
+
+SCOPES = {"hot": (Order, Payment), "archive": (ArchivedOrder, ArchivedPayment)}
+
+
+class ReconciliationService:
+    def __init__(self, session: AsyncSession, batch_size: int = 1000):
+        self.session = session
+        self.batch_size = batch_size
+        self.summary = {
+            "orders_checked": 0,
+            "payments_checked": 0,
+            "issues": {issue: 0 for issue in ISSUE_TYPES},
+        }
+
+    async def _orders(self, model) -> AsyncIterator:
+        last_id = None
+        while True:
+            stmt = (
+                select(model.id, model.total_price, model.is_paid, model.status)
+                .order_by(model.id)
+                .limit(self.batch_size)
+            )
+            if last_id is not None:
+                stmt = stmt.where(model.id > last_id)
+            rows = (await self.session.execute(stmt)).all()
+            for row in rows:
+                yield row
+            if len(rows) < self.batch_size:
+                return
+            last_id = rows[-1].id
+
+    async def _payments(self, model) -> AsyncIterator:
+        last = None
+        while True:
+            stmt = (
+                select(model.id, model.order_id, model.amount, model.status)
+                .order_by(model.order_id, model.id)
+                .limit(self.batch_size)
+            )
+            if last is not None:
+                stmt = stmt.where(or_(
+                    model.order_id > last.order_id,
+                    and_(model.order_id == last.order_id, model.id > last.id),
+                ))
+            rows = (await self.session.execute(stmt)).all()
+            for row in rows:
+                yield row
+            if len(rows) < self.batch_size:
+                return
+            last = rows[-1]
+
+    def _issue(self, scope: str, issue: str, order_id: int, **details) -> Dict:
+        self.summary["issues"][issue] += 1
+        return {"scope": scope, "type": issue, "order_id": order_id, **details}
+
+    def _check(self, scope: str, order, payments: List) -> List[Dict]:
+        issues = []
+        completed = [p for p in payments if p.status == "completed"]
+        if order.is_paid and not completed:
+            issues.append(self._issue(scope, "missing_payment", order.id, order_total=order.total_price))
+        if len(completed) > 1:
+            issues.append(self._issue(
+                scope, "duplicate_payment", order.id, payment_ids=[p.id for p in completed]
+            ))
+        if completed and not order.is_paid:
+            issues.append(self._issue(
+                scope, "unpaid_with_completed_payment", order.id,
+                payment_ids=[p.id for p in completed], order_status=order.status,
+            ))
+        for payment in completed:
+            if abs(float(payment.amount) - float(order.total_price)) > AMOUNT_TOLERANCE:
+                issues.append(self._issue(
+                    scope, "amount_mismatch", order.id,
+                    payment_id=payment.id, amount=payment.amount, order_total=order.total_price,
+                ))
+        return issues
+
+    async def run(self, scopes: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Yield issues in order-id order; `summary` is complete once the iterator is exhausted"""
+        for scope in scopes or list(SCOPES):
+            order_model, payment_model = SCOPES[scope]
+            payments = self._payments(payment_model)
+            payment = await anext(payments, None)
+
+            async for order in self._orders(order_model):
+                self.summary["orders_checked"] += 1
+                while payment is not None and payment.order_id < order.id:
+                    self.summary["payments_checked"] += 1
+                    yield self._issue(scope, "orphan_payment", payment.order_id, payment_id=payment.id)
+                    payment = await anext(payments, None)
+                group = []
+                while payment is not None and payment.order_id == order.id:
+                    self.summary["payments_checked"] += 1
+                    group.append(payment)
+                    payment = await anext(payments, None)
+                for issue in self._check(scope, order, group):
+                    yield issue
+
+            while payment is not None:
+                self.summary["payments_checked"] += 1
+                yield self._issue(scope, "orphan_payment", payment.order_id, payment_id=payment.id)
+                payment = await anext(payments, None)
@@ -0,0 +1,214 @@
+# app/services/reservation_service.py
+
+"""
+Short-lived stock reservations for cart lines.
+
+Responsibilities:
+- Hold stock for a signed-in buyer's cart when items are added, with a TTL
+- Keep Animal.reserved equal to the sum of live reservation rows, using
+  conditional UPDATEs so two carts can never reserve the same unit
+- Release expired reservations in set-based batches (indexed on expires_at)
+
+A reservation is a soft hold: checkout consumes the buyer's own hold and
+otherwise only needs unreserved stock, so an expired hold never blocks a sale.
+Holds are not part of the public catalog, so they leave catalog_generation
+(and with it the response and cart summary caches) alone.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session, begin_immediate, is_lock_error
+from app.models.animal import Animal
+from app.models.reservation import CartReservation
+
+logger = logging.getLogger(__name__)
+
+# Process-wide sweeper counters (read by diagnostics)
+reservation_stats = {"sweeps": 0, "expired": 0, "units_released": 0, "lock_skips": 0}
+
+
+def _not_below_zero(expr):
+    return case((expr < 0, 0), else_=expr)
+
+
+class ReservationService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    def _expiry(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(minutes=settings.CART_RESERVATION_TTL_MINUTES)
+
+    async def held(self, owner: str, animal_ids: Iterable[int]) -> Dict[int, int]:
+        """Units currently held by the owner per animal (expired-but-unswept holds still count)"""
+        result = await self.session.execute(
+            select(CartReservation.animal_id, CartReservation.quantity).where(
+                CartReservation.owner == owner, CartReservation.animal_id.in_(list(animal_ids))
+            )
+        )
+        return {row.animal_id: row.quantity for row in result}
+
+    async def drop(self, owner: str, animal_ids: Iterable[int]):
+        """Delete the owner's rows in the caller's transaction; the caller adjusts Animal.reserved"""
+        await self.session.execute(
+            delete(CartReservation).where(
+                CartReservation.owner == owner, CartReservation.animal_id.in_(list(animal_ids))
+            )
+        )
+
+    async def reserve(self, owner: str, targets: Dict[int, int]):
+        """
+        Set the owner's hold on each animal to exactly targets[animal_id]
+        units (0 releases it) and refresh the TTL, in one transaction.
+        Raises ValueError, changing nothing, if any animal lacks free stock.
+        """
+        if not targets:
+            return
+        await begin_immediate(self.session)
+        try:
+            result = await self.session.execute(
+                select(CartReservation).where(
+                    CartReservation.owner == owner, CartReservation.animal_id.in_(list(targets))
+                )
+            )
+            rows = {row.animal_id: row for row in result.scalars()}
+            now, expires_at = datetime.now(timezone.utc), self._expiry()
+
+            for animal_id, quantity in targets.items():
+                row = rows.get(animal_id)
+                delta = quantity - (row.quantity if row else 0)
+                if delta > 0:
+                    result = await self.session.execute(
+                        update(Animal)
+                        .where(Animal.id == animal_id, Animal.available == True, Animal.stock - Animal.reserved >= delta)
+                        .values(reserved=Animal.reserved + delta)
+                        .execution_options(synchronize_session=False)
+                    )
+                    if result.rowcount != 1:
+                        free = (await self.session.execute(
+                            select(Animal.stock - Animal.reserved).where(Animal.id == animal_id)
+                        )).scalar() or 0
+                        held = row.quantity if row else 0
+                        raise ValueError(f"Only {max(free, 0) + held} of animal {animal_id} available")
+                elif delta < 0:
+                    await self.session.execute(
+                        update(Animal)
+                        .where(Animal.id == animal_id)
+                        .values(reserved=_not_below_zero(Animal.reserved + delta))
+                        .execution_options(synchronize_session=False)
+                    )
+
+                if quantity <= 0:
+                    if row is not None:
+                        await self.session.delete(row)
+                elif row is not None:
+                    row.quantity = quantity
+                    row.expires_at = expires_at
+                else:
+                    self.session.add(CartReservation(
+                        owner=owner, animal_id=animal_id, quantity=quantity, created_at=now, expires_at=expires_at
+                    ))
+            await self.session.commit()
+        except Exception:
+            await self.session.rollback()
+            raise
+
+    async def release(self, owner: str):
+        """Release every hold of the owner (cart cleared)"""
+        result = await self.session.execute(
+            select(CartReservation.animal_id).where(CartReservation.owner == owner)
+        )
+        await self.reserve(owner, {animal_id: 0 for animal_id in result.scalars()})
+
+    async def expire(self, now: datetime, limit: int) -> Tuple[int, int]:
+        """
+        Release up to `limit` holds that expired before `now`: one indexed
+        range read, one CASE update on animals, one delete.
+        Returns (reservations expired, units released).
+        """
+        await begin_immediate(self.session)
+        try:
+            result = await self.session.execute(
+                select(CartReservation.id, CartReservation.animal_id, CartReservation.quantity)
+                .where(CartReservation.expires_at < now)
+                .order_by(CartReservation.expires_at)
+                .limit(limit)
+            )
+            rows = result.all()
+            if not rows:
+                await self.session.rollback()
+                return 0, 0
+            units: Dict[int, int] = {}
+            for row in rows:
+                units[row.animal_id] = units.get(row.animal_id, 0) + row.quantity
+            await self.session.execute(
+                update(Animal)
+                .where(Animal.id.in_(list(units)))
+                .values(reserved=_not_below_zero(Animal.reserved - case(units, value=Animal.id, else_=0)))
+                .execution_options(synchronize_session=False)
+            )
+            await self.session.execute(delete(CartReservation).where(CartReservation.id.in_([r.id for r in rows])))
+            await self.session.commit()
+        except Exception:
+            await self.session.rollback()
+            raise
+        return len(rows), sum(units.values())
+
+
+class ReservationSweeper:
+    def __init__(self, session_factory=async_session):
+        self._session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("Reservation sweep failed: %s", e)
+            await asyncio.sleep(settings.RESERVATION_SWEEP_INTERVAL_SECONDS)
+
+    async def sweep(self, now: Optional[datetime] = None) -> int:
+        """Release every expired hold, one batch per transaction; returns the number expired"""
+        now = now or datetime.now(timezone.utc)
+        total = 0
+        reservation_stats["sweeps"] += 1
+        while True:
+            async with self._session_factory() as session:
+                try:
+                    expired, units = await ReservationService(session).expire(
+                        now, settings.RESERVATION_EXPIRY_BATCH_SIZE
+                    )
+                except Exception as e:
+                    if not is_lock_error(e):
+                        raise
+                    reservation_stats["lock_skips"] += 1
+                    break
+            reservation_stats["expired"] += expired
+            reservation_stats["units_released"] += units
+            total += expired
+            if expired < settings.RESERVATION_EXPIRY_BATCH_SIZE:
+                break
+        return total
+
+
+reservation_sweeper = ReservationSweeper()
@@ -0,0 +1,117 @@
+# app/services/storefront_service.py
+
+"""
+Public farmer storefront.
+
+Responsibilities:
+- Assemble a farmer's profile, available listings per species and lifetime
+  sales with four aggregate queries (profile, animals GROUP BY species,
+  sales_rollups SUM, order_rollups SUM)
+- Cache the result per farmer; animal writes and the farmer's order events
+  bump storefront_generation for that farmer, which invalidates the entry
+"""
+
+import time
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import LRUCache, storefront_generation
+from app.core.config import settings
+from app.models.analytics import OrderRollup, SalesRollup
+from app.models.animal import Animal
+from app.models.order import OrderItem
+from app.models.user import Farmer, User
+from app.schemas.storefront import FarmerStorefront, SpeciesListing, StorefrontProfile, StorefrontSales
+from app.services.outbox import register
+
+# Orders in these statuses are not counted as sales
+UNSOLD_STATUSES = ("pending", "rejected", "expired")
+
+# farmer_id -> (storefront generation, expires at, storefront)
+_storefront_cache = LRUCache(maxsize=settings.STOREFRONT_CACHE_SIZE)
+
+
+class StorefrontService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get(self, farmer_id: int) -> Optional[FarmerStorefront]:
+        """Storefront for a farmer, or None if there is no such farmer"""
+        generation = storefront_generation.value(farmer_id)
+        cached = _storefront_cache.get(farmer_id)
+        if cached and cached[0] == generation and cached[1] > time.monotonic():
+            return cached[2]
+
+        storefront = await self._build(farmer_id)
+        if storefront is not None:
+            _storefront_cache.set(
+                farmer_id, (generation, time.monotonic() + settings.STOREFRONT_CACHE_TTL_SECONDS, storefront)
+            )
+        return storefront
+
+    async def _build(self, farmer_id: int) -> Optional[FarmerStorefront]:
+        result = await self.session.execute(
+            select(Farmer.id, Farmer.farm_name, Farmer.location, Farmer.bio, User.name)
+            .join(User, User.id == Farmer.user_id)
+            .where(Farmer.id == farmer_id)
+        )
+        profile = result.first()
+        if profile is None:
+            return None
+
+        result = await self.session.execute(
+            select(
+                Animal.species,
+                func.count(Animal.id).label("listing_count"),
+                func.sum(Animal.stock).label("stock"),
+                func.min(Animal.price).label("min_price"),
+                func.max(Animal.price).label("max_price"),
+            )
+            .where(Animal.farmer_id == farmer_id, Animal.available == True)
+            .group_by(Animal.species)
+            .order_by(Animal.species)
+        )
+        listings = [SpeciesListing(**row._mapping) for row in result]
+
+        # Rollups already hold per-day totals, including archived orders. Species rows
+        # count a multi-species order once per species, so orders come from order_rollups.
+        result = await self.session.execute(
+            select(
+                func.coalesce(func.sum(SalesRollup.quantity), 0).label("quantity"),
+                func.coalesce(func.sum(SalesRollup.revenue), 0.0).label("revenue"),
+            ).where(SalesRollup.farmer_id == farmer_id, SalesRollup.status.not_in(UNSOLD_STATUSES))
+        )
+        totals = result.one()
+        order_count = await self.session.scalar(
+            select(func.coalesce(func.sum(OrderRollup.order_count), 0))
+            .where(OrderRollup.farmer_id == farmer_id, OrderRollup.status.not_in(UNSOLD_STATUSES))
+        )
+        sales = StorefrontSales(order_count=order_count, **totals._mapping)
+
+        return FarmerStorefront(
+            farmer=StorefrontProfile(**profile._mapping),
+            listing_count=sum(listing.listing_count for listing in listings),
+            listings=listings,
+            sales=sales,
+        )
+
+
+async def invalidate_order_farmers(session: AsyncSession, order_id: int):
+    """Invalidate the storefronts of every farmer with a line in the order (outbox handler)"""
+    result = await session.execute(
+        select(OrderItem.farmer_id).where(OrderItem.order_id == order_id).distinct()
+    )
+    for farmer_id in result.scalars():
+        storefront_generation.bump(farmer_id)
+
+
+@register("order.created")
+async def _on_order_created(session: AsyncSession, payload: dict):
+    await invalidate_order_farmers(session, payload["order_id"])
+
+
+@register("order.updated")
+async def _on_order_updated(session: AsyncSession, payload: dict):
+    await invalidate_order_farmers(session, payload["order_id"])
@@ -0,0 +1,81 @@
+# app/services/user_service.py
+
+"""
+Admin user directory.
+
+Responsibilities:
+- Page through users in email order with keyset pagination on the unique
+  email index (cost depends on the page size, not the offset)
+- Filter by role, active status and email prefix; the prefix becomes an
+  index range (email >= prefix AND email < prefix + U+FFFF) rather than LIKE
+- Iterate the whole filtered directory in fixed-size batches for exports
+"""
+
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+
+# Sorts after every character that can appear in an email address
+_PREFIX_END = "\uffff"
+
+
+class UserService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    def _directory(
+        self,
+        role: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        email_prefix: Optional[str] = None,
+        after_email: Optional[str] = None,
+    ):
+        stmt = select(User).order_by(User.email)
+        if role:
+            stmt = stmt.where(User.role == role)
+        if is_active is not None:
+            stmt = stmt.where(User.is_active == is_active)
+        if email_prefix:
+            stmt = stmt.where(User.email >= email_prefix, User.email < email_prefix + _PREFIX_END)
+        if after_email is not None:
+            stmt = stmt.where(User.email > after_email)
+        return stmt
+
+    async def list_users(
+        self,
+        role: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        email_prefix: Optional[str] = None,
+        after_email: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[User]:
+        """
+        One page of the directory in email order.
+        Fetches limit + 1 rows so the caller can tell if there is a next page.
+        """
+        stmt = self._directory(role, is_active, email_prefix, after_email).limit(limit + 1)
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+
+    async def iter_users(
+        self,
+        role: Optional[str] = None,
+        is_active: Optional[bool] = None,
+        email_prefix: Optional[str] = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[User]:
+        """Yield every matching user in email order, one keyset page per query"""
+        after_email = None
+        while True:
+            stmt = self._directory(role, is_active, email_prefix, after_email).limit(batch_size)
+            users = (await self.session.execute(stmt)).scalars().all()
+            for user in users:
+                yield user
+            if len(users) < batch_size:
+                return
+            after_email = users[-1].email
+            # Exported rows are not needed again; keep the identity map small
+            self.session.expunge_all()
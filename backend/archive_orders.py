@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Move settled orders into the archive tables
+
+Paid or rejected orders older than ARCHIVE_AFTER_DAYS (or --older-than-days)
+are moved with their items and payments into archived_orders,
+archived_order_items and archived_payments, one batch per transaction.
+Safe to run repeatedly, e.g. nightly from cron.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import init_db, async_session
+from app.services.archive_service import ArchiveService
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Archive settled orders")
+    parser.add_argument("--older-than-days", type=int, default=None, help="Override ARCHIVE_AFTER_DAYS")
+    parser.add_argument("--batch-size", type=int, default=None, help="Override ARCHIVE_BATCH_SIZE")
+    return parser.parse_args()
+
+
+async def archive(args):
+    await init_db()
+    async with async_session() as session:
+        moved = await ArchiveService(session).archive(args.older_than_days, args.batch_size)
+    print(f"Archived {moved} orders")
+
+
+if __name__ == "__main__":
+    asyncio.run(archive(parse_args()))
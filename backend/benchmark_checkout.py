@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Concurrent checkout stress benchmark
+
+Seeds N animals and M buyers into a temporary SQLite file, fills each buyer's
+cart with overlapping animals and fires concurrent POST /orders/checkout calls
+through the ASGI app (no network). Reports throughput, latency percentiles,
+lock retries and oversold animals; exits non-zero if anything was oversold.
+With --stock > 1 each animal is a lot of that many units and many buyers
+can buy from the same lot.
+
+Usage:
+    python benchmark_checkout.py --animals 200 --buyers 500 --concurrency 50
+    python benchmark_checkout.py --pragma journal_mode=WAL --pragma synchronous=NORMAL
+    python benchmark_checkout.py --animals 10 --stock 50 --buyers 500
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent checkout stress benchmark")
+    parser.add_argument("--animals", type=int, default=200, help="Number of animals to seed")
+    parser.add_argument("--buyers", type=int, default=500, help="Number of buyers to seed")
+    parser.add_argument("--stock", type=int, default=1, help="Units in stock per animal")
+    parser.add_argument("--items-per-cart", type=int, default=3, help="Animals in each buyer's cart")
+    parser.add_argument("--concurrency", type=int, default=50, help="Max in-flight checkouts")
+    parser.add_argument("--pragma", action="append", default=[], help="SQLite PRAGMA to apply, e.g. journal_mode=WAL")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for cart contents")
+    return parser.parse_args()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def seed(args):
+    from sqlalchemy import insert
+    from app.core.database import init_db, async_session
+    from app.core.security import create_access_token
+    from app.models.user import User, Farmer
+    from app.models.animal import Animal
+    from app.models.cart import CartItem
+
+    await init_db()
+    rng = random.Random(args.seed)
+
+    async with async_session() as session:
+        farmer_user = User(name="Bench Farmer", email="bench-farmer@test.com", password_hash="x", role="farmer")
+        session.add(farmer_user)
+        await session.flush()
+        farmer = Farmer(user_id=farmer_user.id, farm_name="Bench Farm")
+        session.add(farmer)
+        await session.flush()
+
+        await session.execute(insert(Animal), [
+            {"name": f"Animal {i}", "species": "Cattle", "price": float(100 + i), "available": True, "stock": args.stock, "farmer_id": farmer.id}
+            for i in range(args.animals)
+        ])
+        await session.execute(insert(User), [
+            {"name": f"Buyer {i}", "email": f"bench-buyer{i}@test.com", "password_hash": "x", "role": "user", "is_active": True}
+            for i in range(args.buyers)
+        ])
+        await session.commit()
+
+        from sqlalchemy import select
+        animal_ids = (await session.execute(select(Animal.id))).scalars().all()
+        buyer_ids = (await session.execute(select(User.id).where(User.role == "user"))).scalars().all()
+
+        cart_rows = []
+        for buyer_id in buyer_ids:
+            for animal_id in rng.sample(animal_ids, min(args.items_per_cart, len(animal_ids))):
+                cart_rows.append({"buyer_id": buyer_id, "animal_id": animal_id, "quantity": 1, "price": 0.0})
+        await session.execute(insert(CartItem), cart_rows)
+        await session.commit()
+
+    return [create_access_token({"sub": str(buyer_id), "roles": ["user"]}) for buyer_id in buyer_ids]
+
+
+async def run(args):
+    import httpx
+    from sqlalchemy import event, func, select
+    from app.core.database import engine, async_session
+    from app.main import app
+    from app.models.order import OrderItem
+    from app.services.order_service import checkout_stats
+
+    if args.pragma:
+        @event.listens_for(engine.sync_engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in args.pragma:
+                cursor.execute(f"PRAGMA {pragma}")
+            cursor.close()
+
+    tokens = await seed(args)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, statuses = [], {}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def checkout(token):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/api/v1/orders/checkout", headers={"Authorization": f"Bearer {token}"})
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(checkout(token) for token in tokens))
+        elapsed = time.perf_counter() - started
+
+    async with async_session() as session:
+        stmt = (
+            select(OrderItem.animal_id)
+            .group_by(OrderItem.animal_id)
+            .having(func.sum(OrderItem.quantity) > args.stock)
+        )
+        oversold = len((await session.execute(stmt)).scalars().all())
+        sold = (await session.execute(select(func.coalesce(func.sum(OrderItem.quantity), 0)))).scalar()
+
+    succeeded = statuses.get(201, 0)
+    print(f"Checkouts:      {len(tokens)} attempted, {succeeded} succeeded in {elapsed:.2f}s")
+    print(f"Throughput:     {succeeded / elapsed:.1f} checkouts/sec ({len(tokens) / elapsed:.1f} requests/sec)")
+    print(f"Latency p50:    {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"Latency p95:    {percentile(latencies, 95) * 1000:.1f} ms")
+    print(f"Latency p99:    {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"Status codes:   {dict(sorted(statuses.items()))}")
+    print(f"Lock retries:   {checkout_stats['lock_retries']}")
+    print(f"Conflicts:      {checkout_stats['conflicts']}")
+    print(f"Units sold:     {sold} of {args.animals * args.stock}")
+    print(f"Oversold:       {oversold}")
+    return oversold
+
+
+def main():
+    args = parse_args()
+    tmpdir = tempfile.mkdtemp(prefix="farmart-bench-")
+    # Must be set before the app (and its engine) is imported
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmpdir}/bench.db"
+    os.environ["DEBUG"] = "false"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    oversold = asyncio.run(run(args))
+    if oversold:
+        print("FAIL: animals were sold more than once")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
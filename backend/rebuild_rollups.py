@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Rebuild the sales_rollups table from orders
+
+Rollups are maintained incrementally by checkout, status and payment
+transactions; run this after bulk data fixes or to repair drift.
+"""
+
+import asyncio
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import init_db, async_session
+from app.services.analytics_service import AnalyticsService
+
+
+async def rebuild():
+    await init_db()
+    async with async_session() as session:
+        await AnalyticsService(session).rebuild()
+    print("Sales rollups rebuilt")
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Reconcile payments against orders
+
+Streams orders and payments in key order as a merge-join and writes one
+NDJSON line per issue (missing, duplicate, mismatched or orphaned payments)
+followed by a summary line. Memory use does not grow with table size.
+
+Usage:
+    python reconcile_payments.py                       # report to stdout
+    python reconcile_payments.py --output report.ndjson --scope hot
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import init_db, async_session
+from app.services.reconciliation_service import SCOPES, ReconciliationService
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reconcile payments against orders")
+    parser.add_argument("--output", default="-", help="Report file (default: stdout)")
+    parser.add_argument("--scope", choices=list(SCOPES), default=None, help="Only hot or archived tables")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows fetched per query")
+    return parser.parse_args()
+
+
+async def reconcile(args) -> int:
+    await init_db()
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        async with async_session() as session:
+            service = ReconciliationService(session, args.batch_size)
+            async for issue in service.run([args.scope] if args.scope else None):
+                out.write(json.dumps(issue) + "\n")
+            out.write(json.dumps({"summary": service.summary}) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    summary = service.summary
+    print(
+        f"Checked {summary['orders_checked']} orders and {summary['payments_checked']} payments; "
+        f"{sum(summary['issues'].values())} issues",
+        file=sys.stderr,
+    )
+    return sum(summary["issues"].values())
+
+
+if __name__ == "__main__":
+    issues = asyncio.run(reconcile(parse_args()))
+    sys.exit(1 if issues else 0)